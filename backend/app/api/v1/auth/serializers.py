@@ -0,0 +1,15 @@
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+
+
+class TypedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Adds the user type and username to the token claims, so WebSocket
+    handshakes can build the scope user without loading it.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["user_type"] = "agent"
+        token["username"] = user.username
+        return token
@@ -1,6 +1,8 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import BasePermission
 from rest_framework.request import Request
+from apps.groups.access import get_bot_by_token
 from apps.groups.models import BotModel
 
 
@@ -9,9 +11,13 @@ class BotTokenAuthentication(BaseAuthentication):
         token = request.headers.get("X-Bot-Token")
         if not token:
             return None
-        try:
-            bot = BotModel.objects.get(secret_key=token)
-        except BotModel.DoesNotExist:
+        bot = get_bot_by_token(token)
+        if bot is None:
             raise AuthenticationFailed("Invalid bot token")
 
         return bot, None
+
+
+class IsBot(BasePermission):
+    def has_permission(self, request: Request, view):
+        return isinstance(request.user, BotModel)
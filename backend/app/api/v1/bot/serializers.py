@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import serializers
 
 
@@ -10,3 +11,37 @@ class CreateRequestInputSerializer(serializers.Serializer):
 class CreateRequestOutputSerializer(serializers.Serializer):
     telegram_id = serializers.IntegerField()
     chat_id = serializers.UUIDField()
+
+
+class SendMessageItemSerializer(serializers.Serializer):
+    # A chat id, or a telegram id resolved to the client's open chat
+    chat_id = serializers.UUIDField(required=False)
+    telegram_id = serializers.IntegerField(required=False)
+    text = serializers.CharField()
+
+    def validate(self, attrs):
+        if not attrs.get("chat_id") and attrs.get("telegram_id") is None:
+            raise serializers.ValidationError(
+                "Either chat_id or telegram_id is required")
+        return attrs
+
+
+class SendMessageInputSerializer(serializers.Serializer):
+    messages = SendMessageItemSerializer(
+        many=True, allow_empty=False, max_length=settings.BOT_SEND_MAX_BATCH
+    )
+
+
+class SentMessageSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    chat_id = serializers.UUIDField()
+
+
+class SendMessageErrorSerializer(serializers.Serializer):
+    index = serializers.IntegerField()
+    error = serializers.CharField()
+
+
+class SendMessageOutputSerializer(serializers.Serializer):
+    messages = SentMessageSerializer(many=True)
+    errors = SendMessageErrorSerializer(many=True)
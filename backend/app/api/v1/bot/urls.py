@@ -3,5 +3,7 @@ import api.v1.bot.views as views
 
 urlpatterns = [
     path('create-request/', views.CreateRequestView.as_view(),
-         name="create-request/")
+         name="create-request/"),
+    path('send-message/', views.SendMessageView.as_view(),
+         name="send-message/"),
 ]
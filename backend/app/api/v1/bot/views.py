@@ -1,19 +1,24 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from rest_framework.permissions import IsAuthenticated
 
-from apps.groups.models import RequestModel, BotModel
+from apps.groups.models import MessageModel, RequestModel
+from apps.groups.unread import count_messages
 from apps.users.models import UserModel
 from apps.clients.models import ClientModel
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from rest_framework.generics import GenericAPIView
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework import status
 import api.v1.bot.serializers as local_serializers
-from .auth import BotTokenAuthentication
+from api.v1.chats.consumers import message_event
+from .auth import BotTokenAuthentication, IsBot
 
 
 class CreateRequestView(GenericAPIView):
     authentication_classes = [BotTokenAuthentication]
+    permission_classes = [IsBot]
     input_serializer_class = local_serializers.CreateRequestInputSerializer
     output_serializer_class = local_serializers.CreateRequestOutputSerializer
     model = RequestModel
@@ -21,21 +26,17 @@ class CreateRequestView(GenericAPIView):
     def post(self, request: Request) -> Response:
         input_ser = self.input_serializer_class(data=request.data)
         input_ser.is_valid(raise_exception=True)
-        bot_id = request.user.id
+        # Authenticated (and cached) by BotTokenAuthentication
+        bot = request.user
         telegram_id = input_ser.validated_data.get("telegram_id")
         theme = input_ser.validated_data.get("theme")
         name = input_ser.validated_data.get("name")
 
-        bot = get_object_or_404(BotModel, id=bot_id)
-
-        try:
-            user = ClientModel.objects.get(telegram_id=telegram_id)
-        except ClientModel.DoesNotExist:
-            user = ClientModel.objects.create(telegram_id=telegram_id,
+        with transaction.atomic():
+            user = ClientModel.objects.upsert(telegram_id=str(telegram_id),
                                               name=name)
-
-        request = self.model.objects.create(client_id=user.id,
-                                            theme=theme, bot_id=bot.id)
+            request = self.model.objects.create(client_id=user.id,
+                                                theme=theme, bot_id=bot.id)
 
         output_data = {
             "chat_id": request.id,
@@ -45,3 +46,96 @@ class CreateRequestView(GenericAPIView):
         output_ser = self.output_serializer_class(output_data)
 
         return Response(output_ser.data, status=status.HTTP_201_CREATED)
+
+
+class SendMessageView(GenericAPIView):
+    """
+    Client messages of many chats in one request: stored with a single
+    bulk insert and fanned out to the chats' sockets in one pass.
+    Items whose chat can't be resolved are reported in "errors".
+    """
+    authentication_classes = [BotTokenAuthentication]
+    permission_classes = [IsBot]
+    input_serializer_class = local_serializers.SendMessageInputSerializer
+    output_serializer_class = local_serializers.SendMessageOutputSerializer
+    model = MessageModel
+
+    def post(self, request: Request) -> Response:
+        input_ser = self.input_serializer_class(data=request.data)
+        input_ser.is_valid(raise_exception=True)
+        bot = request.user
+        items = input_ser.validated_data.get("messages")
+
+        by_chat, by_telegram = self.get_chats(bot, items)
+        messages, sent, errors = [], [], []
+        for index, item in enumerate(items):
+            if item.get("chat_id"):
+                chat = by_chat.get(item["chat_id"])
+            else:
+                chat = by_telegram.get(item["telegram_id"])
+            if chat is None:
+                errors.append({"index": index, "error": "Chat not found"})
+                continue
+            chat_id, client_id = chat
+            messages.append(self.model(request_id=chat_id, user_id=client_id,
+                                       text=item.get("text")))
+            sent.append({"id": messages[-1].id, "chat_id": chat_id})
+
+        if not messages:
+            output_ser = self.output_serializer_class(
+                {"messages": [], "errors": errors})
+            return Response(output_ser.data,
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            self.model.objects.bulk_create(messages)
+            # Separate callbacks, a failed fan-out must not lose the counts
+            transaction.on_commit(lambda: self.fan_out(bot.id, messages),
+                                  robust=True)
+            transaction.on_commit(
+                lambda: count_messages([(message.request_id, message.user_id)
+                                        for message in messages]),
+                robust=True)
+
+        output_ser = self.output_serializer_class(
+            {"messages": sent, "errors": errors})
+        return Response(output_ser.data, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def get_chats(bot, items) -> tuple[dict, dict]:
+        """(chat_id, client_id) of the batch's chats, by chat and telegram id."""
+        chat_ids = {item["chat_id"] for item in items if item.get("chat_id")}
+        telegram_ids = {str(item["telegram_id"]) for item in items
+                        if not item.get("chat_id")}
+        by_chat, by_telegram = {}, {}
+        if chat_ids:
+            rows = (RequestModel.objects
+                    .filter(id__in=chat_ids, bot_id=bot.id, is_solved=False)
+                    .values_list('id', 'client_id'))
+            by_chat = {chat_id: (chat_id, client_id)
+                       for chat_id, client_id in rows}
+        if telegram_ids:
+            # Newest open chat of each client, like the bot's own lookup
+            rows = (RequestModel.objects
+                    .filter(bot_id=bot.id, is_solved=False,
+                            client__telegram_id__in=telegram_ids)
+                    .order_by('-created')
+                    .values_list('id', 'client_id', 'client__telegram_id'))
+            for chat_id, client_id, telegram_id in rows:
+                by_telegram.setdefault(int(telegram_id), (chat_id, client_id))
+        return by_chat, by_telegram
+
+    @staticmethod
+    def fan_out(bot_id, messages):
+        channel_layer = get_channel_layer()
+
+        async def send_all():
+            for message in messages:
+                # Like post_message: the chat sockets and, through the bot's
+                # group, the inboxes of its agents
+                event = message_event(message.request_id, message, "client")
+                await channel_layer.group_send(f"chat_{message.request_id}",
+                                               event)
+                await channel_layer.group_send(f"bot_{bot_id}", event)
+
+        async_to_sync(send_all)()
@@ -1,24 +1,109 @@
 import json
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
 
 from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from apps.groups.models import MessageModel, RequestModel, GroupModel
+from django.conf import settings
+from apps.groups.access import (get_agent_bot_ids, get_chat_bot_id,
+                                has_chat_access)
+from apps.groups.models import MessageModel, RequestModel
+from apps.groups.unread import count_messages
+from .presence import presence_tracker
+from .writer import message_writer, receipt_writer
+
+
+def message_event(chat_id, message: MessageModel, user_type: str) -> dict:
+    """Channel layer event of a new chat message."""
+    return {
+        'type': 'chat_message',
+        'chat_id': str(chat_id),
+        'message': {
+            'id': str(message.id),
+            'user_id': str(message.user_id),
+            'user_type': user_type,
+            'text': message.text,
+            'sended': str(message.sended)
+        }
+    }
+
+
+async def post_message(channel_layer, chat_id: str, bot_id, user_id,
+                       user_type: str, text: str) -> MessageModel:
+    """
+    Persist a chat message and fan it out to the chat's sockets and to the
+    multiplexed socket of the chat's bot.
+    """
+    if settings.CHAT_WRITE_BEHIND:
+        # Id and timestamp are assigned here, the row is written later
+        message = MessageModel(
+            request_id=chat_id,
+            user_id=user_id,
+            text=text,
+        )
+    else:
+        message = await MessageModel.objects.acreate(
+            request_id=chat_id,
+            user_id=user_id,
+            text=text,
+        )
+
+    event = message_event(chat_id, message, user_type)
+    await channel_layer.group_send(f"chat_{chat_id}", event)
+    if bot_id:
+        await channel_layer.group_send(f"bot_{bot_id}", event)
+    if settings.CHAT_WRITE_BEHIND:
+        # Only waits when the buffer is full, see MessageWriter.add
+        await message_writer.add(message)
+    # A Redis round trip once the access cache is warm, it does not need
+    # to queue behind the ORM calls on the shared thread
+    await sync_to_async(count_messages, thread_sensitive=False)(
+        [(chat_id, user_id)])
+    return message
+
+
+def normalize_chat_id(chat_id) -> str | None:
+    try:
+        return str(uuid.UUID(str(chat_id)))
+    except ValueError:
+        return None
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Socket of one chat. Frames from the client are typed by "action":
+      {"action": "message", "text": ...}  (the default without an action)
+      {"action": "typing"}
+      {"action": "read", "message_id": ...}
+    Only messages are stored. Typing and read events go straight through
+    the channel layer to the chat's other agent sockets; read receipts are
+    coalesced by receipt_writer into one marker per (user, chat).
+    """
+    # Sended of messages pushed to this socket, so receipts need no lookup
+    RECENT_MESSAGES = 256
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.chat_id = None
+        self.bot_id = None
         self.group_name = None
         self.user = None
+        self.presence = None
+        self.recent: OrderedDict[str, datetime] = OrderedDict()
+        self.typing_sent = 0.0
 
     async def connect(self):
-        self.chat_id = self.scope['url_route']['kwargs']['chat_id']
+        self.chat_id = normalize_chat_id(
+            self.scope['url_route']['kwargs']['chat_id'])
         self.group_name = f"chat_{self.chat_id}"
         self.user = self.scope.get("user")
-        if not await self.has_access():
+        if not self.chat_id or not await self.has_access():
             await self.close(code=4003)
             return
+        self.bot_id = await sync_to_async(get_chat_bot_id)(self.chat_id)
 
         await self.channel_layer.group_add(
             self.group_name,
@@ -26,50 +111,293 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        # Client sockets are opened by the bot on behalf of its users
+        if self.user.type == "agent":
+            self.presence = ("agent", self.user.id)
+        elif self.bot_id:
+            self.presence = ("bot", self.bot_id)
+        if self.presence:
+            presence_tracker.connect(*self.presence)
 
     async def disconnect(self, code):
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
         )
+        if self.presence:
+            presence_tracker.disconnect(*self.presence)
 
     async def receive(self, text_data=None, bytes_data=None):
-        data = json.loads(text_data)
-        text = data.get('text')
+        try:
+            data = json.loads(text_data)
+        except (TypeError, json.JSONDecodeError):
+            return
         user = self.scope['user']
-        if not text or not user:
+        if not isinstance(data, dict) or not user:
             return
-        message = await MessageModel.objects.acreate(
-            request_id=self.chat_id,
-            user_id=user.id,
-            text=text,
-        )
+        if self.presence:
+            presence_tracker.touch(*self.presence)
+        action = data.get('action', "message")
+        if action == "message":
+            text = data.get('text')
+            if text:
+                await post_message(self.channel_layer, self.chat_id,
+                                   self.bot_id, user.id, user.type, text)
+        elif action == "typing":
+            await self.send_typing(user)
+        elif action == "read":
+            await self.send_read(user, normalize_chat_id(
+                data.get('message_id')))
 
-        await self.channel_layer.group_send(
-            f"chat_{self.chat_id}",
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': str(message.id),
-                    'user_id': str(user.id),
-                    'user_type': user.type,
-                    'text': message.text,
-                    'sended': str(message.sended)
-                }
-            }
-        )
+    async def send_typing(self, user):
+        # Clients may send a frame per keystroke
+        now = time.monotonic()
+        if now - self.typing_sent < settings.CHAT_TYPING_INTERVAL:
+            return
+        self.typing_sent = now
+        await self.channel_layer.group_send(self.group_name, {
+            'type': 'chat_typing',
+            'chat_id': self.chat_id,
+            'user_id': str(user.id),
+            'user_type': user.type,
+            'sender': self.channel_name,
+        })
+
+    async def send_read(self, user, message_id: str | None):
+        if not message_id:
+            return
+        receipt_writer.add(user.id, self.chat_id, message_id,
+                           self.recent.get(message_id))
+        await self.channel_layer.group_send(self.group_name, {
+            'type': 'chat_read',
+            'chat_id': self.chat_id,
+            'user_id': str(user.id),
+            'message_id': message_id,
+            'sender': self.channel_name,
+        })
 
     async def chat_message(self, event):
         message = event['message']
+        self.recent[message['id']] = datetime.fromisoformat(message['sended'])
+        if len(self.recent) > self.RECENT_MESSAGES:
+            self.recent.popitem(last=False)
         await self.send(text_data=json.dumps(message))
 
+    async def chat_solved(self, event):
+        # Only the bot's per-chat socket cares, agents see it in the chat
+        if self.user and self.user.type == "client":
+            await self.send(text_data=json.dumps(
+                {"action": "solved", "chat_id": event['chat_id']}))
+
+    async def chat_typing(self, event):
+        if self.wants_event(event):
+            await self.send(text_data=json.dumps({
+                "action": "typing",
+                "chat_id": event['chat_id'],
+                "user_id": event['user_id'],
+                "user_type": event['user_type'],
+            }))
+
+    async def chat_read(self, event):
+        if self.wants_event(event):
+            await self.send(text_data=json.dumps({
+                "action": "read",
+                "chat_id": event['chat_id'],
+                "user_id": event['user_id'],
+                "message_id": event['message_id'],
+            }))
+
+    def wants_event(self, event) -> bool:
+        # Typing and receipts are for agents; the bot's per-chat sockets
+        # have no use for them. Nobody gets their own events back.
+        return (self.user is not None and self.user.type == "agent"
+                and event['sender'] != self.channel_name)
+
     @sync_to_async
     def has_access(self):
-        if self.user and self.user.type == "agent":
-            bot = RequestModel.objects.get(id=self.chat_id).bot
-            return GroupModel.objects.filter(
-                bots__id=bot.id,
-                agents__id=self.user.id
-            ).exists()
-        elif self.user.type == "client":
-            return RequestModel.objects.filter(id=self.chat_id, client_id=self.user.id).exists()
+        return has_chat_access(self.user, self.chat_id)
+
+
+class BotConsumer(AsyncWebsocketConsumer):
+    """
+    One socket per bot process, multiplexing all chats of the bot.
+    Frames are JSON objects tagged with chat ids:
+      {"action": "subscribe" | "unsubscribe", "chat_ids": [...]}
+      {"action": "message", "chat_id": ..., "text": ...}
+    Messages of subscribed chats are pushed with their "chat_id", solved
+    chats as {"action": "solved", "chat_id": ...}.
+    The socket joins a single channel group per bot, not one per chat.
+    """
+    MAX_SUBSCRIBE = 1000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bot = None
+        self.group_name = None
+        self.chats: dict[str, uuid.UUID] = {}  # chat_id -> client_id
+
+    async def connect(self):
+        self.bot = self.scope.get("bot")
+        if not self.bot:
+            await self.close(code=4003)
+            return
+        self.group_name = f"bot_{self.bot.id}"
+
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+
+        await self.accept()
+        presence_tracker.connect("bot", self.bot.id)
+
+    async def disconnect(self, code):
+        if self.group_name:
+            await self.channel_layer.group_discard(
+                self.group_name,
+                self.channel_name
+            )
+            presence_tracker.disconnect("bot", self.bot.id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data)
+        except (TypeError, json.JSONDecodeError):
+            return
+        # A malformed frame must not take down the socket of every chat
+        if not isinstance(data, dict):
+            return
+        presence_tracker.touch("bot", self.bot.id)
+        action = data.get('action')
+        chat_ids = data.get('chat_ids') or []
+        if action in ("subscribe", "unsubscribe") and not isinstance(
+                chat_ids, list):
+            await self.send_json({"action": "error",
+                                  "error": "chat_ids must be a list"})
+            return
+        if action == "subscribe":
+            chats = await self.get_bot_chats(chat_ids[:self.MAX_SUBSCRIBE])
+            self.chats.update(chats)
+            await self.send_json({"action": "subscribed",
+                                  "chat_ids": list(chats)})
+        elif action == "unsubscribe":
+            for chat_id in chat_ids:
+                self.chats.pop(normalize_chat_id(chat_id), None)
+        elif action == "message":
+            chat_id = normalize_chat_id(data.get('chat_id'))
+            text = data.get('text')
+            if chat_id not in self.chats:
+                await self.send_json({"action": "error", "chat_id": chat_id,
+                                      "error": "Not subscribed"})
+                return
+            if text:
+                await post_message(self.channel_layer, chat_id, self.bot.id,
+                                   self.chats[chat_id], "client", text)
+
+    async def chat_message(self, event):
+        # Client messages are the bot's own, sent over this socket or REST
+        if event['message']['user_type'] == "client":
+            return
+        if event.get('chat_id') in self.chats:
+            await self.send_json({"chat_id": event['chat_id'],
+                                  **event['message']})
+
+    async def chat_solved(self, event):
+        if self.chats.pop(event['chat_id'], None):
+            await self.send_json({"action": "solved",
+                                  "chat_id": event['chat_id']})
+
+    async def chat_created(self, event):
+        # The bot created the chat itself
+        pass
+
+    async def send_json(self, data: dict):
+        await self.send(text_data=json.dumps(data))
+
+    @database_sync_to_async
+    def get_bot_chats(self, chat_ids: list) -> dict:
+        """Chats among chat_ids that belong to this bot, with their client."""
+        chat_ids = [chat_id for chat_id in map(normalize_chat_id, chat_ids)
+                    if chat_id]
+        return {
+            str(chat_id): client_id
+            for chat_id, client_id in (
+                RequestModel.objects
+                .filter(id__in=chat_ids, bot_id=self.bot.id)
+                .values_list('id', 'client_id')
+            )
+        }
+
+
+class InboxConsumer(AsyncWebsocketConsumer):
+    """
+    One socket per agent for all chats of all their groups, instead of a
+    ChatConsumer per chat. It joins the bot_<id> group of every bot in the
+    agent's groups (chat events are already sent there for BotConsumer)
+    plus inbox_<agent_id>, through which membership changes ask it to
+    recompute the bots. Pushes:
+      {"action": "message", "chat_id": ..., <message fields>}
+      {"action": "created", "chat": {...}}
+      {"action": "solved", "chat_id": ...}
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = None
+        self.inbox_group = None
+        self.bot_ids: set[str] = set()
+
+    async def connect(self):
+        self.user = self.scope.get("user")
+        if not self.user or self.user.type != "agent":
+            await self.close(code=4003)
+            return
+        self.inbox_group = f"inbox_{self.user.id}"
+        await self.channel_layer.group_add(self.inbox_group,
+                                           self.channel_name)
+        await self.refresh_bots()
+        await self.accept()
+        presence_tracker.connect("agent", self.user.id)
+
+    async def disconnect(self, code):
+        if not self.inbox_group:
+            return
+        await self.channel_layer.group_discard(self.inbox_group,
+                                               self.channel_name)
+        for bot_id in self.bot_ids:
+            await self.channel_layer.group_discard(f"bot_{bot_id}",
+                                                   self.channel_name)
+        presence_tracker.disconnect("agent", self.user.id)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Messages are sent over the chat sockets, this one only listens
+        presence_tracker.touch("agent", self.user.id)
+
+    async def refresh_bots(self):
+        bot_ids = await database_sync_to_async(get_agent_bot_ids)(
+            self.user.id)
+        for bot_id in bot_ids - self.bot_ids:
+            await self.channel_layer.group_add(f"bot_{bot_id}",
+                                               self.channel_name)
+        for bot_id in self.bot_ids - bot_ids:
+            await self.channel_layer.group_discard(f"bot_{bot_id}",
+                                                   self.channel_name)
+        self.bot_ids = bot_ids
+
+    async def inbox_refresh(self, event):
+        await self.refresh_bots()
+
+    async def chat_message(self, event):
+        await self.send_json({"action": "message",
+                              "chat_id": event['chat_id'],
+                              **event['message']})
+
+    async def chat_created(self, event):
+        await self.send_json({"action": "created", "chat": event['chat']})
+
+    async def chat_solved(self, event):
+        await self.send_json({"action": "solved",
+                              "chat_id": event['chat_id']})
+
+    async def send_json(self, data: dict):
+        await self.send(text_data=json.dumps(data))
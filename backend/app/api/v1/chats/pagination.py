@@ -0,0 +1,81 @@
+import base64
+import json
+
+from django.db.models import Q
+
+BEFORE = "before"
+AFTER = "after"
+
+
+def encode_cursor(direction: str, values: list, scope=None) -> str:
+    """Pack a keyset position into an opaque url-safe string."""
+    payload = {
+        "d": direction,
+        "v": [v.isoformat() if hasattr(v, "isoformat") else str(v)
+              for v in values],
+        "s": str(scope) if scope is not None else None,
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> dict:
+    """Unpack a cursor made by encode_cursor(). Raises ValueError."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+    if (not isinstance(data, dict) or data.get("d") not in (BEFORE, AFTER)
+            or not isinstance(data.get("v"), list)):
+        raise ValueError("Invalid cursor")
+    return data
+
+
+def keyset_filter(fields: list, values: list, direction: str) -> Q:
+    """
+    Rows strictly older (BEFORE) or newer (AFTER) than the given key.
+    The leading lte/gte bound keeps the condition usable as an index range.
+    """
+    first, last = fields
+    first_value, last_value = values
+    op = "lt" if direction == BEFORE else "gt"
+    return (
+        Q(**{f"{first}__{op}e": first_value})
+        & (Q(**{f"{first}__{op}": first_value})
+           | Q(**{f"{first}": first_value, f"{last}__{op}": last_value}))
+    )
+
+
+def row_key(row, fields: list) -> list:
+    if isinstance(row, dict):
+        return [row[field] for field in fields]
+    return [getattr(row, field) for field in fields]
+
+
+def paginate(qs, fields: list, page_size: int, cursor: dict | None = None,
+             scope=None):
+    """
+    Keyset page of qs ordered by fields, newest first.
+    Returns (rows, next, prev): next points to older rows, prev to newer.
+    """
+    direction = cursor["d"] if cursor else BEFORE
+    if cursor:
+        qs = qs.filter(keyset_filter(fields, cursor["v"], direction))
+    if direction == BEFORE:
+        qs = qs.order_by(*[f"-{field}" for field in fields])
+    else:
+        qs = qs.order_by(*fields)
+
+    rows = list(qs[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == AFTER:
+        rows.reverse()
+
+    has_older = has_more if direction == BEFORE else cursor is not None
+    has_newer = has_more if direction == AFTER else cursor is not None
+    next_cursor = prev_cursor = None
+    if rows and has_older:
+        next_cursor = encode_cursor(BEFORE, row_key(rows[-1], fields), scope)
+    if rows and has_newer:
+        prev_cursor = encode_cursor(AFTER, row_key(rows[0], fields), scope)
+    return rows, next_cursor, prev_cursor
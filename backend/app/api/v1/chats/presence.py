@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+from redis.exceptions import RedisError
+
+from apps.groups.presence import get_presence_store, write_last_online
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """
+    Heartbeats of agents and bots with open sockets (one per process).
+    Sockets only update local state; every interval seconds the ids with an
+    open socket or fresh activity are sent to the presence store in one
+    round trip. A process that dies stops reporting, so its users go
+    offline after PRESENCE_TIMEOUT without any cleanup.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._sockets: Counter[tuple[str, str]] = Counter()
+        self._beats: dict[tuple[str, str], float] = {}
+        self._task: asyncio.Task | None = None
+        self._written = time.monotonic()
+
+    def connect(self, kind: str, obj_id) -> None:
+        self._sockets[(kind, str(obj_id))] += 1
+        self.touch(kind, obj_id)
+
+    def disconnect(self, kind: str, obj_id) -> None:
+        key = (kind, str(obj_id))
+        self._sockets[key] -= 1
+        if self._sockets[key] <= 0:
+            del self._sockets[key]
+        self.touch(kind, obj_id)
+
+    def touch(self, kind: str, obj_id) -> None:
+        self._beats[(kind, str(obj_id))] = time.time()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        # The first report goes out right away, so users appear online as
+        # soon as they connect
+        while self._sockets or self._beats:
+            await self.report()
+            await asyncio.sleep(self.interval)
+        await self._write_local(force=True)
+
+    async def report(self) -> None:
+        now = time.time()
+        beats, self._beats = self._beats, {}
+        beats.update(dict.fromkeys(self._sockets, now))
+        if not beats:
+            return
+        try:
+            await sync_to_async(get_presence_store().record,
+                                thread_sensitive=False)(beats)
+        except RedisError as exc:
+            # Open sockets are reported again next interval
+            logger.warning(f"Presence report failed: {exc!r}")
+        await self._write_local()
+
+    async def _write_local(self, force: bool = False) -> None:
+        # Without Redis nobody else sees the state, write last_online here
+        if not get_presence_store().local:
+            return
+        if (not force and time.monotonic() - self._written
+                < settings.PRESENCE_FLUSH_INTERVAL):
+            return
+        self._written = time.monotonic()
+        try:
+            await sync_to_async(write_last_online)()
+        except DatabaseError as exc:
+            logger.warning(f"last_online write failed: {exc!r}")
+
+
+presence_tracker = PresenceTracker(interval=settings.PRESENCE_INTERVAL)
@@ -1,22 +1,56 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from api.v1.chats.pagination import decode_cursor
+
+
+# Keyset pagination
+class PageInputSerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False, allow_null=True)
+    page_size = serializers.IntegerField(
+        min_value=1, max_value=settings.CHATS_MAX_PAGE_SIZE,
+        default=settings.CHATS_PAGE_SIZE
+    )
+
+    def validate_cursor(self, value):
+        if not value:
+            return None
+        try:
+            return decode_cursor(value)
+        except ValueError as exc:
+            raise serializers.ValidationError(str(exc))
+
 
 # GetChats serializers
 class ChatSerializer(serializers.Serializer):
     id = serializers.UUIDField()
     theme = serializers.CharField()
     last_msg = serializers.CharField()
+    unread = serializers.IntegerField(allow_null=True)
+
+
+class GroupSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    name = serializers.CharField()
+    unread = serializers.IntegerField(allow_null=True)
+
+
+class ChatListInputSerializer(PageInputSerializer):
+    group_id = serializers.UUIDField()
 
 
 class ChatListSerializer(serializers.Serializer):
     bot_name = serializers.CharField()
     chats = ChatSerializer(many=True)
+    next = serializers.CharField(allow_null=True)
+    prev = serializers.CharField(allow_null=True)
 
 
 # GetMessages serializer
-class ChatMessagesInputSerializer(serializers.Serializer):
+class ChatMessagesInputSerializer(PageInputSerializer):
     chat_id = serializers.UUIDField()
     message_id = serializers.UUIDField(required=False, allow_null=True)
+    after_message_id = serializers.UUIDField(required=False, allow_null=True)
     include_info = serializers.BooleanField(default=False)
 
 
@@ -40,3 +74,5 @@ class ChatInfoSerializer(serializers.Serializer):
 class MessagesListSerializer(serializers.Serializer):
     chat_info = ChatInfoSerializer(required=False)
     messages = MessageOutputSerializer(many=True)
+    next = serializers.CharField(allow_null=True)
+    prev = serializers.CharField(allow_null=True)
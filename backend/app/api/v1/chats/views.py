@@ -1,47 +1,105 @@
+from collections import defaultdict
+
+from django.db.models import F, OuterRef, Subquery, TextField, Value, Window
+from django.db.models.functions import Coalesce, RowNumber
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.request import Request
 from rest_framework.generics import GenericAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
+
+from redis.exceptions import RedisError
 
 from apps.groups.models import RequestModel, BotModel, GroupModel, MessageModel
+from apps.groups.unread import get_unread_store
 
 import api.v1.chats.serializers as local_serializers
-from api.v1.settings.serializers import ObjectSerializer
+from api.v1.bot.auth import BotTokenAuthentication, IsBot
+from api.v1.chats.pagination import (AFTER, BEFORE, encode_cursor, paginate,
+                                     row_key)
+
+
+def get_unread(agent_id, name: str, ids: list[str]) -> dict[str, int]:
+    """Unread counters of the agent's chats or groups, {} without Redis."""
+    try:
+        return get_unread_store().get(agent_id, name, ids)
+    except RedisError:
+        return {}
 
 
 # Get stats
 class ChatListView(GenericAPIView):
     permission_classes = [IsAuthenticated]
+    input_serializer_class = local_serializers.ChatListInputSerializer
     serializer_class = local_serializers.ChatListSerializer
     model = GroupModel
+    page_fields = ['created', 'id']
 
     def post(self, request: Request):
-        group_id = request.data.get("group_id")
-        if not group_id:
-            return Response({"error": "group_id is missing or invalid"})
+        input_ser = self.input_serializer_class(data=request.data)
+        input_ser.is_valid(raise_exception=True)
+        group_id = input_ser.validated_data.get("group_id")
+        cursor = input_ser.validated_data.get("cursor")
+        page_size = input_ser.validated_data.get("page_size")
         try:
             group = self.model.objects.get(id=group_id, agents__id=request.user.id)
         except self.model.DoesNotExist:
             return Response({'error': "Model doesn't exist"},
                             status=404)
 
-        bot_list = group.bots.all()
-        requests = RequestModel.objects.filter(bot__in=bot_list)
+        bot_list = list(group.bots.all())
+        # Last message text is resolved in the same query as the chats,
+        # so the list costs a fixed number of queries per group.
+        last_msg = (
+            MessageModel.objects
+            .filter(request_id=OuterRef('pk'))
+            .order_by('-sended', '-id')
+            .values('text')[:1]
+        )
+        requests = (
+            RequestModel.objects
+            .annotate(last_msg=Coalesce(Subquery(last_msg),
+                                        Value("No messages"),
+                                        output_field=TextField()))
+            .values('id', 'theme', 'bot_id', 'created', 'last_msg')
+        )
+
+        if cursor:
+            # Next pages are fetched per bot, the bot is kept in the cursor
+            bot_list = [item for item in bot_list
+                        if str(item.id) == cursor.get("s")]
+            if not bot_list:
+                return Response({'error': "Invalid cursor"}, status=400)
+            bot = bot_list[0]
+            chats, next_cursor, prev_cursor = paginate(
+                requests.filter(bot_id=bot.id), self.page_fields,
+                page_size, cursor, scope=bot.id
+            )
+            pages = {bot.id: (chats, next_cursor, prev_cursor)}
+        else:
+            pages = self.get_first_pages(requests, bot_list, page_size)
+
+        # Maintained counters: one HMGET for the whole page
+        unread = get_unread(request.user.id, "chats", [
+            str(chat['id']) for chats, _, _ in pages.values()
+            for chat in chats
+        ])
         payload = [
             {
                 "bot_name": item.name,
                 "chats": [
                     {
-                        "id": chat.id,
-                        "theme": chat.theme,
-                        "last_msg": (MessageModel.objects.filter(
-                            request_id=chat.id).order_by('-sended').first(
-                        ) or MessageModel(text="No messages")).text
+                        "id": chat['id'],
+                        "theme": chat['theme'],
+                        "last_msg": chat['last_msg'],
+                        "unread": unread.get(str(chat['id'])),
                     }
-                    for chat in requests.filter(bot_id=item.id)
-                ]
+                    for chat in pages[item.id][0]
+                ],
+                "next": pages[item.id][1],
+                "prev": pages[item.id][2],
             } for item in bot_list
         ]
 
@@ -49,18 +107,53 @@ class ChatListView(GenericAPIView):
         serializer.is_valid(raise_exception=True)
         return Response(serializer.data, status=200)
 
+    def get_first_pages(self, requests, bot_list, page_size):
+        """
+        First page of every bot in a single query: chats are numbered per
+        bot and everything past page_size + 1 is cut off by the database.
+        """
+        ordering = [f"-{field}" for field in self.page_fields]
+        rows = (
+            requests
+            .filter(bot__in=bot_list)
+            .annotate(position=Window(RowNumber(),
+                                      partition_by=[F('bot_id')],
+                                      order_by=ordering))
+            .filter(position__lte=page_size + 1)
+            .order_by('bot_id', *ordering)
+        )
+        chats = defaultdict(list)
+        for chat in rows:
+            chats[chat['bot_id']].append(chat)
+
+        pages = {}
+        for item in bot_list:
+            bot_chats = chats[item.id]
+            next_cursor = None
+            if len(bot_chats) > page_size:
+                bot_chats = bot_chats[:page_size]
+                next_cursor = encode_cursor(
+                    BEFORE, row_key(bot_chats[-1], self.page_fields),
+                    scope=item.id
+                )
+            pages[item.id] = (bot_chats, next_cursor, None)
+        return pages
+
 
 class GroupListView(GenericAPIView):
     permission_classes = [IsAuthenticated]
-    serializer_class = ObjectSerializer
+    serializer_class = local_serializers.GroupSerializer
     model = GroupModel
 
     def get(self, request: Request):
-        qs = self.model.objects.filter(agents__id=request.user.id)
+        qs = list(self.model.objects.filter(agents__id=request.user.id))
+        unread = get_unread(request.user.id, "groups",
+                            [str(item.id) for item in qs])
         payload = [
             {
                 "name": item.name,
                 "id": item.id,
+                "unread": unread.get(str(item.id)),
             }
             for item in qs
         ]
@@ -70,26 +163,50 @@ class GroupListView(GenericAPIView):
 
 
 class ChatMessageList(GenericAPIView):
-    permission_classes = [IsAuthenticated]
+    # Bots read their own chats to catch up on messages missed while offline
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES,
+                              BotTokenAuthentication]
+    permission_classes = [IsBot | IsAuthenticated]
     input_serializer_class = local_serializers.ChatMessagesInputSerializer
     output_serializer_class = local_serializers.MessagesListSerializer
     model = MessageModel
+    page_fields = ['sended', 'id']
 
     def post(self, request):
         input_ser = self.input_serializer_class(data=request.data)
         input_ser.is_valid(raise_exception=True)
         chat_id = input_ser.validated_data.get("chat_id")
         message_id = input_ser.validated_data.get("message_id")
+        after_message_id = input_ser.validated_data.get("after_message_id")
         include_info = input_ser.validated_data.get("include_info")
+        cursor = input_ser.validated_data.get("cursor")
+        page_size = input_ser.validated_data.get("page_size")
 
-        qs = self.model.objects.filter(request_id=chat_id).order_by(
-            "-sended")
-
-        if message_id:
-            last_msg = get_object_or_404(self.model, id=message_id)
-            qs = qs.filter(sended__lt=last_msg.sended)
-
-        messages = list(qs[:100])
+        if isinstance(request.user, BotModel) and not RequestModel.objects.filter(
+                id=chat_id, bot_id=request.user.id).exists():
+            return Response({'error': "Model doesn't exist"},
+                            status=status.HTTP_404_NOT_FOUND)
+        if cursor and cursor.get("s") != str(chat_id):
+            return Response({'error': "Invalid cursor"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        anchor_id = message_id or after_message_id
+        if anchor_id and not cursor:
+            # message_id: page older than it, after_message_id: newer
+            anchor = get_object_or_404(
+                self.model.objects.filter(request_id=chat_id),
+                id=anchor_id
+            )
+            cursor = {"d": BEFORE if message_id else AFTER,
+                      "v": [anchor.sended, anchor.id]}
+
+        qs = (
+            self.model.objects
+            .filter(request_id=chat_id)
+            .select_related('user')
+        )
+        messages, next_cursor, prev_cursor = paginate(
+            qs, self.page_fields, page_size, cursor, scope=chat_id
+        )
         messages_qs = list(reversed(messages))
 
         chat_info = None
@@ -106,7 +223,9 @@ class ChatMessageList(GenericAPIView):
 
         output_data = {
             "chat_info": chat_info,
-            "messages": messages_qs
+            "messages": messages_qs,
+            "next": next_cursor,
+            "prev": prev_cursor,
         }
 
         output_ser = self.output_serializer_class(output_data)
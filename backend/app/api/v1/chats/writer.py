@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError
+
+from apps.groups.models import MessageModel, ReadMarkerModel
+from apps.groups.unread import refresh_unread
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """
+    Write-behind buffer for chat messages (one per process).
+    Messages are queued in arrival order and written with bulk_create by a
+    background task once batch_size is reached or interval seconds after
+    the first queued one, so senders never wait for the database.
+    Batches are written strictly one after another, so order is kept.
+    At max_buffer queued messages senders wait for the running flush, and
+    if the database is still failing their message is written directly.
+    """
+
+    def __init__(self, batch_size: int, interval: float, retries: int,
+                 max_buffer: int):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retries = retries
+        self.max_buffer = max_buffer
+        self._buffer: list[MessageModel] = []
+        self._lock: asyncio.Lock | None = None
+        self._timer: asyncio.Task | None = None
+        self._flusher: asyncio.Task | None = None
+
+    async def add(self, message: MessageModel) -> None:
+        if len(self._buffer) >= self.max_buffer:
+            # Back-pressure: the database is behind or down
+            await self.flush()
+            if len(self._buffer) >= self.max_buffer:
+                # Errors reach the sender instead of growing the buffer
+                await message.asave(force_insert=True)
+                return
+        self._buffer.append(message)
+        if len(self._buffer) >= self.batch_size:
+            if self._flusher is None or self._flusher.done():
+                self._flusher = asyncio.create_task(self.flush())
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while self._buffer:
+                batch = self._buffer[:self.batch_size]
+                del self._buffer[:len(batch)]
+                if not await self._write(batch):
+                    # Keep the batch at the head of the queue, the next
+                    # flush picks it up before anything newer.
+                    self._buffer[:0] = batch
+                    if self._timer is None or self._timer.done():
+                        self._timer = asyncio.create_task(
+                            self._flush_later())
+                    return
+
+    async def _write(self, batch: list[MessageModel]) -> bool:
+        for attempt in range(self.retries):
+            try:
+                await MessageModel.objects.abulk_create(batch)
+                return True
+            except IntegrityError:
+                # A bad row (e.g. its chat was deleted) must not block the
+                # rest of the batch: fall back to row by row inserts.
+                await self._write_each(batch)
+                return True
+            except DatabaseError as exc:
+                logger.warning(f"Message flush failed (attempt "
+                               f"{attempt + 1}/{self.retries}): {exc!r}")
+                await asyncio.sleep(min(0.1 * 2 ** attempt, 5))
+        logger.error(f"Message flush of {len(batch)} messages postponed")
+        return False
+
+    async def _write_each(self, batch: list[MessageModel]) -> None:
+        for message in batch:
+            try:
+                await message.asave(force_insert=True)
+            except DatabaseError as exc:
+                logger.error(f"Message {message.id} dropped: {exc!r}")
+
+
+message_writer = MessageWriter(
+    batch_size=settings.CHAT_WRITE_BEHIND_BATCH_SIZE,
+    interval=settings.CHAT_WRITE_BEHIND_INTERVAL,
+    retries=settings.CHAT_WRITE_BEHIND_RETRIES,
+    max_buffer=settings.CHAT_WRITE_BEHIND_MAX_BUFFER,
+)
+
+
+async def flush_message_writer() -> None:
+    """Write the messages buffered in this process, if write-behind is on."""
+    if settings.CHAT_WRITE_BEHIND:
+        await message_writer.flush()
+
+
+class ReceiptWriter:
+    """
+    Coalescing buffer for read receipts (one per process).
+    Only the newest receipt per (user, chat) is kept, and all of them are
+    upserted in one statement interval seconds after the first one
+    arrived. Receipts come with the read message's sended when the socket
+    has seen it; the others are resolved in one query at flush time.
+    Advanced markers reset the unread counters of their chats.
+    A crash loses at most one interval of receipts, clients simply send
+    them again on their next read.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        # (user_id, chat_id) -> (message_id, sended or None)
+        self._markers: dict[tuple[str, str], tuple[str, datetime | None]] = {}
+        self._lock: asyncio.Lock | None = None
+        self._timer: asyncio.Task | None = None
+
+    def add(self, user_id, chat_id, message_id,
+            sended: datetime | None = None) -> None:
+        key = (str(user_id), str(chat_id))
+        current = self._markers.get(key)
+        if current and current[1] and sended and sended <= current[1]:
+            return
+        self._markers[key] = (str(message_id), sended)
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.interval)
+        await self.flush()
+
+    async def flush(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._markers:
+                return
+            markers, self._markers = self._markers, {}
+            if settings.CHAT_WRITE_BEHIND:
+                # Receipts may point at messages still in the buffer
+                await message_writer.flush()
+            try:
+                await self._write(markers)
+            except DatabaseError as exc:
+                logger.warning(f"Read receipts flush failed: {exc!r}")
+                for key, marker in markers.items():
+                    self._markers.setdefault(key, marker)
+                if self._timer is None or self._timer.done():
+                    self._timer = asyncio.create_task(self._flush_later())
+
+    async def _write(self, markers: dict) -> None:
+        unknown = [message_id for message_id, sended in markers.values()
+                   if sended is None]
+        if unknown:
+            found = {
+                str(message_id): (str(chat_id), sended)
+                async for message_id, chat_id, sended in
+                MessageModel.objects.filter(id__in=unknown)
+                .values_list('id', 'request_id', 'sended')
+            }
+            resolved = {}
+            for (user_id, chat_id), (message_id, sended) in markers.items():
+                if sended is None:
+                    # Unknown ids or messages of another chat are dropped
+                    message_chat_id, sended = found.get(message_id,
+                                                        (None, None))
+                    if message_chat_id != chat_id:
+                        continue
+                resolved[(user_id, chat_id)] = (message_id, sended)
+            markers = resolved
+        if not markers:
+            return
+
+        # Markers only move forward
+        existing = {
+            (str(user_id), str(chat_id)): last_read_at
+            async for user_id, chat_id, last_read_at in
+            ReadMarkerModel.objects.filter(
+                user_id__in={user_id for user_id, _ in markers},
+                request_id__in={chat_id for _, chat_id in markers},
+            ).values_list('user_id', 'request_id', 'last_read_at')
+        }
+        rows = [
+            ReadMarkerModel(user_id=user_id, request_id=chat_id,
+                            last_read_message_id=message_id,
+                            last_read_at=sended)
+            for (user_id, chat_id), (message_id, sended) in markers.items()
+            if (user_id, chat_id) not in existing
+            or sended > existing[(user_id, chat_id)]
+        ]
+        if rows:
+            await ReadMarkerModel.objects.abulk_create(
+                rows, update_conflicts=True,
+                unique_fields=['user', 'request'],
+                update_fields=['last_read_message_id', 'last_read_at'],
+            )
+            await sync_to_async(refresh_unread)(
+                [(row.user_id, row.request_id) for row in rows])
+
+
+receipt_writer = ReceiptWriter(interval=settings.CHAT_READ_FLUSH_INTERVAL)
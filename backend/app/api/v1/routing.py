@@ -1,8 +1,11 @@
 from channels.routing import URLRouter
 from django.urls import path, include
 
+from api.v1.chats.consumers import BotConsumer, InboxConsumer
 from api.v1.chats.routing import ws_urlpatterns
 
 ws_urlpatterns = [
     path("chat/", URLRouter(ws_urlpatterns)),
+    path("bot/", BotConsumer.as_asgi()),
+    path("inbox/", InboxConsumer.as_asgi()),
 ]
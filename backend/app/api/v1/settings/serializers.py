@@ -46,8 +46,17 @@ class BotInfoSerializer(InfoSerializer):
     security_key = serializers.UUIDField()
 
 
+class LeaderboardEntrySerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    name = serializers.CharField()
+    surname = serializers.CharField()
+    username = serializers.CharField()
+    solved_count = serializers.IntegerField()
+
+
 class BotStatsSerializer(StatsSerializer):
-    most_active_agent = serializers.CharField()
+    most_active_agent = serializers.CharField(allow_null=True)
+    leaderboard = LeaderboardEntrySerializer(many=True)
 
 
 class BotStatsResponseSerializer(StatsResponseSerializer):
@@ -70,3 +79,13 @@ class ObjectSerializer(serializers.Serializer):
     id = serializers.UUIDField()
     name = serializers.CharField()
 
+
+# Presence serializers
+class AgentPresenceSerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    online = serializers.BooleanField()
+    last_seen = serializers.DateTimeField(allow_null=True)
+
+
+class GroupPresenceSerializer(serializers.Serializer):
+    agents = AgentPresenceSerializer(many=True)
@@ -9,4 +9,6 @@ urlpatterns = [
     path('get-bot-list/', views.BotListView.as_view(), name='get-bot-list'),
     path('get-agent-list/', views.AgentListView.as_view(),
          name='get-agent-list'),
+    path('get-group-presence/', views.GroupPresenceView.as_view(),
+         name='get-group-presence'),
 ]
@@ -1,16 +1,19 @@
+import time
 import uuid
 
-from django.db.models.functions import TruncDay, TruncDate
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 from rest_framework.request import Request
-from django.utils import timezone
-from datetime import timedelta
-from django.db.models import Avg, Min, Max, Count
+from django.db.models import Min, Max, Count, Sum
 from rest_framework.permissions import IsAuthenticated
+from redis.exceptions import RedisError
 
-from apps.groups.models import RequestModel, BotModel, GroupModel
+from apps.groups.access import get_group_agent_ids
+from apps.groups.models import (RequestModel, BotModel, GroupModel,
+                                DailyStatsModel)
+from apps.groups.presence import get_presence_store, is_online, to_datetime
 from apps.agents.models import AgentModel
+from apps.users.authentication import CachedJWTAuthentication
 import api.v1.settings.serializers as local_serializers
 
 
@@ -21,6 +24,7 @@ class StatsView(GenericAPIView):
     """
     model = None
     permission_classes = [IsAuthenticated]
+    leaderboard_size = 5
 
     def post(self, request: Request, *args, **kwargs):
         """
@@ -47,47 +51,39 @@ class StatsView(GenericAPIView):
             "id": obj.id,
             **extra_info
         }
-        # Stats part
-        now = timezone.now()
-        month_ago = now - timedelta(days=30)
-        aggs = qs.aggregate(
-            avg_rating=Avg('rate', default=0),
-            highest_rate=Max('rate', defailt=0),
-            lowest_rate=Min('rate', default=0),
-            requests_per_month=Count("*")
-        )
-        daily = (
-            qs
-            .annotate(day=TruncDay('created'))
+        # Stats part, read from the daily rollup: O(days) rows
+        daily = list(
+            self.get_rollups_for_obj(obj)
             .values('day')
             .annotate(
-                avg_rating=Avg('rate'),
-                count=Count('id')
+                count=Sum('count'),
+                rate_sum=Sum('rate_sum'),
+                rate_count=Sum('rate_count'),
+                min_rate=Min('min_rate'),
+                max_rate=Max('max_rate'),
             )
             .order_by('day')
         )
+        rate_sum = sum(d['rate_sum'] for d in daily)
+        rate_count = sum(d['rate_count'] for d in daily)
+        rates = [d for d in daily if d['rate_count']]
         rating_graph = [
             {'date': d['day'].strftime('%d.%m'),
-             'value': round(d['avg_rating'] or 0, 2)}
+             'value': round(d['rate_sum'] / d['rate_count'], 2)
+             if d['rate_count'] else 0}
             for d in daily
         ]
         requests_graph = [
             {'date': d['day'].strftime('%d.%m'), 'value': d['count']}
             for d in daily
         ]
-        online_days = (
-            qs.annotate(solved_date=TruncDate('created'))
-            .values('solved_date')
-            .distinct()
-            .count()
-        )
         extra_stats = self.get_extra_stats(obj, qs)
         stats = {
-            "avg_rating": round(aggs['avg_rating'] or 0, 2),
-            "highest_rate": aggs['highest_rate'] or 0,
-            "lowest_rate": aggs['lowest_rate'] or 0,
-            "requests_per_month": aggs['requests_per_month'],
-            "online_days": {online_days},
+            "avg_rating": round(rate_sum / rate_count, 2) if rate_count else 0,
+            "highest_rate": max((d['max_rate'] for d in rates), default=0),
+            "lowest_rate": min((d['min_rate'] for d in rates), default=0),
+            "requests_per_month": sum(d['count'] for d in daily),
+            "online_days": len(daily),
             "rating_graph": rating_graph,
             "requests_graph": requests_graph,
             **extra_stats,
@@ -104,6 +100,13 @@ class StatsView(GenericAPIView):
         """
         raise NotImplementedError("You must implement get_qs_for_obj()")
 
+    def get_rollups_for_obj(self, obj):
+        """
+        This should be overridden in children.
+        Returns the DailyStatsModel rows associated with the object
+        """
+        raise NotImplementedError("You must implement get_rollups_for_obj()")
+
     def get_extra_info(self, obj, qs):
 
         return {}
@@ -112,6 +115,38 @@ class StatsView(GenericAPIView):
 
         return {}
 
+    def get_agents_stats(self, qs):
+        """
+        Most active agent and top agents leaderboard within qs.
+        Grouped by agent in one query, names are joined in.
+        """
+        leaderboard = [
+            {
+                "id": row['solved_by'],
+                "name": row['solved_by__name'],
+                "surname": row['solved_by__surname'],
+                "username": row['solved_by__username'],
+                "solved_count": row['solved_count'],
+            }
+            for row in (
+                qs.filter(is_solved=True, solved_by__isnull=False)
+                .values('solved_by', 'solved_by__name',
+                        'solved_by__surname', 'solved_by__username')
+                .annotate(solved_count=Count('id'))
+                .order_by('-solved_count', 'solved_by')
+                [:self.leaderboard_size]
+            )
+        ]
+        most_active_agent = None
+        if leaderboard:
+            agent = leaderboard[0]
+            most_active_agent = (f"{agent['name']}, {agent['surname']} "
+                                 f"({agent['username']})")
+        return {
+            "most_active_agent": most_active_agent,
+            "leaderboard": leaderboard,
+        }
+
 
 class AgentInfoView(StatsView):
     model = AgentModel
@@ -120,17 +155,21 @@ class AgentInfoView(StatsView):
     def get_queryset_for_obj(self, obj):
         return RequestModel.objects.filter(solved_by=obj)
 
-    def get_extra_info(self, obj, qs):
-        return {"last_online": obj.last_online}
+    def get_rollups_for_obj(self, obj):
+        return DailyStatsModel.objects.filter(scope_type='agent',
+                                              scope_id=obj.id)
 
-    def get_extra_stats(self, obj, qs):
-        online_days = (
-            qs.annotate(solved_date=TruncDate('created'))
-            .values('solved_date')
-            .distinct()
-            .count()
-        )
-        return {"online_days": online_days}
+    def get_extra_info(self, obj, qs):
+        # The column lags behind by up to PRESENCE_FLUSH_INTERVAL
+        last_online = obj.last_online
+        try:
+            seen = to_datetime(get_presence_store().last_seen(
+                'agent', [str(obj.id)])[str(obj.id)])
+        except RedisError:
+            seen = None
+        if seen and (last_online is None or seen > last_online):
+            last_online = seen
+        return {"last_online": last_online}
 
 
 class BotInfoView(StatsView):
@@ -140,6 +179,10 @@ class BotInfoView(StatsView):
     def get_queryset_for_obj(self, obj):
         return RequestModel.objects.filter(bot=obj)
 
+    def get_rollups_for_obj(self, obj):
+        return DailyStatsModel.objects.filter(scope_type='bot',
+                                              scope_id=obj.id)
+
     def get_extra_info(self, obj: BotModel, qs):
         added = (
             obj.created
@@ -148,25 +191,7 @@ class BotInfoView(StatsView):
         return {"added": added, "security_key": security_key}
 
     def get_extra_stats(self, obj, qs):
-        agent = (
-            RequestModel.objects
-            .filter(is_solved=True)
-            .annotate(solved_count=Count('solved_by'))
-            .order_by('-solved_count')
-            .first()
-        )
-        online_days = (
-            qs.annotate(solved_date=TruncDate('created'))
-            .values('solved_date')
-            .distinct()
-            .count()
-        )
-        extra_stats = {
-            "online_days": online_days,
-            "most_active_agent": f"{agent.solved_by.name}, {agent.solved_by.surname} ("
-                                 f"{agent.solved_by.username})"
-        }
-        return extra_stats
+        return self.get_agents_stats(qs)
 
 
 class GroupInfoView(StatsView):
@@ -176,30 +201,20 @@ class GroupInfoView(StatsView):
     def get_queryset_for_obj(self, obj):
         return RequestModel.objects.filter(bot__groups=obj)
 
+    def get_rollups_for_obj(self, obj):
+        # Group stats are the sum of its bots' rows, so they stay correct
+        # when bots are added to or removed from the group.
+        return DailyStatsModel.objects.filter(
+            scope_type='bot',
+            scope_id__in=obj.bots.values('id')
+        )
+
     def get_extra_info(self, obj, qs):
         created = obj.created
         return {"created": created}
 
     def get_extra_stats(self, obj, qs):
-        agent = (
-            RequestModel.objects
-            .filter(is_solved=True)
-            .annotate(solved_count=Count('solved_by'))
-            .order_by('-solved_count')
-            .first()
-        )
-        online_days = (
-            qs.annotate(solved_date=TruncDate('created'))
-            .values('solved_date')
-            .distinct()
-            .count()
-        )
-        extra_stats = {
-            "online_days": online_days,
-            "most_active_agent": f"{agent.solved_by.name}, {agent.solved_by.surname} ("
-                                 f"{agent.solved_by.username})"
-        }
-        return extra_stats
+        return self.get_agents_stats(qs)
 
 
 # / Get stats
@@ -243,3 +258,44 @@ class AgentListView(ObjectView):
     name = "agents"
 
 # / Get objects
+
+
+# Presence
+class GroupPresenceView(GenericAPIView):
+    """
+    Live online state of a group's agents. Served from the presence store
+    and the cached member list: the user comes from the token claims and
+    the cached revocation check, so a warm request does not touch the
+    database.
+    """
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = local_serializers.GroupPresenceSerializer
+
+    def post(self, request: Request):
+        try:
+            group_id = uuid.UUID(str(request.data.get("id")))
+        except ValueError:
+            return Response({"error": "Invalid or missing id"},
+                            status=400)
+
+        agent_ids = get_group_agent_ids(group_id)
+        if str(request.user.id) not in agent_ids:
+            return Response({"error": "Group not found"},
+                            status=404)
+        try:
+            last_seen = get_presence_store().last_seen('agent', agent_ids)
+        except RedisError:
+            return Response({"error": "Presence is unavailable"},
+                            status=503)
+        now = time.time()
+        agents = [
+            {
+                "id": agent_id,
+                "online": is_online(seen, now),
+                "last_seen": to_datetime(seen),
+            }
+            for agent_id, seen in last_seen.items()
+        ]
+        serializer = self.get_serializer({"agents": agents})
+        return Response(serializer.data, status=200)
@@ -0,0 +1,47 @@
+import uuid
+
+from django.db import connections, models
+
+from apps.users.models import UserModel
+
+
+class ClientManager(models.Manager):
+
+    def upsert(self, telegram_id: str, name: str):
+        """
+        Create the client or refresh its name, in two statements:
+        INSERT ... ON CONFLICT (telegram_id) DO UPDATE ... RETURNING id,
+        then the matching UserModel row (skipped if it already exists).
+        Concurrent calls for one telegram_id end up with the same client.
+        Should be called inside a transaction.
+        """
+        connection = connections[self.db]
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        fields = [opts.pk, opts.get_field("name"),
+                  opts.get_field("telegram_id")]
+        values = [uuid.uuid4(), name, telegram_id]
+        # bulk_create(update_conflicts=True) keeps the client-side uuid of
+        # an existing row, so the id is returned explicitly here.
+        sql = (
+            f"INSERT INTO {qn(opts.db_table)} "
+            f"({', '.join(qn(field.column) for field in fields)}) "
+            f"VALUES (%s, %s, %s) "
+            f"ON CONFLICT ({qn(fields[2].column)}) DO UPDATE "
+            f"SET {qn(fields[1].column)} = EXCLUDED.{qn(fields[1].column)} "
+            f"RETURNING {qn(opts.pk.column)}"
+        )
+        params = [field.get_db_prep_value(value, connection)
+                  for field, value in zip(fields, values)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            client_id = opts.pk.to_python(cursor.fetchone()[0])
+
+        UserModel.objects.using(self.db).bulk_create(
+            [UserModel(id=client_id, username=telegram_id, type="client")],
+            ignore_conflicts=True,
+        )
+        client = self.model(id=client_id, name=name, telegram_id=telegram_id)
+        client._state.adding = False
+        client._state.db = self.db
+        return client
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-17 17:25
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=128)),
+                ('telegram_id', models.CharField(max_length=32, unique=True)),
+            ],
+        ),
+    ]
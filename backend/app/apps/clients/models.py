@@ -1,6 +1,7 @@
 from django.db import models
 import uuid
 
+from apps.clients.manager import ClientManager
 from apps.users.models import UserModel
 
 
@@ -11,6 +12,8 @@ class ClientModel(models.Model):
     telegram_id = models.CharField(max_length=32, blank=False, null=False,
                                    unique=True)
 
+    objects = ClientManager()
+
     def save(self, *args, **kwargs):
         is_new = not ClientModel.objects.filter(pk=self.pk).exists()
         super().save(*args, **kwargs)
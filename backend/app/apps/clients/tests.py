@@ -1,3 +1,75 @@
-from django.test import TestCase
+import threading
 
-# Create your tests here.
+from django.db import connection
+from django.test import (TransactionTestCase, override_settings,
+                         skipUnlessDBFeature)
+from rest_framework.test import APIClient
+
+from apps.clients.models import ClientModel
+from apps.groups.models import BotModel, RequestModel
+from apps.users.models import UserModel
+from config.celery import app as celery_app
+
+
+@skipUnlessDBFeature("test_db_allows_multiple_connections")
+@override_settings(
+    SHARED_CACHE=False,
+    CHANNEL_LAYERS={
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+    },
+)
+class CreateRequestConcurrencyTest(TransactionTestCase):
+    """
+    The first requests of a new client often arrive together (double
+    taps, bot retries). They must all succeed and share one client.
+    """
+    url = "/api/v1/bot/create-request/"
+    threads = 8
+
+    def setUp(self):
+        # Stats refreshes run inline instead of going to the broker
+        self.addCleanup(setattr, celery_app.conf, "task_always_eager",
+                        celery_app.conf.task_always_eager)
+        celery_app.conf.task_always_eager = True
+        self.bot = BotModel.objects.create(name="Bot")
+
+    def create_requests(self, telegram_id: int) -> list:
+        barrier = threading.Barrier(self.threads)
+        responses = [None] * self.threads
+
+        def create(index):
+            api = APIClient()
+            api.credentials(HTTP_X_BOT_TOKEN=str(self.bot.secret_key))
+            try:
+                barrier.wait()
+                responses[index] = api.post(self.url, {
+                    "telegram_id": telegram_id,
+                    "name": f"Client {index}",
+                    "theme": "Request",
+                }, format="json")
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=create, args=(index,))
+                   for index in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return responses
+
+    def test_parallel_first_requests_share_one_client(self):
+        responses = self.create_requests(telegram_id=42)
+
+        self.assertEqual([response.status_code for response in responses],
+                         [201] * self.threads)
+        client = ClientModel.objects.get(telegram_id="42")
+        self.assertTrue(UserModel.objects.filter(id=client.id,
+                                                 type="client").exists())
+        self.assertEqual(
+            RequestModel.objects.filter(client=client, bot=self.bot).count(),
+            self.threads)
+        self.assertEqual(
+            {str(response.data["chat_id"]) for response in responses},
+            {str(pk) for pk in RequestModel.objects.values_list('pk',
+                                                                flat=True)})
@@ -0,0 +1,244 @@
+import hashlib
+import uuid
+from itertools import product
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+
+from apps.groups.models import BotModel, GroupModel, RequestModel
+from config.cache import TieredCache
+
+access_cache = TieredCache(
+    "chat-access",
+    timeout=settings.CHAT_ACCESS_CACHE_TTL,
+    local_timeout=settings.CHAT_ACCESS_LOCAL_CACHE_TTL,
+)
+
+bot_token_cache = TieredCache(
+    "bot-token",
+    timeout=settings.BOT_TOKEN_CACHE_TTL,
+    local_timeout=settings.BOT_TOKEN_LOCAL_CACHE_TTL,
+)
+
+
+def chat_bot_key(chat_id) -> str:
+    return access_cache.key("chat", chat_id, "bot")
+
+
+def agent_bot_key(agent_id, bot_id) -> str:
+    return access_cache.key("agent", agent_id, "bot", bot_id)
+
+
+def client_chat_key(client_id, chat_id) -> str:
+    return access_cache.key("client", client_id, "chat", chat_id)
+
+
+def has_chat_access(user, chat_id) -> bool:
+    """
+    Whether the user may join the chat.
+    Agents get access through the groups of the chat's bot, clients only to
+    their own chats. Decisions are cached per (agent, bot) and per
+    (client, chat); the chat's bot never changes, so it is cached as well.
+    """
+    if not user:
+        return False
+    try:
+        if user.type == "agent":
+            return agent_has_access(user.id, chat_id)
+        if user.type == "client":
+            return access_cache.get_or_set(
+                client_chat_key(user.id, chat_id),
+                lambda: RequestModel.objects.filter(
+                    id=chat_id, client_id=user.id
+                ).exists()
+            )
+    except ValidationError:
+        # Malformed chat id
+        return False
+    return False
+
+
+def get_chat_bot_id(chat_id):
+    """Bot of the chat, or None. A chat never changes bots."""
+    try:
+        return access_cache.get_or_set(
+            chat_bot_key(chat_id),
+            lambda: RequestModel.objects.filter(id=chat_id)
+            .values_list('bot_id', flat=True).first()
+        )
+    except ValidationError:
+        return None
+
+
+def agent_has_access(agent_id, chat_id) -> bool:
+    bot_id = access_cache.get(chat_bot_key(chat_id))
+    if bot_id is not None:
+        allowed = access_cache.get(agent_bot_key(agent_id, bot_id))
+        if allowed is not None:
+            return allowed
+
+    # One joined query resolves both the chat's bot and the membership
+    chat = (
+        RequestModel.objects
+        .filter(id=chat_id)
+        .annotate(allowed=Exists(GroupModel.objects.filter(
+            bots=OuterRef('bot_id'),
+            agents=agent_id
+        )))
+        .values('bot_id', 'allowed')
+        .first()
+    )
+    if chat is None:
+        return False
+    access_cache.set(chat_bot_key(chat_id), chat['bot_id'])
+    access_cache.set(agent_bot_key(agent_id, chat['bot_id']), chat['allowed'])
+    return chat['allowed']
+
+
+def group_agents_key(group_id) -> str:
+    return access_cache.key("group", group_id, "agents")
+
+
+def get_group_agent_ids(group_id) -> list[str]:
+    """Ids of the group's agents, cached until its membership changes."""
+    return access_cache.get_or_set(
+        group_agents_key(group_id),
+        lambda: [str(agent_id) for agent_id in
+                 GroupModel.agents.through.objects.filter(
+                     groupmodel_id=group_id
+                 ).values_list('agentmodel_id', flat=True)]
+    )
+
+
+def get_agent_bot_ids(agent_id) -> set[str]:
+    """Bots of all groups of the agent, i.e. whose chats the agent sees."""
+    return {str(bot_id) for bot_id in GroupModel.bots.through.objects.filter(
+        groupmodel__agents=agent_id
+    ).values_list('botmodel_id', flat=True)}
+
+
+def bot_groups_key(bot_id) -> str:
+    return access_cache.key("bot", bot_id, "groups")
+
+
+def get_bot_group_ids(bot_id) -> list[str]:
+    """Ids of the groups the bot is in, cached until membership changes."""
+    return access_cache.get_or_set(
+        bot_groups_key(bot_id),
+        lambda: [str(group_id) for group_id in
+                 GroupModel.bots.through.objects.filter(
+                     botmodel_id=bot_id
+                 ).values_list('groupmodel_id', flat=True)]
+    )
+
+
+def invalidate_groups_access(group_ids, agent_ids=None, bot_ids=None):
+    """
+    Drop cached (agent, bot) decisions touched by a membership change of
+    the given groups, and the cached member lists of the groups and bots.
+    Missing agent or bot ids are taken from the groups.
+    """
+    group_ids = list(group_ids)
+    if agent_ids is None:
+        agent_ids = GroupModel.agents.through.objects.filter(
+            groupmodel_id__in=group_ids
+        ).values_list('agentmodel_id', flat=True)
+    if bot_ids is None:
+        bot_ids = GroupModel.bots.through.objects.filter(
+            groupmodel_id__in=group_ids
+        ).values_list('botmodel_id', flat=True)
+    keys = [agent_bot_key(agent_id, bot_id)
+            for agent_id, bot_id in product(set(agent_ids), set(bot_ids))]
+    keys += [group_agents_key(group_id) for group_id in group_ids]
+    keys += [bot_groups_key(bot_id) for bot_id in set(bot_ids)]
+    # Deleted again after commit so a concurrent miss can't re-cache the
+    # old decision in between.
+    access_cache.delete(*keys)
+    transaction.on_commit(lambda: access_cache.delete(*keys))
+
+
+def bot_token_key(secret_key) -> str:
+    # Hashed, so cache keys don't expose bot secrets
+    return bot_token_cache.key(
+        hashlib.sha256(str(secret_key).encode()).hexdigest()
+    )
+
+
+def get_bot_by_token(token: str) -> BotModel | None:
+    """
+    Bot owning the secret key, or None.
+    Unknown keys are cached as well (for a shorter time), so repeated bad
+    tokens don't reach the database.
+    """
+    try:
+        secret_key = uuid.UUID(token)
+    except (TypeError, ValueError):
+        return None
+    key = bot_token_key(secret_key)
+    bot = bot_token_cache.get(key)
+    if bot is None:
+        bot = BotModel.objects.filter(secret_key=secret_key).first() or False
+        bot_token_cache.set(
+            key, bot,
+            None if bot else settings.BOT_TOKEN_NEGATIVE_CACHE_TTL
+        )
+    return bot or None
+
+
+def chat_credentials_key(chat_id) -> str:
+    return access_cache.key("chat", chat_id, "credentials")
+
+
+def bot_secret_key(bot_id) -> str:
+    return bot_token_cache.key("bot", bot_id, "secret")
+
+
+def get_local_chat_credentials(chat_id) -> dict | None:
+    """get_chat_credentials() from the local cache only, never blocks."""
+    chat = access_cache.get_local(chat_credentials_key(chat_id))
+    if chat is None:
+        return None
+    secret_key = bot_token_cache.get_local(bot_secret_key(chat['bot_id']))
+    if secret_key is None:
+        return None
+    return {**chat, 'secret_key': secret_key}
+
+
+def get_chat_credentials(chat_id) -> dict | None:
+    """
+    Client, telegram id, bot and bot secret of a chat, to check per-chat
+    secure keys. The chat part never changes and is cached per chat; the
+    secret is cached per bot and dropped when the bot's key rotates.
+    A cold miss costs one joined query.
+    """
+    try:
+        chat = access_cache.get(chat_credentials_key(chat_id))
+        if chat is not None:
+            secret_key = bot_token_cache.get(bot_secret_key(chat['bot_id']))
+            if secret_key is None:
+                secret_key = (BotModel.objects.filter(id=chat['bot_id'])
+                              .values_list('secret_key', flat=True).first())
+                if secret_key is None:
+                    return None
+                bot_token_cache.set(bot_secret_key(chat['bot_id']), secret_key)
+            return {**chat, 'secret_key': secret_key}
+
+        row = (
+            RequestModel.objects
+            .filter(id=chat_id)
+            .values('client_id', 'bot_id',
+                    telegram_id=F('client__telegram_id'),
+                    secret_key=F('bot__secret_key'))
+            .first()
+        )
+    except ValidationError:
+        # Malformed chat id
+        return None
+    if row is None:
+        return None
+    secret_key = row.pop('secret_key')
+    access_cache.set(chat_credentials_key(chat_id), row)
+    bot_token_cache.set(bot_secret_key(row['bot_id']), secret_key)
+    return {**row, 'secret_key': secret_key}
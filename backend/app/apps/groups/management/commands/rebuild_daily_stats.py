@@ -0,0 +1,42 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+from apps.groups.models import DailyStatsModel, RequestModel
+from apps.groups.tasks import SCOPE_FIELDS
+
+
+class Command(BaseCommand):
+    # Manual repair only: migration 0007 fills the rollup once and the
+    # refresh_daily_stats task keeps it current
+    help = 'Rebuild the daily stats rollup from all requests'
+
+    def handle(self, *args, **kwargs):
+        with transaction.atomic():
+            DailyStatsModel.objects.all().delete()
+            for scope_type, field in SCOPE_FIELDS.items():
+                rows = (
+                    RequestModel.objects
+                    .filter(**{f"{field}__isnull": False})
+                    .annotate(day=TruncDate('created'))
+                    .values(field, 'day')
+                    .annotate(
+                        count=Count('id'),
+                        rate_sum=Sum('rate', default=0),
+                        rate_count=Count('rate'),
+                        min_rate=Min('rate'),
+                        max_rate=Max('rate'),
+                    )
+                    .order_by()
+                )
+                DailyStatsModel.objects.bulk_create(
+                    [
+                        DailyStatsModel(scope_type=scope_type,
+                                        scope_id=row.pop(field), **row)
+                        for row in rows
+                    ],
+                    batch_size=1000
+                )
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ {scope_type} rollups were rebuilt"))
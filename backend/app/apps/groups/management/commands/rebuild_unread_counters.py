@@ -0,0 +1,41 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from apps.groups.models import UnreadCounterModel
+from apps.groups.unread import (compute_unread, get_unread_store,
+                                load_snapshot)
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the unread counters from messages and read markers, '
+            'or restore them from the last snapshot')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--from-snapshot', action='store_true',
+            help='Restore Redis from UnreadCounterModel instead of '
+                 'recomputing (e.g. after losing Redis)'
+        )
+
+    def handle(self, *args, **kwargs):
+        if kwargs['from_snapshot']:
+            chats, groups = load_snapshot()
+            get_unread_store().replace(chats, groups)
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {len(chats)} unread counters were restored"))
+            return
+
+        chats, groups = compute_unread()
+        get_unread_store().replace(chats, groups)
+        with transaction.atomic():
+            UnreadCounterModel.objects.all().delete()
+            UnreadCounterModel.objects.bulk_create(
+                [
+                    UnreadCounterModel(agent_id=agent_id, request_id=chat_id,
+                                       count=count)
+                    for (agent_id, chat_id), count in chats.items()
+                ],
+                batch_size=1000
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(chats)} unread counters were rebuilt"))
@@ -0,0 +1,66 @@
+# Generated by Django 5.2 on 2026-10-17 17:25
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('clients', '0001_initial'),
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BotModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=32)),
+                ('last_online', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('secret_key', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='GroupModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('name', models.CharField(max_length=32)),
+                ('agents', models.ManyToManyField(related_name='groups', to=settings.AUTH_USER_MODEL)),
+                ('bots', models.ManyToManyField(related_name='groups', to='groups.botmodel')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RequestModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('is_solved', models.BooleanField(default=False)),
+                ('theme', models.TextField(default='Request')),
+                ('rate', models.PositiveSmallIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator, django.core.validators.MaxValueValidator])),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='groups.botmodel')),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='clients.clientmodel')),
+                ('solved_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MessageModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('text', models.TextField()),
+                ('sended', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.usermodel')),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='groups.requestmodel')),
+            ],
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-17 17:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clients', '0001_initial'),
+        ('groups', '0001_initial'),
+        ('users', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='messagemodel',
+            index=models.Index(fields=['request', 'sended', 'id'], name='message_request_sended_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestmodel',
+            index=models.Index(fields=['bot', 'created', 'id'], name='request_bot_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestmodel',
+            index=models.Index(fields=['solved_by', 'created'], name='request_solved_by_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestmodel',
+            index=models.Index(condition=models.Q(('is_solved', False)), fields=['bot', 'created'], name='request_bot_unsolved_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='requestmodel',
+            index=models.Index(condition=models.Q(('is_solved', True)), fields=['bot', 'solved_by'], name='request_bot_solved_idx'),
+        ),
+    ]
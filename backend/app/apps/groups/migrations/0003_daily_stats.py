@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 17:26
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0002_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStatsModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('scope_type', models.CharField(choices=[('agent', 'Agent'), ('bot', 'Bot')], max_length=8)),
+                ('scope_id', models.UUIDField()),
+                ('day', models.DateField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('rate_sum', models.PositiveIntegerField(default=0)),
+                ('rate_count', models.PositiveIntegerField(default=0)),
+                ('min_rate', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('max_rate', models.PositiveSmallIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('scope_type', 'scope_id', 'day'), name='daily_stats_scope_day_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 17:28
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0003_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='messagemodel',
+            name='sended',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-17 18:00
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0004_message_sended_default'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadMarkerModel',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('last_read_message_id', models.UUIDField()),
+                ('last_read_at', models.DateTimeField()),
+                ('request', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='groups.requestmodel')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.usermodel')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'request'), name='read_marker_user_request_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+# Same as apps.groups.tasks.SCOPE_FIELDS, kept here so later changes there
+# do not alter this migration
+SCOPE_FIELDS = {
+    'agent': 'solved_by_id',
+    'bot': 'bot_id',
+}
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """
+    One-off fill of the rollup from the requests that existed before it.
+    Later changes keep it current through the refresh_daily_stats task,
+    rebuild_daily_stats repairs it by hand if needed.
+    """
+    RequestModel = apps.get_model('groups', 'RequestModel')
+    DailyStatsModel = apps.get_model('groups', 'DailyStatsModel')
+    DailyStatsModel.objects.all().delete()
+    for scope_type, field in SCOPE_FIELDS.items():
+        rows = (
+            RequestModel.objects
+            .filter(**{f"{field}__isnull": False})
+            .annotate(day=TruncDate('created'))
+            .values(field, 'day')
+            .annotate(
+                count=Count('id'),
+                rate_sum=Sum('rate', default=0),
+                rate_count=Count('rate'),
+                min_rate=Min('rate'),
+                max_rate=Max('rate'),
+            )
+            .order_by()
+        )
+        DailyStatsModel.objects.bulk_create(
+            [
+                DailyStatsModel(scope_type=scope_type,
+                                scope_id=row.pop(field), **row)
+                for row in rows
+            ],
+            batch_size=1000
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0006_unread_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_daily_stats,
+                             migrations.RunPython.noop),
+    ]
@@ -15,7 +15,31 @@ class GroupModel(models.Model):
     agents = models.ManyToManyField('agents.AgentModel', related_name='groups')
 
 
-class BotModel(models.Model):
+class TrackedFieldsMixin:
+    """
+    Keeps the TRACKED_FIELDS values an instance was loaded or last saved
+    with in _loaded, so post_save signals can tell what changed without
+    querying the old row.
+    """
+    TRACKED_FIELDS: tuple[str, ...] = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = instance.tracked_values()
+        return instance
+
+    def tracked_values(self) -> dict:
+        # Deferred fields are left out rather than loaded
+        return {field: self.__dict__[field] for field in self.TRACKED_FIELDS
+                if field in self.__dict__}
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded = self.tracked_values()
+
+
+class BotModel(TrackedFieldsMixin, models.Model):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
     name = models.CharField(max_length=32, null=False, blank=False)
     last_online = models.DateTimeField(null=False, blank=False,
@@ -24,8 +48,11 @@ class BotModel(models.Model):
     secret_key = models.UUIDField(default=uuid.uuid4, editable=False,
                                   unique=True)
 
+    # The token cache drops the old key when it changes
+    TRACKED_FIELDS = ('secret_key',)
+
 
-class RequestModel(models.Model):
+class RequestModel(TrackedFieldsMixin, models.Model):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
     client = models.ForeignKey(to='clients.ClientModel',
                                on_delete=models.CASCADE)
@@ -40,11 +67,104 @@ class RequestModel(models.Model):
     )
     created = models.DateTimeField(auto_now_add=True)
 
+    # Columns the post_save signals compare with their stored values
+    TRACKED_FIELDS = ('bot_id', 'solved_by_id', 'created', 'is_solved')
+
+    class Meta:
+        indexes = [
+            # Chat list pages and per-bot stats
+            models.Index(fields=['bot', 'created', 'id'],
+                         name='request_bot_created_idx'),
+            # Agent stats
+            models.Index(fields=['solved_by', 'created'],
+                         name='request_solved_by_created_idx'),
+            # Open requests per bot
+            models.Index(fields=['bot', 'created'],
+                         condition=models.Q(is_solved=False),
+                         name='request_bot_unsolved_idx'),
+            # Most active agent per bot
+            models.Index(fields=['bot', 'solved_by'],
+                         condition=models.Q(is_solved=True),
+                         name='request_bot_solved_idx'),
+        ]
+
 
 class MessageModel(models.Model):
     id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
     text = models.TextField(null=False, blank=False)
+    # Assigned on creation so write-behind messages keep the broadcast time
     sended = models.DateTimeField(editable=False,
-                                  auto_now_add=True)
+                                  default=timezone.now)
+    user = models.ForeignKey(to='users.UserModel', on_delete=models.CASCADE)
+    request = models.ForeignKey(to='RequestModel', on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            # Message history pages and last message of a chat
+            models.Index(fields=['request', 'sended', 'id'],
+                         name='message_request_sended_idx'),
+        ]
+
+
+class DailyStatsModel(models.Model):
+    """
+    Daily rollup of RequestModel stats for one agent or bot.
+    Rows are maintained by apps.groups.tasks.refresh_daily_stats.
+    """
+    SCOPE_CHOICES = {
+        'agent': 'Agent',
+        'bot': 'Bot'
+    }
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
+    scope_type = models.CharField(max_length=8, choices=SCOPE_CHOICES)
+    scope_id = models.UUIDField()
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+    rate_sum = models.PositiveIntegerField(default=0)
+    rate_count = models.PositiveIntegerField(default=0)
+    min_rate = models.PositiveSmallIntegerField(null=True, blank=True)
+    max_rate = models.PositiveSmallIntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope_type', 'scope_id', 'day'],
+                                    name='daily_stats_scope_day_uniq'),
+        ]
+
+
+class ReadMarkerModel(models.Model):
+    """
+    Last message a user has read in a chat, one row per (user, chat).
+    Receipts are coalesced in memory and upserted in batches by
+    api.v1.chats.writer.ReceiptWriter, never per event.
+    """
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
     user = models.ForeignKey(to='users.UserModel', on_delete=models.CASCADE)
     request = models.ForeignKey(to='RequestModel', on_delete=models.CASCADE)
+    # Not a foreign key: write-behind messages may not be stored yet
+    last_read_message_id = models.UUIDField()
+    # sended of that message, markers only move forward
+    last_read_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'request'],
+                                    name='read_marker_user_request_uniq'),
+        ]
+
+
+class UnreadCounterModel(models.Model):
+    """
+    Snapshot of the unread counters kept in Redis (apps/groups/unread.py),
+    written periodically and used to restore them after losing Redis.
+    """
+    id = models.UUIDField(default=uuid.uuid4, primary_key=True, editable=False)
+    agent = models.ForeignKey(to='agents.AgentModel', on_delete=models.CASCADE)
+    request = models.ForeignKey(to='RequestModel', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agent', 'request'],
+                                    name='unread_counter_agent_request_uniq'),
+        ]
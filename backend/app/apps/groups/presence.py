@@ -0,0 +1,147 @@
+import threading
+import time
+from datetime import datetime, timezone
+from functools import cache
+
+import redis
+from django.conf import settings
+from django.db import DatabaseError
+
+from apps.agents.models import AgentModel
+from apps.groups.models import BotModel
+
+# Kinds of users with a last_online column
+PRESENCE_MODELS = {
+    'agent': AgentModel,
+    'bot': BotModel,
+}
+
+
+class RedisPresenceStore:
+    """
+    Presence state shared by all processes. Per kind:
+      presence:<kind>:seen     sorted set, id -> last heartbeat (epoch)
+      presence:<kind>:touched  hash, id -> last heartbeat, of the ids not
+                               written to the database yet
+    """
+    local = False
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def key(kind: str, name: str) -> str:
+        return f"presence:{kind}:{name}"
+
+    def record(self, beats: dict[tuple[str, str], float]) -> None:
+        """Store heartbeats, two commands per kind in one round trip."""
+        by_kind: dict[str, dict[str, float]] = {}
+        for (kind, obj_id), seen in beats.items():
+            by_kind.setdefault(kind, {})[obj_id] = seen
+        pipe = self.client.pipeline(transaction=False)
+        for kind, seen in by_kind.items():
+            # gt: a late heartbeat of another process never moves it back
+            pipe.zadd(self.key(kind, "seen"), seen, gt=True)
+            pipe.hset(self.key(kind, "touched"), mapping=seen)
+        pipe.execute()
+
+    def last_seen(self, kind: str, ids: list[str]) -> dict[str, float | None]:
+        if not ids:
+            return {}
+        scores = self.client.zmscore(self.key(kind, "seen"), ids)
+        return dict(zip(ids, scores))
+
+    def pop_touched(self, kind: str) -> dict[str, float]:
+        """Ids touched since the last call, with their last heartbeat."""
+        pipe = self.client.pipeline()
+        pipe.hgetall(self.key(kind, "touched"))
+        pipe.delete(self.key(kind, "touched"))
+        pipe.zremrangebyscore(self.key(kind, "seen"), "-inf",
+                              time.time() - settings.PRESENCE_RETENTION)
+        touched, *_ = pipe.execute()
+        return {obj_id: float(seen) for obj_id, seen in touched.items()}
+
+    def restore_touched(self, kind: str, touched: dict[str, float]) -> None:
+        """Put back ids whose database write failed."""
+        if touched:
+            self.client.hset(self.key(kind, "touched"), mapping=touched)
+
+
+class LocalPresenceStore:
+    """
+    In-memory stand-in for RedisPresenceStore, for single process setups
+    without Redis (SHARED_CACHE=False). Only the ASGI process sees it, so
+    the tracker writes last_online itself (see PresenceTracker).
+    """
+    local = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen: dict[str, dict[str, float]] = {}
+        self._touched: dict[str, dict[str, float]] = {}
+
+    def record(self, beats: dict[tuple[str, str], float]) -> None:
+        with self._lock:
+            for (kind, obj_id), seen in beats.items():
+                kind_seen = self._seen.setdefault(kind, {})
+                kind_seen[obj_id] = max(seen, kind_seen.get(obj_id, 0))
+                self._touched.setdefault(kind, {})[obj_id] = seen
+
+    def last_seen(self, kind: str, ids: list[str]) -> dict[str, float | None]:
+        with self._lock:
+            kind_seen = self._seen.get(kind, {})
+            return {obj_id: kind_seen.get(obj_id) for obj_id in ids}
+
+    def pop_touched(self, kind: str) -> dict[str, float]:
+        with self._lock:
+            oldest = time.time() - settings.PRESENCE_RETENTION
+            kind_seen = self._seen.get(kind, {})
+            for obj_id in [i for i, s in kind_seen.items() if s < oldest]:
+                del kind_seen[obj_id]
+            return self._touched.pop(kind, {})
+
+    def restore_touched(self, kind: str, touched: dict[str, float]) -> None:
+        with self._lock:
+            self._touched.setdefault(kind, {}).update(touched)
+
+
+@cache
+def get_presence_store() -> RedisPresenceStore | LocalPresenceStore:
+    if settings.SHARED_CACHE:
+        return RedisPresenceStore(settings.PRESENCE_REDIS_URL)
+    return LocalPresenceStore()
+
+
+def is_online(seen: float | None, now: float | None = None) -> bool:
+    if seen is None:
+        return False
+    return (now or time.time()) - seen <= settings.PRESENCE_TIMEOUT
+
+
+def to_datetime(seen: float | None) -> datetime | None:
+    if seen is None:
+        return None
+    return datetime.fromtimestamp(seen, tz=timezone.utc)
+
+
+def write_last_online() -> int:
+    """
+    Write last_online of every agent and bot touched since the previous
+    call: one UPDATE per model, however many sockets reported in between.
+    Returns the number of updated rows.
+    """
+    store = get_presence_store()
+    updated = 0
+    for kind, model in PRESENCE_MODELS.items():
+        touched = store.pop_touched(kind)
+        if not touched:
+            continue
+        objs = [model(id=obj_id, last_online=to_datetime(seen))
+                for obj_id, seen in touched.items()]
+        try:
+            # On PostgreSQL a single UPDATE ... SET last_online = CASE ...
+            updated += model.objects.bulk_update(objs, ['last_online'])
+        except DatabaseError:
+            store.restore_touched(kind, touched)
+            raise
+    return updated
@@ -0,0 +1,172 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from apps.groups.access import (bot_secret_key, bot_token_cache,
+                                bot_token_key, invalidate_groups_access)
+from apps.groups.models import BotModel, GroupModel, RequestModel
+from apps.groups.tasks import refresh_daily_stats
+
+
+def get_stats_scopes(bot_id, solved_by_id, created) -> set[tuple]:
+    """Rollup rows a request with these values is counted in."""
+    if created is None:
+        return set()
+    day = timezone.localdate(created).isoformat()
+    scopes = {('bot', str(bot_id), day)}
+    if solved_by_id:
+        scopes.add(('agent', str(solved_by_id), day))
+    return scopes
+
+
+def schedule_refresh(scopes: set[tuple]) -> None:
+    def send():
+        for scope in scopes:
+            refresh_daily_stats.delay(*scope)
+
+    # A broker outage must not fail a request that is already committed,
+    # the next change or rebuild_daily_stats fixes the rollup
+    transaction.on_commit(send, robust=True)
+
+
+# Fields the rollups are computed from
+STATS_FIELDS = {'bot', 'bot_id', 'solved_by', 'solved_by_id', 'created',
+                'rate'}
+
+
+@receiver(post_save, sender=RequestModel)
+def refresh_stats_on_save(sender, instance, update_fields, **kwargs):
+    if update_fields is not None and not STATS_FIELDS & set(update_fields):
+        return
+    scopes = get_stats_scopes(instance.bot_id, instance.solved_by_id,
+                              instance.created)
+    # A reassigned request has to leave its previous rollup rows too,
+    # compared with the values it was loaded with, no extra query
+    loaded = getattr(instance, '_loaded', {})
+    if {'bot_id', 'solved_by_id', 'created'} <= loaded.keys():
+        scopes |= get_stats_scopes(loaded['bot_id'], loaded['solved_by_id'],
+                                   loaded['created'])
+    schedule_refresh(scopes)
+
+
+@receiver(post_save, sender=RequestModel)
+def notify_chat_solved(sender, instance, created, **kwargs):
+    """Tell the bot a chat was solved, so it can drop it from its index."""
+    if (created or not instance.is_solved
+            or getattr(instance, '_loaded', {}).get('is_solved')):
+        return
+    event = {'type': 'chat_solved', 'chat_id': str(instance.id)}
+
+    def send():
+        channel_layer = get_channel_layer()
+        async_to_sync(channel_layer.group_send)(f"bot_{instance.bot_id}",
+                                                event)
+        async_to_sync(channel_layer.group_send)(f"chat_{instance.id}", event)
+
+    transaction.on_commit(send, robust=True)
+
+
+@receiver(post_save, sender=RequestModel)
+def notify_chat_created(sender, instance, created, **kwargs):
+    """Push new chats to the inboxes of the bot's agents."""
+    if not created:
+        return
+    event = {
+        'type': 'chat_created',
+        'chat_id': str(instance.id),
+        'chat': {
+            'id': str(instance.id),
+            'theme': instance.theme,
+            'bot_id': str(instance.bot_id),
+            'created': str(instance.created),
+        },
+    }
+
+    def send():
+        async_to_sync(get_channel_layer().group_send)(
+            f"bot_{instance.bot_id}", event)
+
+    transaction.on_commit(send, robust=True)
+
+
+@receiver(post_delete, sender=RequestModel)
+def refresh_stats_on_delete(sender, instance, **kwargs):
+    schedule_refresh(get_stats_scopes(instance.bot_id, instance.solved_by_id,
+                                      instance.created))
+
+
+# Chat access cache
+ACCESS_ACTIONS = ("post_add", "post_remove", "pre_clear")
+
+
+def refresh_inboxes(agent_ids) -> None:
+    """Make open inbox sockets of the agents recompute their bots."""
+    agent_ids = {str(agent_id) for agent_id in agent_ids}
+    if not agent_ids:
+        return
+
+    async def send_all():
+        channel_layer = get_channel_layer()
+        for agent_id in agent_ids:
+            await channel_layer.group_send(f"inbox_{agent_id}",
+                                           {'type': 'inbox_refresh'})
+
+    transaction.on_commit(async_to_sync(send_all), robust=True)
+
+
+@receiver(m2m_changed, sender=GroupModel.agents.through)
+def invalidate_access_on_agents_change(sender, instance, action, reverse,
+                                       pk_set, **kwargs):
+    if action not in ACCESS_ACTIONS:
+        return
+    if reverse:
+        # agent.groups changed
+        group_ids = pk_set or instance.groups.values_list('pk', flat=True)
+        invalidate_groups_access(group_ids, agent_ids=[instance.pk])
+        refresh_inboxes([instance.pk])
+    else:
+        agent_ids = pk_set or instance.agents.values_list('pk', flat=True)
+        invalidate_groups_access([instance.pk], agent_ids=agent_ids)
+        refresh_inboxes(agent_ids)
+
+
+@receiver(m2m_changed, sender=GroupModel.bots.through)
+def invalidate_access_on_bots_change(sender, instance, action, reverse,
+                                     pk_set, **kwargs):
+    if action not in ACCESS_ACTIONS:
+        return
+    if reverse:
+        # bot.groups changed
+        group_ids = pk_set or instance.groups.values_list('pk', flat=True)
+        invalidate_groups_access(group_ids, bot_ids=[instance.pk])
+        refresh_inboxes(GroupModel.agents.through.objects.filter(
+            groupmodel_id__in=group_ids
+        ).values_list('agentmodel_id', flat=True))
+    else:
+        bot_ids = pk_set or instance.bots.values_list('pk', flat=True)
+        invalidate_groups_access([instance.pk], bot_ids=bot_ids)
+        refresh_inboxes(instance.agents.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=GroupModel)
+def invalidate_access_on_group_delete(sender, instance, **kwargs):
+    invalidate_groups_access([instance.pk])
+    refresh_inboxes(instance.agents.values_list('pk', flat=True))
+
+
+# Bot token cache
+@receiver(post_save, sender=BotModel)
+@receiver(post_delete, sender=BotModel)
+def invalidate_bot_token(sender, instance, **kwargs):
+    # The new key may be cached as unknown, the old one as valid
+    keys = {bot_token_key(instance.secret_key), bot_secret_key(instance.id)}
+    # The key the bot was loaded with, no extra query
+    old_secret_key = getattr(instance, '_loaded', {}).get('secret_key')
+    if old_secret_key:
+        keys.add(bot_token_key(old_secret_key))
+    bot_token_cache.delete(*keys)
+    transaction.on_commit(lambda: bot_token_cache.delete(*keys))
@@ -0,0 +1,75 @@
+from datetime import date, datetime, time, timedelta
+
+from celery import shared_task
+from django.db import OperationalError
+from django.db.models import Count, Max, Min, Sum
+from django.utils import timezone
+from redis.exceptions import RedisError
+
+from apps.groups.models import DailyStatsModel, RequestModel
+from apps.groups.presence import write_last_online
+from apps.groups.unread import snapshot_unread
+
+SCOPE_FIELDS = {
+    'agent': 'solved_by_id',
+    'bot': 'bot_id',
+}
+
+
+def day_bounds(day: date) -> tuple[datetime, datetime]:
+    """Start and end of a day, kept as a range so indexes on created apply."""
+    start = datetime.combine(day, time.min,
+                             tzinfo=timezone.get_current_timezone())
+    return start, start + timedelta(days=1)
+
+
+def rollup_day(scope_type: str, scope_id, day: date) -> None:
+    """Recompute one (scope, day) row from the requests of that day."""
+    start, end = day_bounds(day)
+    aggs = (
+        RequestModel.objects
+        .filter(**{SCOPE_FIELDS[scope_type]: scope_id},
+                created__gte=start, created__lt=end)
+        .aggregate(
+            count=Count('id'),
+            rate_sum=Sum('rate', default=0),
+            rate_count=Count('rate'),
+            min_rate=Min('rate'),
+            max_rate=Max('rate'),
+        )
+    )
+    lookup = {"scope_type": scope_type, "scope_id": scope_id, "day": day}
+    if not aggs['count']:
+        DailyStatsModel.objects.filter(**lookup).delete()
+        return
+    DailyStatsModel.objects.update_or_create(**lookup, defaults=aggs)
+
+
+@shared_task(ignore_result=True, autoretry_for=(OperationalError,),
+             retry_backoff=True, max_retries=5)
+def refresh_daily_stats(scope_type: str, scope_id: str, day: str):
+    """
+    Bring a single rollup row up to date. Recomputing the bucket instead of
+    applying deltas keeps the task idempotent, so retries are safe.
+    """
+    rollup_day(scope_type, scope_id, date.fromisoformat(day))
+
+
+@shared_task(ignore_result=True, autoretry_for=(OperationalError, RedisError),
+             retry_backoff=True, max_retries=5)
+def flush_last_online():
+    """
+    Periodic (CELERY_BEAT_SCHEDULE): move the heartbeats collected in Redis
+    since the previous run into last_online, one UPDATE per model.
+    """
+    write_last_online()
+
+
+@shared_task(ignore_result=True, autoretry_for=(OperationalError, RedisError),
+             retry_backoff=True, max_retries=5)
+def snapshot_unread_counters():
+    """
+    Periodic (CELERY_BEAT_SCHEDULE): copy unread counters changed since the
+    previous run from Redis to UnreadCounterModel, in one upsert.
+    """
+    snapshot_unread()
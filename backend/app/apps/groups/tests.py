@@ -1,3 +1,350 @@
-from django.test import TestCase
+import unittest
+import uuid
+from datetime import timedelta
 
-# Create your tests here.
+from channels.testing import WebsocketCommunicator
+from django.core.cache import caches
+from django.db import connection
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from apps.agents.models import AgentModel
+from apps.clients.models import ClientModel
+from apps.groups.access import get_bot_by_token
+from apps.groups.models import (BotModel, GroupModel, MessageModel,
+                                RequestModel)
+from apps.groups.unread import get_unread_store
+from api.v1.chats.pagination import (AFTER, BEFORE, decode_cursor,
+                                     encode_cursor, paginate)
+from config.asgi import application
+
+# Tests must not need Redis
+LOCAL_ONLY = override_settings(
+    SHARED_CACHE=False,
+    CHANNEL_LAYERS={
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+    },
+)
+
+
+class GroupFixtureMixin:
+    def setUp(self):
+        get_unread_store.cache_clear()
+        caches['default'].clear()
+        self.agent = AgentModel.objects.create_user(
+            username="agent", password="password", email="agent@mail.com",
+            name="Agent", surname="Test")
+        self.client_user = ClientModel.objects.create(telegram_id="1",
+                                                      name="Client")
+        self.group = GroupModel.objects.create(owner=self.agent,
+                                               name="Group")
+        self.group.agents.add(self.agent)
+
+    def add_bots(self, bots: int, chats: int, messages: int = 2) -> list:
+        created = []
+        for _ in range(bots):
+            bot = BotModel.objects.create(name="Bot")
+            created.append(bot)
+            self.group.bots.add(bot)
+            requests = RequestModel.objects.bulk_create([
+                RequestModel(client=self.client_user, bot=bot)
+                for _ in range(chats)
+            ])
+            MessageModel.objects.bulk_create([
+                MessageModel(request=request, user_id=self.client_user.id,
+                             text=f"Message {number}")
+                for request in requests for number in range(messages)
+            ])
+        return created
+
+
+@LOCAL_ONLY
+class ChatListQueriesTest(GroupFixtureMixin, TestCase):
+    url = "/api/v1/chats/get-chat-list/"
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.agent)}")
+
+    def get_chat_list(self):
+        response = self.api.post(self.url, {"group_id": str(self.group.id)},
+                                 format="json")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_queries_do_not_grow_with_bots_and_chats(self):
+        self.add_bots(bots=1, chats=1)
+        self.get_chat_list()
+        with CaptureQueriesContext(connection) as small:
+            self.get_chat_list()
+
+        self.add_bots(bots=5, chats=20)
+        with self.assertNumQueries(len(small.captured_queries)):
+            data = self.get_chat_list()
+        self.assertEqual(len(data), 6)
+        self.assertEqual(sum(len(bot["chats"]) for bot in data), 101)
+
+    def test_last_message_is_the_newest(self):
+        self.add_bots(bots=1, chats=1, messages=3)
+        [bot] = self.get_chat_list()
+        self.assertEqual(bot["chats"][0]["last_msg"], "Message 2")
+
+
+@LOCAL_ONLY
+class BotTokenCacheTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.old_key = BotModel.objects.create(name="Bot").secret_key
+
+    def test_new_key_replaces_the_cached_one(self):
+        bot = get_bot_by_token(str(self.old_key))
+        bot = BotModel.objects.get(pk=bot.pk)
+        bot.secret_key = uuid.uuid4()
+        with CaptureQueriesContext(connection) as queries:
+            bot.save()
+        # The old key comes from the loaded instance, not a SELECT
+        self.assertEqual([query['sql'].split()[0]
+                          for query in queries.captured_queries],
+                         ["UPDATE"])
+        self.assertIsNone(get_bot_by_token(str(self.old_key)))
+        self.assertEqual(get_bot_by_token(str(bot.secret_key)), bot)
+        # Saved again with the same key, the cache keeps working
+        bot.save()
+        self.assertEqual(get_bot_by_token(str(bot.secret_key)), bot)
+
+
+@LOCAL_ONLY
+class SendMessageViewTest(GroupFixtureMixin, TestCase):
+    url = "/api/v1/bot/send-message/"
+
+    def setUp(self):
+        super().setUp()
+        [self.bot] = self.add_bots(bots=1, chats=2, messages=0)
+        self.open_chat, self.solved_chat = RequestModel.objects.filter(
+            bot=self.bot).order_by('created')
+        self.solved_chat.is_solved = True
+        self.solved_chat.save()
+        self.api = APIClient()
+        self.api.credentials(HTTP_X_BOT_TOKEN=str(self.bot.secret_key))
+
+    def send(self, *items):
+        return self.api.post(self.url, {"messages": list(items)},
+                             format="json")
+
+    def test_partly_failed_batch_is_created(self):
+        response = self.send({"chat_id": str(self.open_chat.id), "text": "a"},
+                             {"chat_id": str(self.solved_chat.id),
+                              "text": "b"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["messages"]), 1)
+        self.assertEqual(response.data["errors"],
+                         [{"index": 1, "error": "Chat not found"}])
+
+    def test_solved_chats_get_no_messages(self):
+        response = self.send({"chat_id": str(self.solved_chat.id),
+                              "text": "late"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["messages"], [])
+        self.assertFalse(MessageModel.objects.exists())
+
+    def test_batch_without_a_chat_is_rejected(self):
+        response = self.send({"telegram_id": 404, "text": "a"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data["errors"]), 1)
+
+
+@LOCAL_ONLY
+class KeysetPaginationTest(GroupFixtureMixin, TestCase):
+    fields = ['sended', 'id']
+
+    def setUp(self):
+        super().setUp()
+        [bot] = self.add_bots(bots=1, chats=1, messages=0)
+        self.chat = RequestModel.objects.get(bot=bot)
+        # Every other message shares its timestamp, ids break the ties
+        start = timezone.now()
+        MessageModel.objects.bulk_create([
+            MessageModel(request=self.chat, user_id=self.client_user.id,
+                         text=f"Message {number}",
+                         sended=start + timedelta(seconds=number // 2))
+            for number in range(25)
+        ])
+        self.newest_first = [
+            message.id for message in sorted(
+                self.messages(), key=lambda m: (m.sended, m.id),
+                reverse=True)
+        ]
+
+    def messages(self):
+        return MessageModel.objects.filter(request=self.chat)
+
+    def page(self, size, cursor=None):
+        if cursor is not None:
+            cursor = decode_cursor(cursor)
+        rows, next_cursor, prev_cursor = paginate(
+            self.messages(), self.fields, size, cursor, scope=self.chat.id)
+        return [row.id for row in rows], next_cursor, prev_cursor
+
+    def walk(self, size, cursor=None, link=1):
+        """Pages from cursor on, following next (link=1) or prev (2)."""
+        pages = []
+        for _ in range(len(self.newest_first) + 1):
+            page = self.page(size, cursor)
+            pages.append(page)
+            cursor = page[link]
+            if cursor is None:
+                return pages
+        self.fail("Pagination does not end")
+
+    def test_older_pages_cover_every_row_once(self):
+        for size in (1, 5, 7, 25, 30):
+            pages = self.walk(size)
+            self.assertEqual(sum((ids for ids, _, _ in pages), []),
+                             self.newest_first, size)
+            self.assertEqual([prev is None for _, _, prev in pages],
+                             [True] + [False] * (len(pages) - 1), size)
+            # No empty last page when the rows fill the pages exactly
+            self.assertEqual(len(pages), -(-25 // size), size)
+
+    def test_newer_pages_walk_back_to_the_first(self):
+        older = self.walk(7)
+        newer = self.walk(7, older[-1][2], link=2)
+        self.assertEqual([ids for ids, _, _ in newer],
+                         [ids for ids, _, _ in older[-2::-1]])
+
+    def test_cursor_past_either_end_is_an_empty_page(self):
+        oldest = MessageModel.objects.get(id=self.newest_first[-1])
+        newest = MessageModel.objects.get(id=self.newest_first[0])
+        for direction, message in ((BEFORE, oldest), (AFTER, newest)):
+            cursor = encode_cursor(direction, [message.sended, message.id])
+            self.assertEqual(self.page(5, cursor), ([], None, None))
+
+    def test_empty_queryset(self):
+        self.messages().delete()
+        self.assertEqual(self.page(5), ([], None, None))
+
+    def test_cursor_keeps_its_scope(self):
+        _, cursor, _ = self.page(5)
+        self.assertEqual(decode_cursor(cursor)["s"], str(self.chat.id))
+
+    def test_invalid_cursors(self):
+        for cursor in ("", "%%%", "bm90IGpzb24",
+                       encode_cursor("sideways", []),
+                       "WzEsIDJd"):  # a JSON list
+            with self.assertRaises(ValueError, msg=cursor):
+                decode_cursor(cursor)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql",
+                     "EXPLAIN plans are checked on PostgreSQL only")
+@LOCAL_ONLY
+class HotPathIndexesTest(GroupFixtureMixin, TestCase):
+    """
+    The hot request and message queries must use their indexes, not fall
+    back to seq scans, on a dataset shaped like production: a year of
+    chats, most of them solved, and long histories.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # One big bot and many small ones
+        [self.bot] = self.add_bots(bots=1, chats=2000)
+        self.small_bot = self.add_bots(bots=20, chats=100)[0]
+        self.chat = RequestModel.objects.filter(bot=self.bot).first()
+        MessageModel.objects.bulk_create([
+            MessageModel(request=self.chat, user_id=self.client_user.id,
+                         text=f"History {number}")
+            for number in range(500)
+        ])
+        agents = [self.agent] + [
+            AgentModel.objects.create_user(
+                username=f"agent{number}", password="password",
+                email=f"agent{number}@mail.com", name="Agent",
+                surname="Test")
+            for number in range(4)
+        ]
+        chats = list(RequestModel.objects.values_list('pk', flat=True))
+        for number, agent in enumerate(agents):
+            RequestModel.objects.filter(
+                pk__in=chats[number::len(agents)]
+            ).update(is_solved=True, solved_by=agent)
+        RequestModel.objects.filter(pk__in=chats[::10]).update(
+            is_solved=False, solved_by=None)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE groups_requestmodel "
+                "SET created = now() - random() * interval '365 days'")
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan", plan)
+        if index_name:
+            self.assertIn(index_name, plan)
+
+    def test_message_history_page(self):
+        self.assertUsesIndex(
+            MessageModel.objects.filter(request=self.chat)
+            .order_by('-sended', '-id')[:50],
+            "message_request_sended_idx")
+
+    def test_chat_list_page(self):
+        self.assertUsesIndex(
+            RequestModel.objects.filter(bot=self.bot)
+            .order_by('-created', '-id')[:100],
+            "request_bot_created_idx")
+
+    def test_agent_stats(self):
+        self.assertUsesIndex(
+            RequestModel.objects.filter(
+                solved_by=self.agent,
+                created__gte=timezone.now() - timedelta(days=30)))
+
+    def test_open_requests_per_bot(self):
+        self.assertUsesIndex(
+            RequestModel.objects.filter(bot=self.bot, is_solved=False),
+            "request_bot_unsolved_idx")
+
+    def test_most_active_agent_per_bot(self):
+        self.assertUsesIndex(
+            RequestModel.objects.filter(bot=self.small_bot, is_solved=True)
+            .values('solved_by').annotate(count=Count('id'))
+            .order_by('-count')[:1],
+            "request_bot_solved_idx")
+
+
+@LOCAL_ONLY
+class BotSocketFramesTest(TransactionTestCase):
+    """One bad frame must not close the bot socket shared by its chats."""
+
+    def setUp(self):
+        caches['default'].clear()
+        self.bot = BotModel.objects.create(name="Bot")
+        client = ClientModel.objects.create(telegram_id="1", name="Client")
+        self.chat = RequestModel.objects.create(client=client, bot=self.bot)
+
+    async def test_malformed_frames_keep_the_socket_open(self):
+        socket = WebsocketCommunicator(
+            application, "/ws/bot/",
+            headers=[(b"x-bot-token", str(self.bot.secret_key).encode())])
+        connected, _ = await socket.connect()
+        self.assertTrue(connected)
+        for frame in ('[]', '1', '"x"', 'null', '{"action": "subscribe"'):
+            await socket.send_to(text_data=frame)
+        for chat_ids in ({"id": str(self.chat.id)}, str(self.chat.id)):
+            await socket.send_json_to({"action": "subscribe",
+                                       "chat_ids": chat_ids})
+            self.assertEqual(await socket.receive_json_from(), {
+                "action": "error", "error": "chat_ids must be a list"})
+
+        await socket.send_json_to({"action": "subscribe",
+                                   "chat_ids": [str(self.chat.id)]})
+        self.assertEqual(await socket.receive_json_from(), {
+            "action": "subscribed", "chat_ids": [str(self.chat.id)]})
+        await socket.disconnect()
@@ -0,0 +1,361 @@
+import logging
+import threading
+from collections import defaultdict
+from functools import cache
+
+import redis
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Count, F, Q
+from redis.exceptions import RedisError
+
+from apps.agents.models import AgentModel
+from apps.groups.access import (get_bot_group_ids, get_chat_bot_id,
+                                get_group_agent_ids)
+from apps.groups.models import (GroupModel, MessageModel, ReadMarkerModel,
+                                RequestModel, UnreadCounterModel)
+
+logger = logging.getLogger(__name__)
+
+# Agent id -> ids of the groups the agent sees a chat through
+AgentGroups = dict[str, list[str]]
+
+
+class RedisUnreadStore:
+    """
+    Unread counters of agents, shared by all processes:
+      unread:<agent>:chats   hash, chat id -> unread messages
+      unread:<agent>:groups  hash, group id -> unread messages of its chats
+      unread:touched         set of "<agent>:<chat>" changed since the
+                             last snapshot
+    """
+    local = False
+    TOUCHED = "unread:touched"
+    # Set a chat counter and move the agent's group counters by as much
+    SET_SCRIPT = """
+local old = tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0')
+local new = tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], ARGV[1], new)
+for i = 4, #ARGV do
+    redis.call('HINCRBY', KEYS[2], ARGV[i], new - old)
+end
+redis.call('SADD', KEYS[3], ARGV[3])
+return old
+"""
+
+    def __init__(self, url: str):
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self._set = self.client.register_script(self.SET_SCRIPT)
+
+    @staticmethod
+    def key(agent_id, name: str) -> str:
+        return f"unread:{agent_id}:{name}"
+
+    def add_messages(self, messages: list[tuple[str, AgentGroups]]) -> None:
+        """One new message per (chat id, agents), in one round trip."""
+        pipe = self.client.pipeline(transaction=False)
+        for chat_id, agent_groups in messages:
+            for agent_id, group_ids in agent_groups.items():
+                pipe.hincrby(self.key(agent_id, "chats"), chat_id, 1)
+                for group_id in group_ids:
+                    pipe.hincrby(self.key(agent_id, "groups"), group_id, 1)
+                pipe.sadd(self.TOUCHED, f"{agent_id}:{chat_id}")
+        pipe.execute()
+
+    def set_counts(self, counts: list[tuple[str, str, int, list[str]]]):
+        """Set (agent id, chat id, count, group ids) chat counters."""
+        pipe = self.client.pipeline(transaction=False)
+        for agent_id, chat_id, count, group_ids in counts:
+            self._set(
+                keys=[self.key(agent_id, "chats"),
+                      self.key(agent_id, "groups"), self.TOUCHED],
+                args=[chat_id, count, f"{agent_id}:{chat_id}", *group_ids],
+                client=pipe,
+            )
+        pipe.execute()
+
+    def get(self, agent_id, name: str, ids: list[str]) -> dict[str, int]:
+        """Counters of the agent's chats or groups, one HMGET."""
+        if not ids:
+            return {}
+        values = self.client.hmget(self.key(agent_id, name), ids)
+        return {obj_id: int(value or 0) for obj_id, value in zip(ids, values)}
+
+    def pop_touched(self) -> dict[tuple[str, str], int]:
+        """(agent id, chat id) counters changed since the last call."""
+        pipe = self.client.pipeline()
+        pipe.smembers(self.TOUCHED)
+        pipe.delete(self.TOUCHED)
+        members, _ = pipe.execute()
+        pairs = [tuple(member.split(":")) for member in members]
+        pipe = self.client.pipeline(transaction=False)
+        for agent_id, chat_id in pairs:
+            pipe.hget(self.key(agent_id, "chats"), chat_id)
+        return {pair: int(value or 0)
+                for pair, value in zip(pairs, pipe.execute())}
+
+    def restore_touched(self, pairs) -> None:
+        if pairs:
+            self.client.sadd(self.TOUCHED, *[f"{agent_id}:{chat_id}"
+                                             for agent_id, chat_id in pairs])
+
+    def replace(self, chats: dict[tuple[str, str], int],
+                groups: dict[tuple[str, str], int]) -> None:
+        """Swap all counters for rebuilt ones, atomically."""
+        old = list(self.client.scan_iter("unread:*", count=1000))
+        mappings = defaultdict(dict)
+        for (agent_id, chat_id), count in chats.items():
+            mappings[self.key(agent_id, "chats")][chat_id] = count
+        for (agent_id, group_id), count in groups.items():
+            mappings[self.key(agent_id, "groups")][group_id] = count
+        pipe = self.client.pipeline()
+        if old:
+            pipe.delete(*old)
+        for key, mapping in mappings.items():
+            pipe.hset(key, mapping=mapping)
+        pipe.execute()
+
+
+class LocalUnreadStore:
+    """
+    In-memory stand-in for RedisUnreadStore, for single process setups
+    without Redis (SHARED_CACHE=False).
+    """
+    local = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, str], dict[str, int]] = \
+            defaultdict(dict)
+        self._touched: set[tuple[str, str]] = set()
+
+    def add_messages(self, messages: list[tuple[str, AgentGroups]]) -> None:
+        with self._lock:
+            for chat_id, agent_groups in messages:
+                for agent_id, group_ids in agent_groups.items():
+                    for name, obj_ids in (("chats", [chat_id]),
+                                          ("groups", group_ids)):
+                        counters = self._counters[(agent_id, name)]
+                        for obj_id in obj_ids:
+                            counters[obj_id] = counters.get(obj_id, 0) + 1
+                    self._touched.add((agent_id, chat_id))
+
+    def set_counts(self, counts: list[tuple[str, str, int, list[str]]]):
+        with self._lock:
+            for agent_id, chat_id, count, group_ids in counts:
+                chats = self._counters[(agent_id, "chats")]
+                groups = self._counters[(agent_id, "groups")]
+                delta = count - chats.get(chat_id, 0)
+                chats[chat_id] = count
+                for group_id in group_ids:
+                    groups[group_id] = groups.get(group_id, 0) + delta
+                self._touched.add((agent_id, chat_id))
+
+    def get(self, agent_id, name: str, ids: list[str]) -> dict[str, int]:
+        with self._lock:
+            counters = self._counters.get((str(agent_id), name), {})
+            return {obj_id: counters.get(obj_id, 0) for obj_id in ids}
+
+    def pop_touched(self) -> dict[tuple[str, str], int]:
+        with self._lock:
+            touched, self._touched = self._touched, set()
+            return {(agent_id, chat_id):
+                    self._counters[(agent_id, "chats")].get(chat_id, 0)
+                    for agent_id, chat_id in touched}
+
+    def restore_touched(self, pairs) -> None:
+        with self._lock:
+            self._touched.update(pairs)
+
+    def replace(self, chats: dict[tuple[str, str], int],
+                groups: dict[tuple[str, str], int]) -> None:
+        with self._lock:
+            self._counters.clear()
+            for (agent_id, chat_id), count in chats.items():
+                self._counters[(agent_id, "chats")][chat_id] = count
+            for (agent_id, group_id), count in groups.items():
+                self._counters[(agent_id, "groups")][group_id] = count
+
+
+@cache
+def get_unread_store() -> RedisUnreadStore | LocalUnreadStore:
+    if settings.SHARED_CACHE:
+        return RedisUnreadStore(settings.UNREAD_REDIS_URL)
+    return LocalUnreadStore()
+
+
+def chat_agent_groups(chat_id) -> AgentGroups:
+    """Agents who see the chat, with the groups they see it through."""
+    bot_id = get_chat_bot_id(chat_id)
+    agent_groups = defaultdict(list)
+    if bot_id is None:
+        return agent_groups
+    for group_id in get_bot_group_ids(bot_id):
+        for agent_id in get_group_agent_ids(group_id):
+            agent_groups[agent_id].append(group_id)
+    return agent_groups
+
+
+def count_messages(messages: list[tuple]) -> None:
+    """
+    Count new (chat id, sender id) messages as unread for every agent of
+    their chats but the sender. Membership comes from the access cache, so
+    a warm call is a single Redis round trip. Failures are only logged:
+    rebuild_unread_counters repairs the drift.
+    """
+    batch = []
+    for chat_id, sender_id in messages:
+        agent_groups = chat_agent_groups(chat_id)
+        agent_groups.pop(str(sender_id), None)
+        if agent_groups:
+            batch.append((str(chat_id), agent_groups))
+    if not batch:
+        return
+    try:
+        get_unread_store().add_messages(batch)
+    except RedisError as exc:
+        logger.warning(f"Unread counters of {len(batch)} messages "
+                       f"lost: {exc!r}")
+
+
+def with_unread(markers):
+    """Annotate read markers with the messages of others after them."""
+    return markers.annotate(unread=Count(
+        'request__messagemodel',
+        filter=Q(request__messagemodel__sended__gt=F('last_read_at'))
+        & ~Q(request__messagemodel__user_id=F('user_id')),
+    ))
+
+
+def refresh_unread(pairs) -> None:
+    """
+    Recount the (user id, chat id) chats whose read marker just advanced,
+    in one query for the whole batch. Users who are not agents of the chat
+    have no counters and are skipped.
+    """
+    pairs = {(str(user_id), str(chat_id)) for user_id, chat_id in pairs}
+    if not pairs:
+        return
+    rows = with_unread(ReadMarkerModel.objects.filter(
+        user_id__in={user_id for user_id, _ in pairs},
+        request_id__in={chat_id for _, chat_id in pairs},
+    )).values_list('user_id', 'request_id', 'unread')
+    counts = []
+    for user_id, chat_id, unread in rows:
+        user_id, chat_id = str(user_id), str(chat_id)
+        group_ids = chat_agent_groups(chat_id).get(user_id)
+        if (user_id, chat_id) in pairs and group_ids:
+            counts.append((user_id, chat_id, unread, group_ids))
+    if not counts:
+        return
+    try:
+        get_unread_store().set_counts(counts)
+    except RedisError as exc:
+        logger.warning(f"Unread counters of {len(counts)} chats "
+                       f"lost: {exc!r}")
+
+
+def get_memberships() -> tuple[dict, dict]:
+    """Group ids per bot id and agent ids per group id, in two queries."""
+    bot_groups, group_agents = defaultdict(list), defaultdict(list)
+    for bot_id, group_id in GroupModel.bots.through.objects.values_list(
+            'botmodel_id', 'groupmodel_id'):
+        bot_groups[str(bot_id)].append(str(group_id))
+    for group_id, agent_id in GroupModel.agents.through.objects.values_list(
+            'groupmodel_id', 'agentmodel_id'):
+        group_agents[str(group_id)].append(str(agent_id))
+    return bot_groups, group_agents
+
+
+def sum_groups(chats: dict[tuple[str, str], int],
+               chat_bots: dict[str, str]) -> dict[tuple[str, str], int]:
+    """Group counters of the given chat counters."""
+    bot_groups, group_agents = get_memberships()
+    groups = defaultdict(int)
+    for (agent_id, chat_id), count in chats.items():
+        for group_id in bot_groups[chat_bots[chat_id]]:
+            if agent_id in group_agents[group_id]:
+                groups[(agent_id, group_id)] += count
+    return groups
+
+
+def compute_unread() -> tuple[dict, dict]:
+    """
+    Chat and group counters recomputed from messages and read markers.
+    Agents without a marker have every message of others unread.
+    """
+    bot_groups, group_agents = get_memberships()
+    totals, own, chat_bots = defaultdict(int), defaultdict(int), {}
+    for chat_id, bot_id, user_id, count in (
+            MessageModel.objects
+            .values_list('request_id', 'request__bot_id', 'user_id')
+            .annotate(count=Count('id'))
+            .order_by()):
+        chat_id = str(chat_id)
+        chat_bots[chat_id] = str(bot_id)
+        totals[chat_id] += count
+        own[(str(user_id), chat_id)] += count
+    after_marker = {
+        (str(user_id), str(chat_id)): unread
+        for user_id, chat_id, unread in with_unread(
+            ReadMarkerModel.objects.all()
+        ).values_list('user_id', 'request_id', 'unread')
+    }
+
+    chats = {}
+    for chat_id, total in totals.items():
+        agent_ids = {agent_id
+                     for group_id in bot_groups[chat_bots[chat_id]]
+                     for agent_id in group_agents[group_id]}
+        for agent_id in agent_ids:
+            key = (agent_id, chat_id)
+            count = after_marker.get(key, total - own[key])
+            if count:
+                chats[key] = count
+    return chats, sum_groups(chats, chat_bots)
+
+
+def load_snapshot() -> tuple[dict, dict]:
+    """Chat and group counters from the last Postgres snapshot."""
+    chats, chat_bots = {}, {}
+    for agent_id, chat_id, bot_id, count in (
+            UnreadCounterModel.objects
+            .filter(count__gt=0)
+            .values_list('agent_id', 'request_id', 'request__bot_id',
+                         'count')):
+        chats[(str(agent_id), str(chat_id))] = count
+        chat_bots[str(chat_id)] = str(bot_id)
+    return chats, sum_groups(chats, chat_bots)
+
+
+def snapshot_unread() -> int:
+    """
+    Copy counters changed since the previous snapshot to Postgres in one
+    upsert. Returns the number of written counters.
+    """
+    store = get_unread_store()
+    touched = store.pop_touched()
+    if not touched:
+        return 0
+    # Agents or chats deleted in the meantime would fail the whole upsert
+    agent_ids = {str(agent_id) for agent_id in AgentModel.objects.filter(
+        id__in={agent_id for agent_id, _ in touched}
+    ).values_list('id', flat=True)}
+    chat_ids = {str(chat_id) for chat_id in RequestModel.objects.filter(
+        id__in={chat_id for _, chat_id in touched}
+    ).values_list('id', flat=True)}
+    rows = [
+        UnreadCounterModel(agent_id=agent_id, request_id=chat_id,
+                           count=count)
+        for (agent_id, chat_id), count in touched.items()
+        if agent_id in agent_ids and chat_id in chat_ids
+    ]
+    try:
+        UnreadCounterModel.objects.bulk_create(
+            rows, update_conflicts=True,
+            unique_fields=['agent', 'request'], update_fields=['count'],
+        )
+    except DatabaseError:
+        store.restore_touched(touched)
+        raise
+    return len(rows)
@@ -0,0 +1,21 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import (
+    JWTStatelessUserAuthentication)
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from apps.users.cache import load_scope_user
+
+
+class CachedJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    JWT authentication without loading the user row, for hot read-only
+    endpoints. Deactivated and deleted users are still refused, through
+    the same cached check as the WebSocket handshakes (load_scope_user).
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if not load_scope_user(user.id)["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"),
+                                       code="user_inactive")
+        return user
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+
+from apps.agents.models import AgentModel
+from apps.users.models import UserModel
+from config.cache import TieredCache
+
+user_cache = TieredCache(
+    "scope-user",
+    timeout=settings.WS_USER_CACHE_TTL,
+    local_timeout=settings.WS_USER_LOCAL_CACHE_TTL,
+)
+
+
+def scope_user_key(user_id) -> str:
+    return user_cache.key(user_id)
+
+
+def load_scope_user(user_id) -> dict:
+    """
+    Type, username and active flag of a user, in one query.
+    Deleted users are cached too, as inactive.
+    """
+    def loader():
+        user = (
+            UserModel.objects
+            .filter(id=user_id)
+            .annotate(is_agent_active=Exists(AgentModel.objects.filter(
+                id=OuterRef('id'), is_active=True
+            )))
+            .values('type', 'username', 'is_agent_active')
+            .first()
+        )
+        if user is None:
+            return {"is_active": False}
+        return {
+            "type": user['type'],
+            "username": user['username'],
+            "is_active": user['type'] != "agent" or user['is_agent_active'],
+        }
+
+    return user_cache.get_or_set(scope_user_key(user_id), loader)
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.agents.models import AgentModel
+from apps.users.cache import scope_user_key, user_cache
+from apps.users.models import UserModel
+
+
+@receiver([post_save, post_delete], sender=UserModel)
+@receiver([post_save, post_delete], sender=AgentModel)
+def invalidate_scope_user(sender, instance, **kwargs):
+    # Deactivated or deleted users lose WebSocket access
+    user_cache.delete(scope_user_key(instance.pk))
@@ -3,7 +3,7 @@ import os
 from channels.auth import AuthMiddlewareStack
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from .middleware import AuthMiddleware
+from .middleware import AuthMiddleware, FlushWriterMiddleware
 
 from .routing import ws_urlpatterns
 
@@ -11,7 +11,9 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'realtime_pr.settings')
 
 application = ProtocolTypeRouter({
     'http': get_asgi_application(),
-    'websocket': AuthMiddleware(
-        URLRouter(ws_urlpatterns)
+    'websocket': FlushWriterMiddleware(
+        AuthMiddleware(
+            URLRouter(ws_urlpatterns)
+        )
     )
 })
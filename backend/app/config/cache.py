@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.core.cache import caches
+from redis.exceptions import RedisError
+
+MISSING = object()
+
+
+class TieredCache:
+    """
+    Two level cache: the process-local LocMemCache ("default", bounded by
+    MAX_ENTRIES) in front of the shared Redis cache ("shared").
+    Local entries live at most local_timeout seconds, so deletes made by
+    other processes reach this one after that time at the latest.
+    """
+
+    def __init__(self, prefix: str, timeout: int,
+                 local_timeout: int | None = None):
+        self.prefix = prefix
+        self.timeout = timeout
+        self.local_timeout = min(local_timeout or timeout, timeout)
+
+    @property
+    def local(self):
+        return caches['default']
+
+    @property
+    def shared(self):
+        return caches['shared'] if settings.SHARED_CACHE else None
+
+    def key(self, *parts) -> str:
+        return ":".join([self.prefix, *map(str, parts)])
+
+    def get_local(self, key: str, default=None):
+        """Local level only, never blocks: safe to call from the event loop."""
+        return self.local.get(key, default)
+
+    def get(self, key: str, default=None):
+        value = self.local.get(key, MISSING)
+        if value is MISSING and self.shared is not None:
+            try:
+                value = self.shared.get(key, MISSING)
+            except RedisError:
+                value = MISSING
+            if value is not MISSING:
+                self.local.set(key, value, self.local_timeout)
+        return default if value is MISSING else value
+
+    def set(self, key: str, value, timeout: int | None = None) -> None:
+        timeout = timeout or self.timeout
+        self.local.set(key, value, min(timeout, self.local_timeout))
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, timeout)
+            except RedisError:
+                pass
+
+    def get_or_set(self, key: str, loader, timeout: int | None = None):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            value = loader()
+            self.set(key, value, timeout)
+        return value
+
+    def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        self.local.delete_many(keys)
+        if self.shared is not None:
+            try:
+                self.shared.delete_many(keys)
+            except RedisError:
+                pass
@@ -3,6 +3,8 @@ import base64
 import hmac
 import hashlib
 import uuid
+from dataclasses import dataclass
+from functools import lru_cache
 from urllib.parse import parse_qs
 
 import jwt
@@ -11,64 +13,100 @@ from channels.middleware import BaseMiddleware
 from channels.db import database_sync_to_async
 from rest_framework.exceptions import AuthenticationFailed
 
-from apps.users.models import UserModel
-from apps.groups.models import BotModel, RequestModel
+from api.v1.chats.writer import flush_message_writer
+from apps.groups.access import (get_bot_by_token, get_chat_credentials,
+                                get_local_chat_credentials)
+from apps.users.cache import load_scope_user, scope_user_key, user_cache
 
 
-@database_sync_to_async
-def get_user_from_jwt(token: str) -> UserModel:
-    """Authenticate a user via JWT token."""
+@dataclass(frozen=True)
+class ScopeUser:
+    """Lightweight scope user built from JWT claims, not an ORM instance."""
+    id: uuid.UUID
+    type: str
+    username: str = ""
+
+
+async def get_user_from_jwt(token: str) -> ScopeUser:
+    """
+    Authenticate a user via JWT token.
+    Recently seen users are answered from the local cache without a query;
+    misses load (and cache) the user once, which also catches deactivated
+    and deleted users.
+    """
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        return UserModel.objects.get(id=payload["user_id"])
-    except (jwt.DecodeError, jwt.ExpiredSignatureError, UserModel.DoesNotExist):
+        user_id = uuid.UUID(str(payload["user_id"]))
+    except (jwt.InvalidTokenError, KeyError, ValueError):
+        raise AuthenticationFailed("Invalid or expired token")
+    if payload.get("token_type", "access") != "access":
         raise AuthenticationFailed("Invalid or expired token")
 
+    user = user_cache.get_local(scope_user_key(user_id))
+    if user is None:
+        user = await database_sync_to_async(load_scope_user)(user_id)
+    if not user["is_active"]:
+        raise AuthenticationFailed("Invalid or expired token")
 
-@database_sync_to_async
-def get_verified_user(chat_id: str, token: str) -> str | None:
-    print(chat_id)
-    try:
-        request = (
-            RequestModel.objects
-            .select_related('client', 'bot')
-            .get(id=chat_id)
-        )
-    except RequestModel.DoesNotExist:
+    return ScopeUser(
+        id=user_id,
+        type=payload.get("user_type", user["type"]),
+        username=payload.get("username", user["username"]),
+    )
+
+
+async def get_verified_user(chat_id: str, token: str) -> ScopeUser | None:
+    """
+    Authenticate a bot's per-chat socket by its secure key, the HMAC of the
+    client's telegram id under the bot secret. Warm chats are checked from
+    the local cache without leaving the event loop.
+    """
+    chat = get_local_chat_credentials(chat_id)
+    if chat is None:
+        chat = await database_sync_to_async(get_chat_credentials)(chat_id)
+    if chat is None:
         return None
 
-    if not _verify_secure_token(request.client.telegram_id, request.bot.secret_key, token):
+    if not _verify_secure_token(chat['telegram_id'], chat['secret_key'], token):
         raise AuthenticationFailed("Invalid bot credentials")
 
-    return UserModel.objects.get(id=request.client.id)
+    return ScopeUser(id=chat['client_id'], type="client")
+
+
+@lru_cache(maxsize=1024)
+def _bot_mac(secret_key: str) -> hmac.HMAC:
+    # Keyed state is derived once per bot secret and copied per check
+    return hmac.new(secret_key.encode(), digestmod=hashlib.sha256)
 
 
-def _verify_secure_token(user_id: str, secret_key: uuid.uuid4, token: str) -> bool:
+def _verify_secure_token(user_id: str, secret_key: uuid.UUID, token: str) -> bool:
     """Verify HMAC-based secure token for bot authentication."""
-    expected = hmac.new(
-        str(secret_key).encode(),
-        user_id.encode(),
-        hashlib.sha256
-    ).digest()
+    mac = _bot_mac(str(secret_key)).copy()
+    mac.update(str(user_id).encode())
     try:
         decoded = base64.urlsafe_b64decode(token.encode())
-        print(decoded)
-        print(expected)
     except (TypeError, ValueError):
         return False
 
-    return hmac.compare_digest(decoded, expected)
+    return hmac.compare_digest(decoded, mac.digest())
 
 
 class AuthMiddleware(BaseMiddleware):
     """
     Custom middleware for Channels that authenticates either a user via JWT
-    or a bot via secure key per chat.
+    or a bot via secure key per chat. The multiplexed bot socket
+    (/ws/bot/) is authenticated by the X-Bot-Token header instead, the
+    agent inbox (/ws/inbox/) by JWT only.
     """
 
     async def __call__(self, scope, receive, send):
-        # Extract chat_id from path, e.g. /ws/chat/{chat_id}/
         path = scope.get('path', '')
+        if re.search(r'/ws/bot/$', path):
+            return await self._authenticate_bot(scope, receive, send)
+        if re.search(r'/ws/inbox/$', path):
+            return await self._authenticate_agent(scope, receive, send)
+
+        # Extract chat_id from path, e.g. /ws/chat/{chat_id}/
         match = re.search(r'/chat/(?P<chat_id>[0-9a-f\-]+)/', path)
         if not match:
             await self._close_connection(send, "Chat ID is missing or invalid")
@@ -86,7 +124,7 @@ class AuthMiddleware(BaseMiddleware):
             if token:
                 scope['user'] = await get_user_from_jwt(token[0])
             elif secure_key:
-                scope['user'] = await get_verified_user(chat_id, secure_key[0], )
+                scope['user'] = await get_verified_user(chat_id, secure_key[0])
             else:
                 raise AuthenticationFailed("Authentication credentials not provided")
         except AuthenticationFailed as exc:
@@ -95,6 +133,32 @@ class AuthMiddleware(BaseMiddleware):
 
         return await super().__call__(scope, receive, send)
 
+    async def _authenticate_agent(self, scope, receive, send):
+        query_params = parse_qs(scope.get('query_string', b'').decode())
+        token = query_params.get('token')
+        try:
+            if not token:
+                raise AuthenticationFailed(
+                    "Authentication credentials not provided")
+            scope['user'] = await get_user_from_jwt(token[0])
+        except AuthenticationFailed as exc:
+            await self._close_connection(send, str(exc))
+            return
+        return await super().__call__(scope, receive, send)
+
+    async def _authenticate_bot(self, scope, receive, send):
+        token = dict(scope.get('headers', [])).get(b'x-bot-token')
+        bot = None
+        if token:
+            bot = await database_sync_to_async(get_bot_by_token)(
+                token.decode(errors='ignore'))
+        if not bot:
+            await self._close_connection(send, "Invalid bot token")
+            return
+        scope['bot'] = bot
+        scope['user'] = None
+        return await super().__call__(scope, receive, send)
+
     async def _close_connection(self, send, reason: str, code: int = 4001):
         """Helper to close WebSocket connection with reason."""
         await send({
@@ -102,3 +166,17 @@ class AuthMiddleware(BaseMiddleware):
             "code": code,
             "reason": reason,
         })
+
+
+class FlushWriterMiddleware(BaseMiddleware):
+    """
+    Write the buffered chat messages when a socket's application instance
+    ends. That covers a normal disconnect as well as the server cancelling
+    all instances at shutdown, which skips the consumers' disconnect.
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            return await super().__call__(scope, receive, send)
+        finally:
+            await flush_message_writer()
@@ -164,6 +164,73 @@ REST_FRAMEWORK = {
 
 }
 
+# Caches: process-local in front of the shared Redis (config/cache.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get("LOCAL_CACHE_MAX_ENTRIES",
+                                              10000))
+        }
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get("REDIS_URL", "redis://localhost:6379"),
+    }
+}
+SHARED_CACHE = os.environ.get("SHARED_CACHE", "True") == "True"
+CHAT_ACCESS_CACHE_TTL = int(os.environ.get("CHAT_ACCESS_CACHE_TTL", 300))
+CHAT_ACCESS_LOCAL_CACHE_TTL = int(
+    os.environ.get("CHAT_ACCESS_LOCAL_CACHE_TTL", 30))
+WS_USER_CACHE_TTL = int(os.environ.get("WS_USER_CACHE_TTL", 300))
+WS_USER_LOCAL_CACHE_TTL = int(os.environ.get("WS_USER_LOCAL_CACHE_TTL", 60))
+BOT_TOKEN_CACHE_TTL = int(os.environ.get("BOT_TOKEN_CACHE_TTL", 300))
+BOT_TOKEN_LOCAL_CACHE_TTL = int(
+    os.environ.get("BOT_TOKEN_LOCAL_CACHE_TTL", 30))
+BOT_TOKEN_NEGATIVE_CACHE_TTL = int(
+    os.environ.get("BOT_TOKEN_NEGATIVE_CACHE_TTL", 30))
+
+# Presence (see apps/groups/presence.py)
+PRESENCE_REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+# Seconds between heartbeats of open sockets
+PRESENCE_INTERVAL = float(os.environ.get("PRESENCE_INTERVAL", 10))
+# Seconds without a heartbeat after which a user is offline
+PRESENCE_TIMEOUT = float(os.environ.get("PRESENCE_TIMEOUT", 30))
+# Seconds between last_online writes to the database
+PRESENCE_FLUSH_INTERVAL = float(
+    os.environ.get("PRESENCE_FLUSH_INTERVAL", 60))
+PRESENCE_RETENTION = int(os.environ.get("PRESENCE_RETENTION", 7 * 86400))
+
+# Unread counters (see apps/groups/unread.py)
+UNREAD_REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379")
+# Seconds between snapshots of the counters to the database
+UNREAD_SNAPSHOT_INTERVAL = float(
+    os.environ.get("UNREAD_SNAPSHOT_INTERVAL", 300))
+
+# Chats pagination
+CHATS_PAGE_SIZE = int(os.environ.get("CHATS_PAGE_SIZE", 100))
+CHATS_MAX_PAGE_SIZE = int(os.environ.get("CHATS_MAX_PAGE_SIZE", 500))
+
+# Bot send-message batches
+BOT_SEND_MAX_BATCH = int(os.environ.get("BOT_SEND_MAX_BATCH", 500))
+
+# Chat messages write-behind (see api/v1/chats/writer.py)
+CHAT_WRITE_BEHIND = os.environ.get("CHAT_WRITE_BEHIND", "False") == "True"
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(
+    os.environ.get("CHAT_WRITE_BEHIND_BATCH_SIZE", 100))
+CHAT_WRITE_BEHIND_INTERVAL = float(
+    os.environ.get("CHAT_WRITE_BEHIND_INTERVAL", 0.05))
+CHAT_WRITE_BEHIND_RETRIES = int(
+    os.environ.get("CHAT_WRITE_BEHIND_RETRIES", 5))
+# Queued messages per process before senders wait for the database
+CHAT_WRITE_BEHIND_MAX_BUFFER = int(
+    os.environ.get("CHAT_WRITE_BEHIND_MAX_BUFFER", 5000))
+# Read receipts are coalesced and written every interval seconds
+CHAT_READ_FLUSH_INTERVAL = float(
+    os.environ.get("CHAT_READ_FLUSH_INTERVAL", 2))
+# Typing frames of a socket are forwarded at most once per interval
+CHAT_TYPING_INTERVAL = float(os.environ.get("CHAT_TYPING_INTERVAL", 1))
+
 # SimpleJWT
 
 # Djoser
@@ -172,6 +239,8 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER':
+        'api.v1.auth.serializers.TypedTokenObtainPairSerializer',
 }
 # Email
 
@@ -182,6 +251,16 @@ CELERY_BROKER_URL = os.environ.get(
 )
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TIMEZONE = 'UTC'
+CELERY_BEAT_SCHEDULE = {
+    'flush-last-online': {
+        'task': 'apps.groups.tasks.flush_last_online',
+        'schedule': PRESENCE_FLUSH_INTERVAL,
+    },
+    'snapshot-unread-counters': {
+        'task': 'apps.groups.tasks.snapshot_unread_counters',
+        'schedule': UNREAD_SNAPSHOT_INTERVAL,
+    },
+}
 
 # CORS Policy
 CORS_ALLOWED_ORIGINS = [
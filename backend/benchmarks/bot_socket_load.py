@@ -0,0 +1,160 @@
+"""
+Bot socket load test (one multiplexed ws/bot/ socket vs a secure-key
+ws/chat/<id>/ socket per chat).
+
+One bot with CHATS open chats connects either a single socket and
+subscribes every chat in batches, or one socket per chat. Then MESSAGES
+agent messages are posted to random chats. Reports the connect time,
+queries and channel layer group memberships needed to connect, the
+memory the open sockets hold, and the time until every message reached
+the bot.
+
+Memory is the growth of the process RSS over the connect, and with
+--tracemalloc the Python allocations still alive after it (slower, so
+the connect time is not comparable then). Sockets run in-process, so
+both include the test client side of each socket.
+
+    python benchmarks/bot_socket_load.py --mode multiplex --chats 1000 10000
+    python benchmarks/bot_socket_load.py --mode per-chat --chats 1000 10000
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+import tracemalloc
+
+from common import (QueryCounter, report, seed_agents, seed_client,
+                    setup_django, test_database)
+
+setup_django()
+
+from channels.layers import get_channel_layer  # noqa: E402
+from channels.testing import WebsocketCommunicator  # noqa: E402
+
+from api.v1.chats.consumers import BotConsumer, post_message  # noqa: E402
+from apps.groups.models import BotModel, RequestModel  # noqa: E402
+from config.asgi import application  # noqa: E402
+from ws_handshake import secure_key_paths  # noqa: E402
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        pages = int(statm.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def seed(chats: int):
+    # Sizes share the database, every run seeds its own rows
+    client = seed_client(telegram_id=chats)
+    [agent] = seed_agents(1, prefix=f"botsocket{chats}")
+    bot = BotModel.objects.create(name="Load")
+    requests = RequestModel.objects.bulk_create([
+        RequestModel(client=client, bot=bot, theme="Load")
+        for _ in range(chats)
+    ])
+    for request in requests:
+        request.client = client
+    return agent, bot, requests
+
+
+async def connect(path, headers=None):
+    communicator = WebsocketCommunicator(application, path,
+                                         headers=headers or [])
+    connected, _ = await communicator.connect(timeout=30)
+    assert connected, path
+    return communicator
+
+
+async def connect_multiplexed(bot, chats):
+    socket = await connect("/ws/bot/",
+                           [(b"x-bot-token", str(bot.secret_key).encode())])
+    chat_ids = [str(chat.id) for chat in chats]
+    for start in range(0, len(chat_ids), BotConsumer.MAX_SUBSCRIBE):
+        await socket.send_json_to({
+            "action": "subscribe",
+            "chat_ids": chat_ids[start:start + BotConsumer.MAX_SUBSCRIBE],
+        })
+        await socket.receive_json_from(timeout=30)
+    return [socket]
+
+
+async def run(mode: str, messages: int, agent, bot, chats,
+              trace: bool) -> None:
+    channel_layer = get_channel_layer()
+    frames = 0
+
+    async def drain(communicator):
+        nonlocal frames
+        while True:
+            output = await communicator.output_queue.get()
+            if output.get("type") == "websocket.send":
+                frames += 1
+
+    group_add = channel_layer.group_add
+    memberships = 0
+
+    async def counted_group_add(group, channel):
+        nonlocal memberships
+        memberships += 1
+        await group_add(group, channel)
+
+    channel_layer.group_add = counted_group_add
+    paths = secure_key_paths(bot, chats) if mode == "per-chat" else []
+    rss = rss_mb()
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with QueryCounter() as queries:
+        if mode == "multiplex":
+            sockets = await connect_multiplexed(bot, chats)
+        else:
+            sockets = [await connect(path) for path in paths]
+    connect_time = time.perf_counter() - started
+    memory = {"rss_mb": f"{rss_mb() - rss:.1f}"}
+    if trace:
+        memory["traced_mb"] = (
+            f"{tracemalloc.get_traced_memory()[0] / 2 ** 20:.1f}")
+        tracemalloc.stop()
+    channel_layer.group_add = group_add
+    report("connect", mode=mode, sockets=len(sockets), chats=len(chats),
+           seconds=f"{connect_time:.1f}", queries=queries.count,
+           memberships=memberships, **memory)
+
+    drains = [asyncio.create_task(drain(socket)) for socket in sockets]
+    picks = random.Random(1).choices(chats, k=messages)
+    started = time.perf_counter()
+    for chat in picks:
+        await post_message(channel_layer, str(chat.id), bot.id, agent.id,
+                           "agent", "Load")
+    while frames < messages and time.perf_counter() - started < 300:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    report("deliver", mode=mode, chats=len(chats), messages=messages,
+           frames=f"{frames}/{messages}", seconds=f"{elapsed:.1f}",
+           per_message_ms=f"{elapsed / messages * 1000:.2f}")
+
+    for task in drains:
+        task.cancel()
+    for socket in sockets:
+        await socket.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=["multiplex", "per-chat"],
+                        default="multiplex")
+    parser.add_argument("--chats", type=int, nargs="+",
+                        default=[1000, 10000])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--tracemalloc", action="store_true")
+    args = parser.parse_args()
+    with test_database():
+        for size in args.chats:
+            agent, bot, chats = seed(size)
+            asyncio.run(run(args.mode, args.messages, agent, bot, chats,
+                            args.tracemalloc))
+
+
+if __name__ == "__main__":
+    main()
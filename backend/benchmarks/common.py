@@ -0,0 +1,94 @@
+"""
+Shared setup of the benchmark scripts. They use the project settings
+(DJANGO_SETTINGS_MODULE, config.settings by default), so Redis and the
+database are the ones of the deployment under test, but they seed a
+throwaway test database which is created and dropped like in the test
+runner.
+"""
+import os
+import statistics
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+def setup_django() -> None:
+    sys.path.insert(0, str(APP_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    from django.db import connection
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        # sync_to_async code keeps a connection open in asgiref's thread,
+        # PostgreSQL refuses to drop a database that is still in use
+        from asgiref.sync import SyncToAsync
+        from django.db import connections
+        SyncToAsync.single_thread_executor.submit(
+            connections.close_all).result()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_agents(count: int, prefix: str = "bench") -> list:
+    """Agents with their UserModel rows, without a save() per agent."""
+    from apps.agents.models import AgentModel
+    from apps.users.models import UserModel
+    agents = AgentModel.objects.bulk_create([
+        AgentModel(username=f"{prefix}{i}", email=f"{prefix}{i}@bench.io",
+                   name="Bench", surname="Agent")
+        for i in range(count)
+    ])
+    UserModel.objects.bulk_create([
+        UserModel(id=agent.id, username=agent.username, type="agent")
+        for agent in agents
+    ])
+    return agents
+
+
+def seed_client(telegram_id: int = 1):
+    from apps.clients.models import ClientModel
+    return ClientModel.objects.create(telegram_id=str(telegram_id),
+                                      name="Bench")
+
+
+class QueryCounter:
+    """Counts the queries of all connections and threads, async code too."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        from django.db.backends.utils import CursorWrapper
+        self._execute = CursorWrapper._execute
+        counter = self
+
+        def _execute(cursor, *args, **kwargs):
+            counter.count += 1
+            return counter._execute(cursor, *args, **kwargs)
+
+        CursorWrapper._execute = _execute
+        return self
+
+    def __exit__(self, *exc_info):
+        from django.db.backends.utils import CursorWrapper
+        CursorWrapper._execute = self._execute
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if len(samples) < 2:
+        return samples[0] if samples else 0.0
+    return statistics.quantiles(samples, n=100)[int(pct) - 1]
+
+
+def report(name: str, **values) -> None:
+    fields = " ".join(f"{key}={value}" for key, value in values.items())
+    print(f"{name:<24} {fields}")
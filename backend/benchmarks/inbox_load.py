@@ -0,0 +1,165 @@
+"""
+Inbox load test (ws/inbox/ vs one ws/chat/<id>/ socket per chat).
+
+AGENTS agents in GROUPS groups, BOTS_PER_GROUP bots per group and
+CHATS_PER_BOT open chats per bot. Every agent opens either one inbox
+socket or a chat socket for each chat of its groups, then MESSAGES client
+messages are posted to random chats. Reports the connect time, chat
+access checks, channel group memberships, Redis commands and the time
+until every frame reached its sockets.
+
+Needs a channels_redis CHANNEL_LAYERS (REDIS_URL), like production:
+
+    python benchmarks/inbox_load.py --mode inbox
+    python benchmarks/inbox_load.py --mode chat
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+
+from common import (report, seed_agents, seed_client, setup_django,
+                    test_database)
+
+setup_django()
+
+import redis.asyncio.connection  # noqa: E402
+from channels.layers import get_channel_layer  # noqa: E402
+from channels.testing import WebsocketCommunicator  # noqa: E402
+
+import api.v1.chats.consumers as consumers  # noqa: E402
+from apps.groups.models import BotModel, GroupModel, RequestModel  # noqa
+from config.middleware import ScopeUser  # noqa: E402
+
+GROUPS, BOTS_PER_GROUP, CHATS_PER_BOT = 10, 2, 25
+
+# Every command channels_redis sends, by name
+redis_commands = Counter()
+pack_command = redis.asyncio.connection.Connection.pack_command
+
+
+def counted_pack_command(self, *args):
+    redis_commands[str(args[0]).split()[0].upper()] += 1
+    return pack_command(self, *args)
+
+
+redis.asyncio.connection.Connection.pack_command = counted_pack_command
+
+access_checks = 0
+has_chat_access = consumers.has_chat_access
+
+
+def counted_has_chat_access(user, chat_id):
+    global access_checks
+    access_checks += 1
+    return has_chat_access(user, chat_id)
+
+
+consumers.has_chat_access = counted_has_chat_access
+
+
+def seed(agent_count: int):
+    client = seed_client()
+    agents = seed_agents(agent_count, prefix="inbox")
+    layout = []
+    for index in range(GROUPS):
+        group = GroupModel.objects.create(owner=agents[0],
+                                          name=f"inbox{index}")
+        bots = BotModel.objects.bulk_create([
+            BotModel(name=f"inbox{index}-{number}")
+            for number in range(BOTS_PER_GROUP)
+        ])
+        group.bots.add(*bots)
+        members = agents[index::GROUPS]
+        group.agents.add(*members)
+        chats = RequestModel.objects.bulk_create([
+            RequestModel(client=client, bot=bot, theme="Load")
+            for bot in bots for _ in range(CHATS_PER_BOT)
+        ])
+        layout.append((members, chats))
+    return client, layout
+
+
+async def connect(path, consumer, user, chat_id=None):
+    communicator = WebsocketCommunicator(consumer.as_asgi(), path)
+    communicator.scope["user"] = user
+    if chat_id:
+        communicator.scope["url_route"] = {"kwargs": {"chat_id": chat_id}}
+    connected, _ = await communicator.connect(timeout=30)
+    assert connected, path
+    return communicator
+
+
+async def run(mode: str, messages: int, client, layout) -> None:
+    channel_layer = get_channel_layer()
+    frames = 0
+
+    async def drain(communicator):
+        nonlocal frames
+        while True:
+            output = await communicator.output_queue.get()
+            if output.get("type") == "websocket.send":
+                frames += 1
+
+    sockets, drains = [], []
+    listeners = Counter()
+    redis_commands.clear()
+    started = time.perf_counter()
+    for members, chats in layout:
+        for agent in members:
+            user = ScopeUser(id=agent.id, type="agent")
+            if mode == "inbox":
+                sockets.append(await connect("/ws/inbox/",
+                                             consumers.InboxConsumer, user))
+            else:
+                for chat in chats:
+                    sockets.append(await connect(
+                        f"/ws/chat/{chat.id}/", consumers.ChatConsumer,
+                        user, str(chat.id)))
+        for chat in chats:
+            listeners[chat.id] += len(members)
+    connect_time = time.perf_counter() - started
+    connect_commands = sum(redis_commands.values())
+    drains = [asyncio.create_task(drain(socket)) for socket in sockets]
+    report("connect", mode=mode, sockets=len(sockets),
+           seconds=f"{connect_time:.1f}", access_checks=access_checks,
+           memberships=redis_commands["ZADD"],
+           redis_commands=connect_commands)
+
+    all_chats = [chat for _, chats in layout for chat in chats]
+    picks = random.Random(1).choices(all_chats, k=messages)
+    expected = sum(listeners[chat.id] for chat in picks)
+    redis_commands.clear()
+    started = time.perf_counter()
+    for chat in picks:
+        await consumers.post_message(channel_layer, str(chat.id),
+                                     chat.bot_id, client.id, "client",
+                                     "Load")
+    while frames < expected and time.perf_counter() - started < 300:
+        await asyncio.sleep(0.05)
+    deliver_time = time.perf_counter() - started
+    report("deliver", mode=mode, messages=messages,
+           frames=f"{frames}/{expected}", seconds=f"{deliver_time:.1f}",
+           redis_commands_per_message=(
+               f"{sum(redis_commands.values()) / messages:.1f}"))
+
+    for task in drains:
+        task.cancel()
+    for socket in sockets:
+        await socket.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=["inbox", "chat"], default="inbox")
+    parser.add_argument("--agents", type=int, default=500)
+    parser.add_argument("--messages", type=int, default=500)
+    args = parser.parse_args()
+    with test_database():
+        client, layout = seed(args.agents)
+        asyncio.run(run(args.mode, args.messages, client, layout))
+
+
+if __name__ == "__main__":
+    main()
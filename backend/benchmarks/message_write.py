@@ -0,0 +1,85 @@
+"""
+Chat message throughput, per-message INSERT vs write-behind.
+
+SENDERS concurrent senders post MESSAGES messages each through
+post_message, the path of ChatConsumer and BotConsumer, to their own
+chats. Reports messages per second until the last post_message returned
+and until the last row was in the database, and the p50/p99 latency of a
+single post_message call.
+
+    python benchmarks/message_write.py --senders 50 --messages 200
+"""
+import argparse
+import asyncio
+import time
+
+from common import (percentile, report, seed_agents, seed_client,
+                    setup_django, test_database)
+
+setup_django()
+
+from channels.layers import get_channel_layer  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from api.v1.chats.consumers import post_message  # noqa: E402
+from api.v1.chats.writer import message_writer  # noqa: E402
+from apps.groups.models import BotModel, MessageModel, RequestModel  # noqa
+
+
+def seed(senders: int):
+    client = seed_client()
+    agents = seed_agents(senders, prefix="writer")
+    bot = BotModel.objects.create(name="Writer")
+    chats = RequestModel.objects.bulk_create([
+        RequestModel(client=client, bot=bot, theme="Write")
+        for _ in agents
+    ])
+    return bot, list(zip(agents, chats))
+
+
+async def run(write_behind: bool, messages: int, bot, pairs) -> None:
+    channel_layer = get_channel_layer()
+    latencies = []
+
+    async def sender(agent, chat):
+        for number in range(messages):
+            started = time.perf_counter()
+            await post_message(channel_layer, str(chat.id), bot.id,
+                               agent.id, "agent", f"Message {number}")
+            latencies.append(time.perf_counter() - started)
+
+    total = messages * len(pairs)
+    before = await MessageModel.objects.acount()
+    with override_settings(CHAT_WRITE_BEHIND=write_behind):
+        started = time.perf_counter()
+        await asyncio.gather(*(sender(agent, chat) for agent, chat in pairs))
+        sent = time.perf_counter() - started
+        await message_writer.flush()
+        stored = time.perf_counter() - started
+    written = await MessageModel.objects.acount() - before
+    report("write-behind" if write_behind else "per-message",
+           messages=f"{written}/{total}",
+           sent_per_s=f"{total / sent:.0f}",
+           stored_per_s=f"{total / stored:.0f}",
+           p50_ms=f"{percentile(latencies, 50) * 1000:.2f}",
+           p99_ms=f"{percentile(latencies, 99) * 1000:.2f}")
+
+
+async def run_all(messages: int, bot, pairs) -> None:
+    # One event loop, the writer's lock and tasks are bound to it
+    for write_behind in (False, True):
+        await run(write_behind, messages, bot, pairs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=200)
+    args = parser.parse_args()
+    with test_database():
+        bot, pairs = seed(args.senders)
+        asyncio.run(run_all(args.messages, bot, pairs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+WebSocket handshake latency through the full ASGI stack.
+
+Opens COUNT chat sockets at RATE handshakes per second and closes each
+right after the handshake. Caches are warmed with a first round, like a
+running server. Reports achieved rate, p50/p99 handshake latency and
+queries per handshake.
+
+By default the sockets go to the project's ASGI application in-process
+(AuthMiddleware included, no network), an approximation that leaves out
+the server, its HTTP parsing and the TCP round trips. With --daphne the
+script starts the server like the Dockerfile does (`manage.py runserver`,
+which is daphne's) on a free port and opens real sockets; queries run in
+the server process then and are not counted. The server uses the seeded
+test database, so --daphne needs a database server (SQLite's in-memory
+test database is not shared).
+
+    python benchmarks/ws_handshake.py --auth jwt --rate 250
+    python benchmarks/ws_handshake.py --auth secure-key --rate 1000
+    python benchmarks/ws_handshake.py --auth jwt --rate 250 --daphne
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from common import (APP_DIR, QueryCounter, percentile, report,
+                    seed_agents, seed_client, setup_django, test_database)
+
+setup_django()
+
+from channels.testing import WebsocketCommunicator  # noqa: E402
+from rest_framework_simplejwt.tokens import AccessToken  # noqa: E402
+
+from apps.groups.models import BotModel, GroupModel, RequestModel  # noqa
+from config.asgi import application  # noqa: E402
+
+CHATS = 200
+
+
+def seed():
+    client = seed_client()
+    [agent] = seed_agents(1, prefix="handshake")
+    bot = BotModel.objects.create(name="Handshake")
+    group = GroupModel.objects.create(owner=agent, name="Handshake")
+    group.bots.add(bot)
+    group.agents.add(agent)
+    chats = RequestModel.objects.bulk_create([
+        RequestModel(client=client, bot=bot, theme="Handshake")
+        for _ in range(CHATS)
+    ])
+    return agent, bot, chats
+
+
+def jwt_paths(agent, chats) -> list[str]:
+    token = AccessToken.for_user(agent)
+    return [f"/ws/chat/{chat.id}/?token={token}" for chat in chats]
+
+
+def secure_key_paths(bot, chats) -> list[str]:
+    """Per-chat bot sockets, keyed like the bot's generate_secure_token."""
+    paths = []
+    for chat in chats:
+        digest = hmac.new(str(bot.secret_key).encode(),
+                          str(chat.client.telegram_id).encode(),
+                          hashlib.sha256).digest()
+        secure_key = base64.urlsafe_b64encode(digest).decode()
+        paths.append(f"/ws/chat/{chat.id}/?secure_key={secure_key}")
+    return paths
+
+
+async def asgi_handshake(path: str) -> tuple[bool, float]:
+    communicator = WebsocketCommunicator(application, path)
+    started = time.perf_counter()
+    connected, _ = await communicator.connect(timeout=30)
+    latency = time.perf_counter() - started
+    if connected:
+        await communicator.disconnect()
+    return connected, latency
+
+
+def socket_handshake(port: int):
+    """Handshake over TCP; daphne answers 101 once the consumer accepts."""
+    host = f"127.0.0.1:{port}"
+
+    async def handshake(path: str) -> tuple[bool, float]:
+        key = base64.b64encode(os.urandom(16)).decode()
+        started = time.perf_counter()
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(
+            f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+            f"Upgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+            f"Origin: http://{host}\r\n\r\n".encode())
+        response = await reader.readuntil(b"\r\n\r\n")
+        latency = time.perf_counter() - started
+        connected = response.split(None, 2)[1] == b"101"
+        if connected:
+            # Masked close frame without a payload
+            writer.write(b"\x88\x80" + os.urandom(4))
+        writer.close()
+        await writer.wait_closed()
+        return connected, latency
+
+    return handshake
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_daphne(port: int) -> subprocess.Popen:
+    from django.db import connection
+    # Settings read the database name from DB_NAME, point it at the
+    # seeded test database
+    env = dict(os.environ, DB_NAME=connection.settings_dict["NAME"])
+    process = subprocess.Popen(
+        [sys.executable, "manage.py", "runserver", "--noreload",
+         f"127.0.0.1:{port}"],
+        cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("daphne did not start")
+
+
+async def handshakes(paths: list[str], count: int, rate: float,
+                     connect=asgi_handshake):
+    latencies, failures = [], 0
+
+    async def handshake(path):
+        nonlocal failures
+        connected, latency = await connect(path)
+        latencies.append(latency)
+        if not connected:
+            failures += 1
+
+    tasks = []
+    started = time.perf_counter()
+    for number in range(count):
+        tasks.append(asyncio.create_task(
+            handshake(paths[number % len(paths)])))
+        delay = started + (number + 1) / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+    await asyncio.gather(*tasks)
+    return time.perf_counter() - started, latencies, failures
+
+
+async def run(paths: list[str], auth: str, count: int, rate: float,
+              port: int | None = None) -> None:
+    connect = socket_handshake(port) if port else asgi_handshake
+    await handshakes(paths, len(paths), rate, connect)
+    with QueryCounter() as queries:
+        elapsed, latencies, failures = await handshakes(paths, count, rate,
+                                                        connect)
+    report(f"handshake {auth}", server="daphne" if port else "in-process",
+           offered_per_s=rate,
+           achieved_per_s=f"{count / elapsed:.0f}", failures=failures,
+           p50_ms=f"{percentile(latencies, 50) * 1000:.1f}",
+           p99_ms=f"{percentile(latencies, 99) * 1000:.1f}",
+           queries_per_handshake=("n/a" if port
+                                  else f"{queries.count / count:.2f}"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--auth", choices=["jwt", "secure-key"],
+                        default="jwt")
+    parser.add_argument("--count", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=250)
+    parser.add_argument("--daphne", action="store_true",
+                        help="real sockets to a daphne server")
+    args = parser.parse_args()
+    with test_database():
+        agent, bot, chats = seed()
+        if args.auth == "jwt":
+            paths = jwt_paths(agent, chats)
+        else:
+            paths = secure_key_paths(bot, chats)
+        if not args.daphne:
+            asyncio.run(run(paths, args.auth, args.count, args.rate))
+            return
+        port = free_port()
+        server = start_daphne(port)
+        try:
+            asyncio.run(run(paths, args.auth, args.count, args.rate, port))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
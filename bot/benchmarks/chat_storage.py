@@ -0,0 +1,121 @@
+"""
+ChatStorage operation latency by store size, SQLite store vs the JSON file.
+
+For every size the SQLite ChatStorage and a copy of the former JSON file
+storage are filled with that many chats (every other one solved), then
+find_chat (the message hot path), chat_exists and add_chat are timed.
+The store is opened once per size, so startup time is reported too.
+
+    python benchmarks/chat_storage.py --sizes 1000 10000 50000 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parent.parent / "bot"
+
+
+class JsonChatStorage:
+    """The JSON file storage ChatStorage replaced, kept for comparison."""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def add_chat(self, chat_id, telegram_id):
+        chats = self.get_all_chats()
+        chats.append({"id": chat_id, "user_id": telegram_id,
+                      "is_solved": False})
+        with open(self.file_path, "w") as f:
+            json.dump({"chats": chats}, f, indent=4)
+
+    def find_chat(self, telegram_id):
+        for chat in self.get_all_chats():
+            if (chat.get('user_id') == telegram_id
+                    and chat.get('is_solved') is False):
+                return chat
+        return None
+
+    def get_all_chats(self):
+        with open(self.file_path, "r") as f:
+            return json.load(f).get("chats", [])
+
+    def chat_exists(self, chat_id):
+        return any(chat["id"] == chat_id for chat in self.get_all_chats())
+
+
+def timed(operation, args_list) -> float:
+    """Mean microseconds per call."""
+    started = time.perf_counter()
+    for args in args_list:
+        operation(*args)
+    return (time.perf_counter() - started) / len(args_list) * 1e6
+
+
+def make_chats(size: int) -> list[dict]:
+    return [{"id": str(uuid.uuid4()), "user_id": 100000 + index,
+             "is_solved": bool(index % 2)} for index in range(size)]
+
+
+def open_sqlite(workdir: str, chats: list[dict]):
+    from utils.chat_storage import ChatStorage
+
+    # Filled through the JSON import, the way existing stores are migrated
+    legacy_file = os.path.join(workdir, "chats.json")
+    with open(legacy_file, "w") as f:
+        json.dump({"chats": chats}, f)
+    ChatStorage(os.path.join(workdir, "chats.db"), legacy_file)._conn.close()
+    started = time.perf_counter()
+    storage = ChatStorage(os.path.join(workdir, "chats.db"), None)
+    return storage, time.perf_counter() - started
+
+
+def run(size: int, calls: int) -> None:
+    workdir = tempfile.mkdtemp(prefix="chat-storage-")
+    chats = make_chats(size)
+    random.seed(size)
+    users = [(random.choice(chats)["user_id"],) for _ in range(calls)]
+    ids = [(random.choice(chats)["id"],) for _ in range(calls)]
+    new = [(str(uuid.uuid4()), 900000 + index) for index in range(calls)]
+
+    storage, startup = open_sqlite(workdir, chats)
+    json_file = os.path.join(workdir, "legacy.json")
+    with open(json_file, "w") as f:
+        json.dump({"chats": chats}, f, indent=4)
+    legacy = JsonChatStorage(json_file)
+
+    for name, store in (("sqlite", storage), ("json", legacy)):
+        # The JSON store rewrites the whole file per add, keep it short
+        adds = new if name == "sqlite" else new[:max(calls // 10, 1)]
+        print(f"{name:<7} chats={size:<7} "
+              f"find_chat={timed(store.find_chat, users):.1f}us "
+              f"chat_exists={timed(store.chat_exists, ids):.1f}us "
+              f"add_chat={timed(store.add_chat, adds):.1f}us"
+              + (f" startup={startup * 1000:.0f}ms"
+                 if name == "sqlite" else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[1000, 10000, 50000, 100000])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    # utils imports bot_create, which needs a token and writes logs/
+    os.chdir(tempfile.mkdtemp(prefix="chat-storage-"))
+    os.makedirs("logs")
+    sys.path.insert(0, str(BOT_DIR))
+    os.environ.setdefault("BOT_TOKEN", "123456:" + "A" * 35)
+    os.environ.setdefault("LOGGING_LEVEL", "WARNING")
+    for size in args.sizes:
+        run(size, args.calls)
+
+
+if __name__ == "__main__":
+    main()
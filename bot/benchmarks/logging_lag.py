@@ -0,0 +1,98 @@
+"""
+Event loop lag caused by logging, sync handlers vs the queue pipeline.
+
+A coroutine logs RECORDS INFO records in bursts of BURST per loop tick,
+the way a busy socket reader does, while a monitor measures how late a
+5 ms sleep wakes up. Reports the loop lag (p50/p99/max) and how long the
+producer kept the loop busy for:
+
+  - sync:  file and console handlers called on the loop (LOG_ASYNC=False)
+  - queue: records put on a queue, written by the listener thread
+  - rate:  queue mode with the logger rate limited to RATE per second
+
+Every mode runs in its own process, ProjectLogger is set up at import.
+Console output goes to /dev/null, the file to a throwaway logs/.
+
+    python benchmarks/logging_lag.py --records 20000 --burst 100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parent.parent / "bot"
+MODES = ("sync", "queue", "rate")
+TICK = 0.005
+
+
+async def monitor(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - started - TICK) * 1000)
+
+
+async def produce(logger, records: int, burst: int) -> None:
+    for tick in range(records // burst):
+        for index in range(burst):
+            logger.info(f"Sent WS message to chat {tick}-{index}: "
+                        + "x" * 80)
+        await asyncio.sleep(0)
+
+
+async def run(mode: str, records: int, burst: int, rate: float) -> None:
+    from utils import PL, get_logger
+
+    logger = get_logger("Bench", rate_limit=rate if mode == "rate" else None)
+    lags = []
+    stop = asyncio.Event()
+    monitoring = asyncio.create_task(monitor(lags, stop))
+    started = time.perf_counter()
+    await produce(logger, records, burst)
+    busy = time.perf_counter() - started
+    stop.set()
+    await monitoring
+    PL.stop()
+
+    lags.sort()
+    # stdout is the console handler's, results go to stderr
+    print(f"{mode:<6} records={records} busy={busy * 1000:.0f}ms "
+          f"lag p50={statistics.median(lags):.2f}ms "
+          f"p99={lags[int(len(lags) * 0.99)]:.2f}ms max={lags[-1]:.2f}ms",
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mode", choices=MODES + ("all",), default="all")
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--burst", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=50,
+                        help="records per second in rate mode")
+    args = parser.parse_args()
+
+    if args.mode == "all":
+        for mode in MODES:
+            subprocess.run([sys.executable, __file__, "--mode", mode,
+                            "--records", str(args.records),
+                            "--burst", str(args.burst),
+                            "--rate", str(args.rate)],
+                           stdout=subprocess.DEVNULL, check=True)
+        return
+
+    os.chdir(tempfile.mkdtemp(prefix="logging-lag-"))
+    os.makedirs("logs")
+    sys.path.insert(0, str(BOT_DIR))
+    os.environ.setdefault("BOT_TOKEN", "123456:" + "A" * 35)
+    os.environ["LOGGING_LEVEL"] = "INFO"
+    os.environ["LOG_ASYNC"] = str(args.mode != "sync")
+    asyncio.run(run(args.mode, args.records, args.burst, args.rate))
+
+
+if __name__ == "__main__":
+    main()
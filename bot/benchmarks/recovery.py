@@ -0,0 +1,230 @@
+"""
+Startup recovery timing (handlers.request.restore_chats).
+
+Fills a throwaway chat store with CHATS unsolved chats and serves their
+history from a fake backend (get-chat-messages/ and the ws/bot/ socket)
+with API_LATENCY ms per call. Every MISSED_EVERY-th chat has MISSED agent
+messages newer than its last delivered one, and UNANCHORED chats never
+had a message delivered (last_message_id NULL) but have a history longer
+than one page. LIVE of the chats with missed messages get one more agent
+message over the socket right after subscribing, while their catch-up
+is still waiting. Telegram is replaced by a counter.
+
+Reports when all chats were subscribed, when the catch-up finished and
+when the last message was handed to Telegram, and checks that every
+missed message was sent once, that live messages came after the missed
+ones, and that last_message_id was stored for every chat that got one.
+
+    python benchmarks/recovery.py --chats 10000 --api-latency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from aiohttp import web
+
+BOT_DIR = Path(__file__).resolve().parent.parent / "bot"
+PAGE_SIZE = 100
+SECRET = str(uuid.uuid4())
+
+
+class FakeBackend:
+    """Keyset pages over in-memory chat histories, oldest first."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.histories: dict[str, list[dict]] = {}
+        self.calls = 0
+        self.subscribed: set[str] = set()
+        self.subscribed_at: float | None = None
+        self.expected_subscriptions = 0
+        # chat_id -> message pushed live right after the subscription
+        self.live: dict[str, dict] = {}
+
+    def add_history(self, chat_id: str, messages: int, user_type="agent"):
+        history = [{"id": str(uuid.uuid4()), "text": f"Message {index}",
+                    "user_type": user_type}
+                   for index in range(messages)]
+        self.histories[chat_id] = history
+        return history
+
+    def page(self, history, start, end) -> dict:
+        start, end = max(start, 0), min(end, len(history))
+        return {
+            "chat_info": {"is_solved": False},
+            "messages": history[start:end],
+            # next: older rows, prev: newer rows, like the backend
+            "next": f"before:{start}" if start > 0 else None,
+            "prev": f"after:{end}" if end < len(history) else None,
+        }
+
+    async def get_chat_messages(self, request: web.Request):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        data = await request.json()
+        history = self.histories.get(data["chat_id"], [])
+        if data.get("cursor"):
+            direction, position = data["cursor"].split(":")
+            position = int(position)
+            if direction == "before":
+                return web.json_response(
+                    self.page(history, position - PAGE_SIZE, position))
+            return web.json_response(
+                self.page(history, position, position + PAGE_SIZE))
+        if data.get("after_message_id"):
+            ids = [message["id"] for message in history]
+            start = ids.index(data["after_message_id"]) + 1
+            return web.json_response(
+                self.page(history, start, start + PAGE_SIZE))
+        return web.json_response(
+            self.page(history, len(history) - PAGE_SIZE, len(history)))
+
+    async def bot_socket(self, request: web.Request):
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        async for frame in socket:
+            data = json.loads(frame.data)
+            if data.get("action") == "subscribe":
+                self.subscribed.update(data["chat_ids"])
+                if (self.subscribed_at is None and len(self.subscribed)
+                        >= self.expected_subscriptions):
+                    self.subscribed_at = time.perf_counter()
+                await socket.send_json({"action": "subscribed",
+                                        "chat_ids": data["chat_ids"]})
+                for chat_id in data["chat_ids"]:
+                    if chat_id in self.live:
+                        message = self.live[chat_id]
+                        self.histories[chat_id].append(message)
+                        await socket.send_json({"chat_id": chat_id,
+                                                **message})
+        return socket
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/api/v1/chats/get-chat-messages/",
+                            self.get_chat_messages)
+        app.router.add_get("/ws/bot/", self.bot_socket)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/"
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.sends = 0
+        self.messages = 0
+        self.texts: dict[int, list[str]] = {}
+
+    async def send_message(self, chat_id, text, **kwargs):
+        # Short messages of a chat are merged into one send
+        self.sends += 1
+        self.messages += len(text.split("\n"))
+        self.texts.setdefault(chat_id, []).extend(text.split("\n"))
+
+
+def seed(request, backend, chats, missed_every, missed, unanchored, live):
+    """Returns {chat_id: [missed message ids]} and {chat_id: telegram id}."""
+    expected = {}
+    users = {}
+    for index in range(chats):
+        chat_id = str(uuid.uuid4())
+        request.storage.add_chat(chat_id, 100000 + index)
+        users[chat_id] = 100000 + index
+        if index < unanchored:
+            history = backend.add_history(chat_id, PAGE_SIZE * 2 + 10)
+            expected[chat_id] = [message["id"] for message in history]
+            continue
+        extra = missed if index % missed_every == 0 else 0
+        history = backend.add_history(chat_id, 1 + extra)
+        request.storage.set_last_message(chat_id, history[0]["id"])
+        if extra:
+            expected[chat_id] = [message["id"] for message in history[1:]]
+            if len(backend.live) < live:
+                message = {"id": str(uuid.uuid4()), "text": "Live",
+                           "user_type": "agent"}
+                backend.live[chat_id] = message
+                expected[chat_id].append(message["id"])
+    return expected, users
+
+
+async def run(args) -> None:
+    backend = FakeBackend(args.api_latency / 1000)
+    os.environ["BACKEND_URL"] = await backend.start()
+
+    from handlers import request
+    from utils.backoff import TokenBucket
+
+    telegram = FakeTelegram()
+    request.sender.bot = telegram
+    if args.unpaced:
+        request.sender._global = TokenBucket(rate=1e6, capacity=10 ** 6)
+    expected, users = seed(request, backend, args.chats, args.missed_every,
+                           args.missed, args.unanchored, args.live)
+    backend.expected_subscriptions = args.chats
+
+    started = time.perf_counter()
+    await request.restore_chats()
+    restored = time.perf_counter() - started
+    while request.sender.pending or request.sender._tasks:
+        await asyncio.sleep(0.05)
+    sent = time.perf_counter() - started
+    await request.flush_delivered()
+
+    stored = {chat["id"]: chat["last_message_id"]
+              for chat in request.storage.get_unsolved_chats()}
+    missed_total = sum(len(ids) for ids in expected.values())
+    last_ok = sum(stored[chat_id] == ids[-1]
+                  for chat_id, ids in expected.items())
+    live_last = sum(telegram.texts.get(users[chat_id], [""])[-1] == "Live"
+                    for chat_id in backend.live)
+    subscribed = (backend.subscribed_at or time.perf_counter()) - started
+    print(f"chats={args.chats} subscribed={len(backend.subscribed)} "
+          f"in {subscribed:.2f}s")
+    print(f"catch-up {restored:.2f}s, {backend.calls} API calls "
+          f"at {args.api_latency:.0f}ms, concurrency "
+          f"{request.RESTORE_CONCURRENCY}")
+    print(f"delivered {telegram.messages}/{missed_total} missed messages "
+          f"in {telegram.sends} sends by {sent:.2f}s")
+    print(f"live message sent after the missed ones in "
+          f"{live_last}/{len(backend.live)} chats")
+    print(f"last_message_id stored for {last_ok}/{len(expected)} chats")
+    await request.connector.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chats", type=int, default=10000)
+    parser.add_argument("--missed-every", type=int, default=10)
+    parser.add_argument("--missed", type=int, default=2)
+    parser.add_argument("--unanchored", type=int, default=10)
+    parser.add_argument("--live", type=int, default=100,
+                        help="chats getting a live message during catch-up")
+    parser.add_argument("--api-latency", type=float, default=50,
+                        help="ms per get-chat-messages call")
+    parser.add_argument("--unpaced", action="store_true",
+                        help="lift the 30 messages/s Telegram limit")
+    args = parser.parse_args()
+
+    # Throwaway store and logs, the bot's modules use relative paths
+    workdir = tempfile.mkdtemp(prefix="recovery-")
+    os.makedirs(os.path.join(workdir, "utils"))
+    os.makedirs(os.path.join(workdir, "logs"))
+    os.chdir(workdir)
+    sys.path.insert(0, str(BOT_DIR))
+    os.environ.setdefault("BOT_TOKEN", "123456:" + "A" * 35)
+    os.environ.setdefault("API_SECURITY_KEY", SECRET)
+    os.environ.setdefault("LOGGING_LEVEL", "WARNING")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
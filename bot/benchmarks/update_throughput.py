@@ -0,0 +1,189 @@
+"""
+Update throughput of long polling vs the webhook app (BOT_MODE).
+
+Runs the bot (main.py) against a fake Telegram Bot API server through
+TELEGRAM_API_URL. The server hands out UPDATES /start messages from
+USERS users, in getUpdates batches of 100 for polling or pushed to the
+webhook by CONCURRENCY parallel requests, and counts the sendMessage
+answers. Reports updates per second from the first update to the last
+answer, and how many log files the run left behind (webhook workers
+write through the web process, so one).
+
+    python benchmarks/update_throughput.py polling webhook:1 webhook:4
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from aiohttp import ClientSession, web
+
+BOT_DIR = Path(__file__).resolve().parent.parent / "bot"
+SECRET = "benchmark"
+BATCH = 100
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def make_update(index: int, users: int) -> dict:
+    user_id = 1000 + index % users
+    return {"update_id": index + 1, "message": {
+        "message_id": index + 1, "date": 0, "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "User"},
+    }}
+
+
+class FakeTelegram:
+    """Bot API methods the bot calls, answered from memory."""
+
+    def __init__(self, updates: int, users: int, concurrency: int):
+        self.updates = updates
+        self.users = users
+        self.concurrency = concurrency
+        self.answers = 0
+        self.started: float | None = None
+        self.done = asyncio.Event()
+        self.pushing = None
+
+    async def push(self, url: str, secret: str | None):
+        # Give the workers time to start, polling starts at the first call
+        await asyncio.sleep(2)
+        self.started = time.perf_counter()
+        slots = asyncio.Semaphore(self.concurrency)
+        headers = {"X-Telegram-Bot-Api-Secret-Token": secret or ""}
+        async with ClientSession() as session:
+
+            async def one(index):
+                async with slots:
+                    async with session.post(
+                            url, json=make_update(index, self.users),
+                            headers=headers) as response:
+                        assert response.status == 200, response.status
+
+            await asyncio.gather(*(one(index)
+                                   for index in range(self.updates)))
+
+    async def get_updates(self, data) -> list:
+        if self.started is None:
+            self.started = time.perf_counter()
+        offset = int(data.get("offset") or 1) - 1
+        if offset >= self.updates:
+            await asyncio.sleep(1)
+            return []
+        return [make_update(index, self.users)
+                for index in range(offset, min(self.updates,
+                                               offset + BATCH))]
+
+    async def api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = await request.post()
+        result = True
+        if method == "getupdates":
+            result = await self.get_updates(data)
+        elif method == "setwebhook":
+            self.pushing = asyncio.create_task(
+                self.push(data["url"], data.get("secret_token")))
+        elif method == "sendmessage":
+            self.answers += 1
+            if self.answers >= self.updates:
+                self.done.set()
+            result = {"message_id": self.answers, "date": 0, "text": "",
+                      "chat": {"id": int(data["chat_id"]),
+                               "type": "private"}}
+        elif method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "Bot",
+                      "username": "bot"}
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.api)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+
+def start_bot(api_url: str, mode: str, workers: int, log_level: str):
+    # Throwaway chat store and logs, the bot uses relative paths
+    workdir = tempfile.mkdtemp(prefix="update-throughput-")
+    os.makedirs(os.path.join(workdir, "utils"))
+    os.makedirs(os.path.join(workdir, "logs"))
+    port = free_port()
+    env = dict(os.environ, BOT_TOKEN="123456:" + "A" * 35,
+               LOGGING_LEVEL=log_level, TELEGRAM_API_URL=api_url,
+               BACKEND_URL=f"http://127.0.0.1:{free_port()}/",
+               API_SECURITY_KEY=SECRET, BOT_MODE=mode,
+               WEBHOOK_WORKERS=str(workers), WEBHOOK_HOST="127.0.0.1",
+               WEBHOOK_PORT=str(port), WEBHOOK_SECRET=SECRET,
+               WEBHOOK_URL=f"http://127.0.0.1:{port}")
+    process = subprocess.Popen([sys.executable, str(BOT_DIR / "main.py")],
+                               cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL)
+    return process, workdir
+
+
+def stop_bot(process: subprocess.Popen):
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+async def run(spec: str, args) -> None:
+    mode, _, workers = spec.partition(":")
+    workers = int(workers or 1)
+    telegram = FakeTelegram(args.updates, args.users, args.concurrency)
+    api_url = await telegram.start()
+    process, workdir = start_bot(api_url, mode, workers, args.log_level)
+    try:
+        await asyncio.wait_for(telegram.done.wait(), args.timeout)
+        elapsed = time.perf_counter() - telegram.started
+    except asyncio.TimeoutError:
+        elapsed = None
+    finally:
+        await asyncio.get_running_loop().run_in_executor(
+            None, stop_bot, process)
+    log_files = sorted(os.listdir(os.path.join(workdir, "logs")))
+    rate = f"{args.updates / elapsed:.0f} updates/s" if elapsed else "timeout"
+    print(f"{mode:<8} workers={workers} answers={telegram.answers}/"
+          f"{args.updates} {rate} logs={','.join(log_files)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("modes", nargs="*",
+                        default=["polling", "webhook:1", "webhook:4"],
+                        help="polling or webhook:<workers>")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50,
+                        help="parallel webhook pushes")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--timeout", type=float, default=120)
+    args = parser.parse_args()
+    for spec in args.modes:
+        asyncio.run(run(spec, args))
+
+
+if __name__ == "__main__":
+    main()
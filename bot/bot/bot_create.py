@@ -2,17 +2,45 @@ import os
 
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
+from aiogram.fsm.storage.memory import MemoryStorage
 
 from utils.project_logger import ProjectLogger
 
 PL = ProjectLogger(
     timezone=os.environ.get("TIMEZONE", "Europe/London"), debug=os.environ.get("DEBUG", False),
-    level=os.environ.get("LOGGING_LEVEL", "WARNING")
+    level=os.environ.get("LOGGING_LEVEL", "WARNING"),
+    async_mode=os.environ.get("LOG_ASYNC", "True") == "True",
+    max_bytes=int(os.environ.get("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+    backup_count=int(os.environ.get("LOG_BACKUP_COUNT", 5)),
+    rotate_when=os.environ.get("LOG_ROTATE_WHEN"),
 )
 logger = PL.start_logging()
 
-bot = Bot(token=os.environ.get("BOT_TOKEN"), default=DefaultBotProperties(
-    parse_mode=ParseMode.HTML))
+# Optional self-hosted Bot API server
+session = None
+if os.environ.get("TELEGRAM_API_URL"):
+    session = AiohttpSession(
+        api=TelegramAPIServer.from_base(os.environ["TELEGRAM_API_URL"])
+    )
 
-dp = Dispatcher()
+bot = Bot(token=os.environ.get("BOT_TOKEN"), session=session,
+          default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+
+
+def create_fsm_storage():
+    """
+    FSM states live in Redis when REDIS_URL is set, so they survive
+    restarts and are shared by webhook workers.
+    """
+    redis_url = os.environ.get("REDIS_URL")
+    if not redis_url:
+        return MemoryStorage()
+    from aiogram.fsm.storage.redis import RedisStorage
+
+    return RedisStorage.from_url(redis_url)
+
+
+dp = Dispatcher(storage=create_fsm_storage())
@@ -1,4 +1,4 @@
 from .start import start_router
-from .request import request_router
+from .request import request_router, start_recovery, flush_delivered
 
 handlers = [start_router, request_router]
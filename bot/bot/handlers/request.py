@@ -2,16 +2,191 @@ from aiogram import Router, Bot, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import CallbackQuery, Message
+from collections import deque
 import asyncio
+import os
+import time
 
+from utils import get_logger
 from utils.chat_storage import ChatStorage
 from utils.connector import Connector
+from utils.sender import TelegramSender
+# After utils: utils/__init__ itself imports bot_create
+from bot_create import bot as tg_bot, dp
 
 request_router = Router()
+logger = get_logger("Requests")
+
+RESTORE_CONCURRENCY = int(os.environ.get("RESTORE_CONCURRENCY", 20))
+# Delivered message ids are written to the store once per interval
+LAST_MESSAGE_FLUSH_INTERVAL = float(
+    os.environ.get("LAST_MESSAGE_FLUSH_INTERVAL", 1))
 
 # Singleton instances
 connector = Connector()
 storage = ChatStorage()
+sender = TelegramSender(tg_bot)
+
+
+async def on_chat_solved(chat_id: str):
+    """Drop a chat solved on the backend from the active chats."""
+    storage.mark_solved(chat_id)
+
+
+connector.on_chat_solved(on_chat_solved)
+
+# chat_id -> last message delivered since the previous flush
+delivered_messages: dict[str, str] = {}
+flush_task: asyncio.Task | None = None
+
+
+def remember_delivered(chat_id: str, message_id: str) -> None:
+    """Queue a chat's last delivered message for the next batched write."""
+    global flush_task
+    delivered_messages[chat_id] = message_id
+    if flush_task is None or flush_task.done():
+        flush_task = asyncio.create_task(
+            flush_delivered(LAST_MESSAGE_FLUSH_INTERVAL))
+
+
+async def flush_delivered(delay: float = 0) -> None:
+    """
+    Write the queued last_message_ids in one transaction, instead of a
+    commit on the event loop per delivered message. A crash loses at most
+    one interval: those messages are sent again by the next catch-up.
+    """
+    await asyncio.sleep(delay)
+    if delivered_messages:
+        storage.set_last_messages(dict(delivered_messages))
+        delivered_messages.clear()
+
+
+dp.shutdown.register(flush_delivered)
+
+
+class ChatDelivery:
+    """
+    WebSocket handler delivering agent messages of a chat to its Telegram
+    user. Delivery is queued so a slow chat never stalls the socket.
+
+    With hold=True live frames are kept back until release(): during the
+    startup catch-up they are newer than the missed messages, and sending
+    them first would both reorder the chat and move its stored
+    last_message_id back behind a message already delivered.
+    """
+
+    def __init__(self, chat_id: str, telegram_id: int, hold: bool = False):
+        self.chat_id = chat_id
+        self.telegram_id = telegram_id
+        # After a restart a message can come both live and from the catch-up
+        self.seen = deque(maxlen=100)
+        self.held: list[dict] | None = [] if hold else None
+
+    async def __call__(self, data: dict):
+        if self.held is not None:
+            self.held.append(data)
+            return
+        self.deliver(data)
+
+    def deliver(self, data: dict) -> bool:
+        text = data.get("text")
+        message_id = data.get("id")
+        if not text or (message_id and message_id in self.seen):
+            return False
+        if message_id:
+            self.seen.append(message_id)
+        sender.send(self.telegram_id, text,
+                    on_delivered=self.delivered(message_id)
+                    if message_id else None)
+        return True
+
+    def delivered(self, message_id: str):
+        return lambda: remember_delivered(self.chat_id, message_id)
+
+    def release(self) -> None:
+        """Deliver the held live frames and stop holding."""
+        held, self.held = self.held or [], None
+        for data in held:
+            self.deliver(data)
+
+
+async def fetch_missed_messages(chat: dict, handler: ChatDelivery) -> int:
+    """Deliver agent messages sent after the chat's last delivered one."""
+    delivered = 0
+    anchor = chat["last_message_id"] or None
+    result = await connector.get_chat_messages(
+        chat["id"], after_message_id=anchor, include_info=True
+    )
+    info = (result or {}).get("chat_info") or {}
+    # From an anchor pages go forward (prev is newer). Without one nothing
+    # was delivered yet: start at the newest page and go back (next is
+    # older) to the first message, then deliver oldest first.
+    pages = []
+    while result:
+        pages.append(result.get("messages", []))
+        cursor = result.get("prev") if anchor else result.get("next")
+        if not cursor:
+            break
+        result = await connector.get_chat_messages(chat["id"], cursor=cursor)
+    if not anchor:
+        pages.reverse()
+    for messages in pages:
+        for message in messages:
+            if message.get("user_type") == "agent":
+                delivered += handler.deliver(message)
+    if info.get("is_solved"):
+        # Solved while we were down, the socket will never tell us
+        storage.mark_solved(chat["id"])
+        await connector.disconnect_websocket(chat["id"])
+    return delivered
+
+
+async def restore_chats(worker: int = 0, workers: int = 1):
+    """
+    Startup recovery: listen to every unsolved chat again, then catch up
+    on agent messages sent while the bot was down. With several webhook
+    workers each one restores the chats of its own users.
+    """
+    started = time.perf_counter()
+    chats = [chat for chat in storage.get_unsolved_chats()
+             if chat["user_id"] % workers == worker]
+    handlers = {}
+    for chat in chats:
+        # '' marks chats stored before delivery tracking: nothing to anchor
+        # on, so there is no catch-up to wait for
+        handlers[chat["id"]] = ChatDelivery(
+            chat["id"], chat["user_id"], hold=chat["last_message_id"] != "")
+        await connector.connect_websocket(
+            chat_id=chat["id"],
+            user_id=chat["user_id"],
+            message_handler=handlers[chat["id"]]
+        )
+
+    semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+    async def catch_up(chat: dict) -> int:
+        handler = handlers[chat["id"]]
+        try:
+            async with semaphore:
+                return await fetch_missed_messages(chat, handler)
+        finally:
+            handler.release()
+
+    delivered = await asyncio.gather(*(
+        catch_up(chat) for chat in chats if chat["last_message_id"] != ""
+    ))
+    logger.info(f"Restored {len(chats)} chats, delivered {sum(delivered)} "
+                f"missed messages in {time.perf_counter() - started:.2f}s")
+
+
+recovery_tasks = set()
+
+
+def start_recovery(worker: int = 0, workers: int = 1):
+    """Run restore_chats() in the background while updates are served."""
+    task = asyncio.create_task(restore_chats(worker, workers))
+    recovery_tasks.add(task)
+    task.add_done_callback(recovery_tasks.discard)
 
 
 class RequestStates(StatesGroup):
@@ -66,17 +241,11 @@ async def create_request_step_2(
     # 2.2 Save to JSON storage (if not exists)
     storage.add_chat(chat_id, telegram_id)
 
-    # 2.3 Define async handler for incoming WS messages
-    async def ws_message_handler(data: dict):
-        text = data.get("text")
-        if text:
-            await bot.send_message(chat_id=msg.chat.id, text=text)
-
-    # 2.4 Connect to WebSocket (launch listener in background)
+    # 2.3 Connect to WebSocket (launch listener in background)
     await connector.connect_websocket(
         chat_id=chat_id,
         user_id=msg.from_user.id,
-        message_handler=ws_message_handler
+        message_handler=ChatDelivery(chat_id, msg.chat.id)
     )
 
     await msg.answer("✅ Request created! We will answer you here shortly.")
@@ -98,5 +267,11 @@ async def forward_chat_message(
         await msg.answer("⚠️ There is no active chats!")
     else:
         success = await connector.send_ws_message(chat["id"], text)
+        if not success:
+            # The socket may be reconnecting, or be owned by another worker
+            result = await connector.send_messages(
+                [{"chat_id": chat["id"], "text": text}]
+            )
+            success = bool(result and result.get("messages"))
         if not success:
             await msg.answer("⚠️ Failed to send your message. Please try again.")
@@ -1,5 +1,8 @@
 import asyncio
+import os
+
 import handlers as handlers
+import webhook
 from bot_create import bot, dp
 from aiogram.types import BotCommand, BotCommandScopeDefault
 
@@ -13,12 +16,16 @@ async def set_commands():
 
 
 async def main():
-    dp.include_routers(handlers.start_router, handlers.request_router)
+    dp.include_routers(*handlers.handlers)
     await bot.delete_webhook(drop_pending_updates=True)
     await bot.delete_my_commands()
+    handlers.start_recovery()
     await dp.start_polling(bot)
     await set_commands()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if os.environ.get("BOT_MODE", "polling") == "webhook":
+        webhook.run()
+    else:
+        asyncio.run(main())
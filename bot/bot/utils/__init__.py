@@ -3,5 +3,8 @@ from bot_create import PL
 logger = PL.new_logger("utils", "yellow")
 
 
-def get_logger(name, color=None) -> PL.logger:
-    return PL.new_child(logger, name, color)
+def get_logger(name, color=None, rate_limit=None) -> PL.logger:
+    child = PL.new_child(logger, name, color)
+    if rate_limit:
+        PL.rate_limit(child, rate_limit)
+    return child
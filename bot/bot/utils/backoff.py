@@ -0,0 +1,94 @@
+import asyncio
+import heapq
+import itertools
+import random
+import time
+
+
+class Backoff:
+    """
+    Decorrelated jitter: every delay is random between base and three times
+    the previous one, capped. Reconnecting clients spread out instead of
+    retrying in the same wave.
+    """
+
+    def __init__(self, base: float = 1, cap: float = 60):
+        self.base = base
+        self.cap = cap
+        self._delay = base
+
+    def next(self) -> float:
+        self._delay = min(self.cap, random.uniform(self.base, self._delay * 3))
+        return self._delay
+
+    def reset(self) -> None:
+        self._delay = self.base
+
+
+class TokenBucket:
+    """
+    Limits how many connection attempts start per second across all chats.
+    Waiters with a lower priority value are served first.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._waiters: list[tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def idle(self) -> bool:
+        """Full and unused: dropping it loses no pacing state."""
+        self._refill()
+        return not self._waiters and self._tokens >= self.capacity
+
+    async def acquire(self, priority: float = 0) -> bool:
+        """Wait for a token. Returns True if the caller was throttled."""
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters,
+                       (priority, next(self._counter), future))
+        self._wake()
+        throttled = not future.done()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Got a token but nobody will use it
+                self._tokens = min(self.capacity, self._tokens + 1)
+            raise
+        return throttled
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._wake()
+
+    def _wake(self) -> None:
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        # Drop cancelled waiters so they do not hold the timer alive
+        self._waiters = [w for w in self._waiters if not w[2].done()]
+        heapq.heapify(self._waiters)
+        if self._waiters and not self._timer:
+            delay = (1 - self._tokens) / self.rate
+            self._timer = asyncio.get_running_loop().call_later(
+                delay, self._on_timer
+            )
@@ -1,51 +1,182 @@
 import json
 import os
+import sqlite3
 
 CHAT_FILE = "utils/chat_storage.json"
+CHAT_DB = "utils/chat_storage.db"
 
 
 class ChatStorage:
-    def __init__(self, file_path=CHAT_FILE):
-        self.file_path = file_path
-        self._ensure_file()
+    """
+    Chats of the bot in an embedded SQLite database.
+    - Lookups by chat id (primary key) and by telegram id (index) are O(1)
+      instead of parsing the whole file.
+    - WAL journal: every write is an atomic transaction, a crash never
+      leaves a half-written store behind.
+    - Chats from the old JSON file are imported once, the file is then
+      renamed to <name>.migrated.
+    - The active (unsolved) chat of every user is kept in memory, so
+      find_chat() on the message hot path never touches the database.
+      Solved chats are evicted by mark_solved().
+    - last_message_id is the last agent message delivered to Telegram, the
+      anchor for catching up after a restart. NULL means nothing was
+      delivered yet, '' that it is unknown (chats older than the column).
+    """
 
-    def _ensure_file(self):
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, "w") as f:
-                json.dump({"chats": []}, f)
+    def __init__(self, db_path=CHAT_DB, legacy_file=CHAT_FILE):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._ensure_schema()
+        self._migrate_json(legacy_file)
+        self._active: dict[int, dict] = {}  # telegram_id -> chat
+        self._load_active()
 
-    def add_chat(self, chat_id, telegram_id):
-        chats = self.get_all_chats()
-        data = {
-            "id": chat_id,
-            "user_id": telegram_id,
-            "is_solved": False
+    def _ensure_schema(self):
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Committed data survives a process crash; only a power loss may
+        # drop the latest commits, never corrupt the store.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chats ("
+                "id TEXT PRIMARY KEY, "
+                "user_id INTEGER NOT NULL, "
+                "is_solved INTEGER NOT NULL DEFAULT 0, "
+                "last_message_id TEXT)"
+            )
+            columns = [row["name"] for row in
+                       self._conn.execute("PRAGMA table_info(chats)")]
+            if "last_message_id" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE chats ADD COLUMN last_message_id TEXT"
+                )
+                self._conn.execute("UPDATE chats SET last_message_id = ''")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chats_user_id_idx "
+                "ON chats (user_id, is_solved)"
+            )
+
+    def _migrate_json(self, legacy_file):
+        if not legacy_file or not os.path.exists(legacy_file):
+            return
+        with open(legacy_file, "r") as f:
+            chats = json.load(f).get("chats", [])
+        with self._conn:
+            # INSERT OR IGNORE: safe to repeat if we crash before the rename
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chats "
+                "(id, user_id, is_solved, last_message_id) "
+                "VALUES (?, ?, ?, '')",
+                [
+                    (chat["id"], chat["user_id"],
+                     int(chat.get("is_solved", False)))
+                    for chat in chats if isinstance(chat, dict)
+                ]
+            )
+        os.replace(legacy_file, legacy_file + ".migrated")
+
+    def _load_active(self):
+        rows = self._conn.execute(
+            "SELECT * FROM chats WHERE is_solved = 0 ORDER BY rowid"
+        )
+        # Rows come oldest first, so the newest open chat of a user wins
+        for row in rows:
+            self._active[row["user_id"]] = self._to_dict(row)
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "user_id": row["user_id"],
+            "is_solved": bool(row["is_solved"])
         }
-        if chat_id not in chats:
-            chats.append(data)
-            self._save_chats(chats)
+
+    def add_chat(self, chat_id, telegram_id):
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO chats (id, user_id, is_solved) "
+                "VALUES (?, ?, 0)",
+                (chat_id, telegram_id)
+            )
+        if cursor.rowcount:
+            self._active[telegram_id] = {
+                "id": chat_id, "user_id": telegram_id, "is_solved": False
+            }
 
     def remove_chat(self, chat_id):
-        chats = self.get_all_chats()
-        if chat_id in chats:
-            chats.remove(chat_id)
-            self._save_chats(chats)
+        telegram_id = self._owner(chat_id)
+        with self._conn:
+            self._conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+        self._evict(chat_id, telegram_id)
+
+    def mark_solved(self, chat_id):
+        telegram_id = self._owner(chat_id)
+        with self._conn:
+            self._conn.execute(
+                "UPDATE chats SET is_solved = 1 WHERE id = ?", (chat_id,)
+            )
+        self._evict(chat_id, telegram_id)
+
+    def _owner(self, chat_id):
+        row = self._conn.execute(
+            "SELECT user_id FROM chats WHERE id = ?", (chat_id,)
+        ).fetchone()
+        return row["user_id"] if row else None
+
+    def _evict(self, chat_id, telegram_id):
+        chat = self._active.get(telegram_id)
+        if not chat or chat["id"] != chat_id:
+            return
+        # Fall back to an older unsolved chat of the same user
+        row = self._conn.execute(
+            "SELECT * FROM chats WHERE user_id = ? AND is_solved = 0 "
+            "ORDER BY rowid DESC LIMIT 1",
+            (telegram_id,)
+        ).fetchone()
+        if row:
+            self._active[telegram_id] = self._to_dict(row)
+        else:
+            del self._active[telegram_id]
+
+    def set_last_message(self, chat_id, message_id):
+        with self._conn:
+            self._conn.execute(
+                "UPDATE chats SET last_message_id = ? WHERE id = ?",
+                (message_id, chat_id)
+            )
+
+    def set_last_messages(self, last_messages: dict):
+        """Several set_last_message() calls in one transaction."""
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE chats SET last_message_id = ? WHERE id = ?",
+                [(message_id, chat_id)
+                 for chat_id, message_id in last_messages.items()]
+            )
+
+    def get_unsolved_chats(self):
+        """Unsolved chats with their last delivered message id."""
+        rows = self._conn.execute(
+            "SELECT * FROM chats WHERE is_solved = 0 ORDER BY rowid"
+        )
+        return [
+            {**self._to_dict(row), "last_message_id": row["last_message_id"]}
+            for row in rows
+        ]
 
     def find_chat(self, telegram_id):
-        chats = self.get_all_chats()
-        for chat in chats:
-            if chat.get('user_id') == telegram_id and chat.get('is_solved') is False:
-                return chat
-        return None
+        chat = self._active.get(telegram_id)
+        return dict(chat) if chat else None
 
     def get_all_chats(self):
-        with open(self.file_path, "r") as f:
-            data = json.load(f)
-        return data.get("chats", [])
-
-    def _save_chats(self, chats):
-        with open(self.file_path, "w") as f:
-            json.dump({"chats": chats}, f, indent=4)
+        rows = self._conn.execute("SELECT * FROM chats ORDER BY rowid")
+        return [self._to_dict(row) for row in rows]
 
     def chat_exists(self, chat_id):
-        return chat_id in self.get_all_chats()
+        row = self._conn.execute(
+            "SELECT 1 FROM chats WHERE id = ?", (chat_id,)
+        ).fetchone()
+        return row is not None
@@ -1,36 +1,158 @@
 import asyncio
+import time
+from collections import Counter
 from typing import Awaitable, Callable, Any
 
 import aiohttp
 import json
 import os
 from utils import get_logger, secure
+from utils.backoff import Backoff, TokenBucket
+from utils.metrics import LatencyRecorder
 
-logger = get_logger("Connector")
+# Every chat message is logged at INFO, cap it on busy bots
+logger = get_logger("Connector",
+                    rate_limit=float(os.environ.get("LOG_CONNECTOR_RATE", 50)))
 
 
 class Connector:
     """
-    Connector manages HTTP requests and a persistent, auto-reconnecting WebSocket
-    connection per chat. If the WS connection drops or fails, it will retry
-    every 5 seconds.
+    Connector manages HTTP requests and persistent, auto-reconnecting
+    WebSocket connections. By default all chats share one multiplexed bot
+    socket (ws/bot/) and frames are tagged by chat_id; with WS_MULTIPLEX=False
+    a socket is opened per chat instead. If a WS connection drops or fails,
+    it is retried with jittered exponential backoff; all connection attempts
+    share one token bucket, chats with recent activity get tokens first.
+    REST calls and WebSockets use separate connection pools, so API requests
+    never queue behind handshakes; latencies are recorded per endpoint.
+    When the backend reports a chat as solved, the chat is dropped and the
+    callback registered with on_chat_solved() is awaited with its id.
     """
 
-    RECONNECT_DELAY = 5
+    RECONNECT_BASE = 1
+    RECONNECT_CAP = 60
+    SUBSCRIBE_BATCH = 1000
 
     def __init__(self):
         self._secure_key = os.environ.get("API_SECURITY_KEY")
         self._base_url = os.environ.get("BACKEND_URL")
-        self._session: aiohttp.ClientSession | None = None
+        self._multiplex = os.environ.get("WS_MULTIPLEX", "True") == "True"
+        self._session: aiohttp.ClientSession | None = None  # REST
+        self._ws_session: aiohttp.ClientSession | None = None
+        self._rest_pool_size = int(os.environ.get("HTTP_POOL_SIZE", 20))
+        # Sockets are held open per chat in non-multiplexed mode: 0 = no limit
+        self._ws_pool_size = int(os.environ.get("WS_POOL_SIZE", 0))
+        self._keepalive = float(os.environ.get("HTTP_KEEPALIVE", 30))
+        self._dns_ttl = int(os.environ.get("HTTP_DNS_TTL", 300))
+        self._rest_timeout = aiohttp.ClientTimeout(
+            total=float(os.environ.get("HTTP_TOTAL_TIMEOUT", 15)),
+            connect=float(os.environ.get("HTTP_CONNECT_TIMEOUT", 5)),
+            sock_read=float(os.environ.get("HTTP_READ_TIMEOUT", 10)),
+        )
+        # No total/read timeout: a WebSocket lives as long as the chat
+        self._ws_timeout = aiohttp.ClientTimeout(
+            total=None, connect=float(os.environ.get("WS_CONNECT_TIMEOUT", 10))
+        )
+        self._ws_heartbeat = float(os.environ.get("WS_HEARTBEAT", 30))
+        self.latency = LatencyRecorder()
         self._ws_tasks: dict[str, asyncio.Task] = {}
         self._websockets: dict[str, aiohttp.ClientWebSocketResponse | None] = {}
+        # Multiplexed mode
+        self._bot_task: asyncio.Task | None = None
+        self._bot_ws: aiohttp.ClientWebSocketResponse | None = None
+        self._handlers: dict[str, Callable[[dict], Awaitable[None]]] = {}
+        self._solved_handler: Callable[[str], Awaitable[None]] | None = None
+        # Reconnect control
+        self._connect_bucket = TokenBucket(
+            rate=float(os.environ.get("WS_CONNECT_RATE", 10)),
+            capacity=int(os.environ.get("WS_CONNECT_BURST", 20)),
+        )
+        self._last_activity: dict[str, float] = {}
+        self._counters = Counter()
+
+    @property
+    def _ws_base_url(self) -> str:
+        return (
+            self._base_url
+            .replace("http://", "ws://")
+            .replace("https://", "wss://")
+        )
+
+    def _make_session(self, limit: int,
+                      timeout: aiohttp.ClientTimeout) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit,
+            ttl_dns_cache=self._dns_ttl,
+            keepalive_timeout=self._keepalive,
+        )
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
 
     async def _get_session(self) -> aiohttp.ClientSession:
-        """Lazily create or reuse an aiohttp ClientSession."""
+        """Lazily create or reuse the REST ClientSession."""
         if not self._session or self._session.closed:
-            self._session = aiohttp.ClientSession()
+            self._session = self._make_session(self._rest_pool_size,
+                                               self._rest_timeout)
         return self._session
 
+    async def _get_ws_session(self) -> aiohttp.ClientSession:
+        """Lazily create or reuse the WebSocket ClientSession."""
+        if not self._ws_session or self._ws_session.closed:
+            self._ws_session = self._make_session(self._ws_pool_size,
+                                                  self._ws_timeout)
+        return self._ws_session
+
+    async def _ws_connect(self, url: str, endpoint: str,
+                          **kwargs) -> aiohttp.ClientWebSocketResponse:
+        session = await self._get_ws_session()
+        started = time.perf_counter()
+        try:
+            ws = await session.ws_connect(url, heartbeat=self._ws_heartbeat,
+                                          **kwargs)
+        except Exception:
+            self.latency.observe(endpoint, self._elapsed_ms(started), True)
+            raise
+        self.latency.observe(endpoint, self._elapsed_ms(started))
+        return ws
+
+    @staticmethod
+    def _elapsed_ms(started: float) -> float:
+        return (time.perf_counter() - started) * 1000
+
+    @property
+    def stats(self) -> dict:
+        """Connection counters for monitoring."""
+        return {
+            **self._counters,
+            "open": len(self._websockets) + int(bool(self._bot_ws)),
+            "waiting": self._connect_bucket.waiting,
+        }
+
+    def _touch(self, chat_id: str) -> None:
+        self._last_activity[chat_id] = time.monotonic()
+
+    async def _acquire_connect(self, chat_id: str | None = None) -> None:
+        # Most recently active chats first, the shared bot socket before all
+        if chat_id is None:
+            priority = float("-inf")
+        else:
+            priority = -self._last_activity.get(chat_id, 0)
+        if await self._connect_bucket.acquire(priority):
+            self._counters["throttled"] += 1
+
+    def on_chat_solved(self, handler: Callable[[str], Awaitable[None]]) -> None:
+        """Register a callback for chats solved on the backend."""
+        self._solved_handler = handler
+
+    async def _chat_solved(self, chat_id: str) -> None:
+        # The backend already dropped the subscription, only forget the chat
+        self._handlers.pop(chat_id, None)
+        self._ws_tasks.pop(chat_id, None)
+        self._last_activity.pop(chat_id, None)
+        logger.info(f"Chat {chat_id} solved")
+        if self._solved_handler:
+            await self._solved_handler(chat_id)
+
     async def connect_websocket(
             self,
             chat_id: str,
@@ -40,7 +162,17 @@ class Connector:
         """
         Start (or restart) a background task to maintain a WS connection
         for the given chat_id. Incoming messages will be passed to message_handler.
+        In multiplexed mode the chat is subscribed on the shared bot socket.
         """
+        if self._multiplex:
+            self._handlers[chat_id] = message_handler
+            if not self._bot_task or self._bot_task.done():
+                self._bot_task = asyncio.create_task(
+                    self._bot_socket_manager(), name="ws-manager-bot"
+                )
+            elif self._bot_ws and not self._bot_ws.closed:
+                await self._send_subscription("subscribe", [chat_id])
+            return
 
         # If there's already a task for this chat, cancel it first
         if chat_id in self._ws_tasks:
@@ -59,33 +191,43 @@ class Connector:
             message_handler: Callable[[dict], Awaitable[None]],
     ) -> None:
         """
-        Loop forever: try to connect, listen, and on any error wait and retry.
+        Loop forever: try to connect, listen, and on any error back off and
+        retry.
         """
         secure_code = secure.generate_secure_token(self._secure_key, user_id)
         ws_url = (
-                self._base_url
-                .replace("http://", "ws://")
-                .replace("https://", "wss://")
+                self._ws_base_url
                 + f"ws/chat/{chat_id}/?secure_key={secure_code}"
         )
 
+        backoff = Backoff(self.RECONNECT_BASE, self.RECONNECT_CAP)
+        attempt = 0
         while True:
             try:
-                session = await self._get_session()
-                ws = await session.ws_connect(ws_url)
+                if attempt:
+                    self._counters["reconnects"] += 1
+                attempt += 1
+                await self._acquire_connect(chat_id)
+                ws = await self._ws_connect(ws_url, "ws/chat/")
                 self._websockets[chat_id] = ws
+                self._counters["connects"] += 1
+                backoff.reset()
                 logger.info(f"WebSocket connected for chat {chat_id} -> {ws_url}")
                 await self._listen_loop(chat_id, ws, message_handler)
+                if chat_id not in self._ws_tasks:
+                    break
             except asyncio.CancelledError:
                 # Task was cancelled; tear down and exit
                 break
             except Exception as e:
+                self._counters["failures"] += 1
                 logger.warning(f" Websocket unexpected error for chat {chat_id}: {e!r}")
             finally:
                 ws = self._websockets.pop(chat_id, None)
                 if ws and not ws.closed:
                     await ws.close()
-                await asyncio.sleep(self.RECONNECT_DELAY)
+                if chat_id in self._ws_tasks:
+                    await asyncio.sleep(backoff.next())
 
     async def _listen_loop(
             self,
@@ -102,25 +244,118 @@ class Connector:
                     logger.error(f" Invalid JSON from WS chat {chat_id}: {msg.data}")
                     continue
 
+                if data.get("action") == "solved":
+                    await self._chat_solved(chat_id)
+                    return
                 if data.get("user_type") == "agent":
+                    self._touch(chat_id)
                     await message_handler(data)
             elif msg.type == aiohttp.WSMsgType.ERROR:
                 logger.errpr(f"WS error frame on chat {chat_id}: {ws.exception()}")
                 break
 
+    async def disconnect_websocket(self, chat_id: str) -> None:
+        """Stop receiving messages for the chat."""
+        self._last_activity.pop(chat_id, None)
+        if self._multiplex:
+            if self._handlers.pop(chat_id, None) and self._bot_ws \
+                    and not self._bot_ws.closed:
+                await self._send_subscription("unsubscribe", [chat_id])
+            return
+        task = self._ws_tasks.pop(chat_id, None)
+        if task:
+            task.cancel()
+
+    async def _bot_socket_manager(self) -> None:
+        """
+        Keep the multiplexed bot socket open. Every (re)connect subscribes
+        all registered chats again.
+        """
+        ws_url = self._ws_base_url + "ws/bot/"
+        backoff = Backoff(self.RECONNECT_BASE, self.RECONNECT_CAP)
+        attempt = 0
+        while True:
+            try:
+                if attempt:
+                    self._counters["reconnects"] += 1
+                attempt += 1
+                await self._acquire_connect()
+                ws = await self._ws_connect(
+                    ws_url, "ws/bot/",
+                    headers={"X-Bot-Token": self._secure_key}
+                )
+                self._bot_ws = ws
+                self._counters["connects"] += 1
+                backoff.reset()
+                logger.info(f"Bot WebSocket connected -> {ws_url}")
+                await self._send_subscription("subscribe",
+                                              list(self._handlers))
+                await self._bot_listen_loop(ws)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                self._counters["failures"] += 1
+                logger.warning(f" Bot websocket unexpected error: {e!r}")
+            finally:
+                ws, self._bot_ws = self._bot_ws, None
+                if ws and not ws.closed:
+                    await ws.close()
+            await asyncio.sleep(backoff.next())
+
+    async def _send_subscription(self, action: str, chat_ids: list[str]):
+        for i in range(0, len(chat_ids), self.SUBSCRIBE_BATCH):
+            await self._bot_ws.send_str(json.dumps({
+                "action": action,
+                "chat_ids": chat_ids[i:i + self.SUBSCRIBE_BATCH],
+            }))
+
+    async def _bot_listen_loop(
+            self,
+            ws: aiohttp.ClientWebSocketResponse,
+    ) -> None:
+        """Dispatch frames of the bot socket to their chat handlers."""
+        async for msg in ws:
+            if msg.type == aiohttp.WSMsgType.TEXT:
+                try:
+                    data = json.loads(msg.data)
+                except json.JSONDecodeError:
+                    logger.error(f" Invalid JSON from bot WS: {msg.data}")
+                    continue
+
+                if data.get("action") == "error":
+                    logger.warning(f"Bot WS error for chat "
+                                   f"{data.get('chat_id')}: {data.get('error')}")
+                    continue
+                if data.get("action") == "solved":
+                    await self._chat_solved(data.get("chat_id"))
+                    continue
+                handler = self._handlers.get(data.get("chat_id"))
+                if handler and data.get("user_type") == "agent":
+                    self._touch(data["chat_id"])
+                    await handler(data)
+            elif msg.type == aiohttp.WSMsgType.ERROR:
+                logger.error(f"WS error frame on bot socket: {ws.exception()}")
+                break
+
     async def send_ws_message(self, chat_id: str, text: str) -> bool:
         """
         Send a text message over an existing WS connection.
         Returns True on success, False otherwise.
         """
 
-        ws = self._websockets.get(chat_id)
+        if self._multiplex:
+            ws = self._bot_ws if chat_id in self._handlers else None
+            frame = {"action": "message", "chat_id": chat_id, "text": text}
+        else:
+            ws = self._websockets.get(chat_id)
+            frame = {"text": text}
         if not ws or ws.closed:
             logger.warning(f"No active WebSocket for chat {chat_id}")
             return False
 
         try:
-            await ws.send_str(json.dumps({"text": text}))
+            await ws.send_str(json.dumps(frame))
+            self._touch(chat_id)
             logger.info(f"Sent WS message to chat {chat_id}: {text}")
             return True
         except Exception as e:
@@ -134,16 +369,22 @@ class Connector:
         """
         headers = {"X-Bot-Token": self._secure_key}
         url = self._base_url + endpoint
+        started = time.perf_counter()
+        error = True
         try:
             session = await self._get_session()
             async with session.post(url, json=data, headers=headers) as response:
                 response.raise_for_status()
                 try:
-                    return await response.json()
+                    result = await response.json()
                 except aiohttp.ContentTypeError:
-                    return await response.text()
+                    result = await response.text()
+                error = False
+                return result
         except Exception as e:
             logger.error(f"POST {url} failed with error: {e!r}")
+        finally:
+            self.latency.observe(endpoint, self._elapsed_ms(started), error)
 
     async def create_request(self, telegram_id: int, name: str, theme: str) -> dict | None:
         """Request creation on server."""
@@ -152,9 +393,29 @@ class Connector:
             "api/v1/bot/create-request/",
         )
 
+    async def get_chat_messages(self, chat_id: str,
+                                after_message_id: str | None = None,
+                                cursor: str | None = None,
+                                include_info: bool = False) -> dict | None:
+        """Page of chat messages newer than after_message_id (or cursor)."""
+        return await self.post(
+            {"chat_id": chat_id, "after_message_id": after_message_id,
+             "cursor": cursor, "include_info": include_info},
+            "api/v1/chats/get-chat-messages/",
+        )
+
     async def send_message(self, telegram_id: int, text: str) -> dict | None:
+        return await self.send_messages(
+            [{"telegram_id": telegram_id, "text": text}]
+        )
+
+    async def send_messages(self, messages: list[dict]) -> dict | None:
+        """
+        Store client messages of many chats in one request, without a
+        socket. Items: {"chat_id" or "telegram_id": ..., "text": ...}.
+        """
         return await self.post(
-            {"telegram_id": telegram_id, "text": text},
+            {"messages": messages},
             "api/v1/bot/send-message/",
         )
 
@@ -164,13 +425,22 @@ class Connector:
         for task in self._ws_tasks.values():
             task.cancel()
         self._ws_tasks.clear()
+        if self._bot_task:
+            self._bot_task.cancel()
+            self._bot_task = None
 
         # close any open websockets
-        for ws in self._websockets.values():
+        for ws in list(self._websockets.values()):
             await ws.close()
         self._websockets.clear()
+        if self._bot_ws and not self._bot_ws.closed:
+            await self._bot_ws.close()
+        self._handlers.clear()
+        self._last_activity.clear()
 
-        # close HTTP session
+        # close HTTP sessions
+        if self._ws_session and not self._ws_session.closed:
+            await self._ws_session.close()
         if self._session and not self._session.closed:
             await self._session.close()
             logger.info("HTTP session closed.")
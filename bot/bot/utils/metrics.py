@@ -0,0 +1,49 @@
+import bisect
+from collections import defaultdict
+
+# Upper bounds in milliseconds, the last bucket catches everything slower
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram, cheap enough for every request."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.errors = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, ms: float, error: bool = False) -> None:
+        self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+        self.total += ms
+        if error:
+            self.errors += 1
+
+    def snapshot(self) -> dict:
+        labels = [f"<={bound}" for bound in self.buckets] + ["inf"]
+        count = self.count
+        return {
+            "count": count,
+            "errors": self.errors,
+            "avg_ms": round(self.total / count, 2) if count else None,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class LatencyRecorder:
+    """Histograms keyed by endpoint."""
+
+    def __init__(self):
+        self._histograms: dict[str, Histogram] = defaultdict(Histogram)
+
+    def observe(self, endpoint: str, ms: float, error: bool = False) -> None:
+        self._histograms[endpoint].observe(ms, error)
+
+    def snapshot(self) -> dict:
+        return {endpoint: histogram.snapshot()
+                for endpoint, histogram in self._histograms.items()}
@@ -4,7 +4,11 @@ PROJECT LOGGER ver 0.1 by Ilya Voronov. Jan 31 2025
 import sys
 import os
 import json
+import time
+import atexit
+import queue
 import logging
+import logging.handlers
 
 from datetime import datetime
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
@@ -14,13 +18,19 @@ from colored import Fore, Back, Style
 class ProjectLogger:
     """
     A configurable project-wide logger that:
-      - Writes all messages to a timestamped file under `logs/`
+      - Writes all messages to a rotating file under `logs/`
       - Emits colorized output to the console according to level and module
       - Honors a specified timezone for timestamps
       - Supports child loggers with inherited or custom colors
+      - In async mode loggers only put records on a queue; formatting and
+        file/console I/O happen in a QueueListener thread, off the event loop
+      - Can rate limit chatty loggers on hot paths
+      - Can forward records of child processes to the parent's handlers
     """
 
-    def __init__(self, timezone, debug, level):
+    def __init__(self, timezone, debug, level, async_mode=True,
+                 max_bytes=10 * 1024 * 1024, backup_count=5,
+                 rotate_when=None):
         """
         Initialize the ProjectLogger.
 
@@ -29,6 +39,12 @@ class ProjectLogger:
         :param debug:   'True' or 'False' to force DEBUG level console output.
         :param level:   One of the standard logging levels as string
                         (e.g. 'INFO', 'WARNING'). Defaults to INFO.
+        :param async_mode:   Hand records to a background thread.
+        :param max_bytes:    Rotate the log file at this size.
+        :param backup_count: Number of rotated files to keep.
+        :param rotate_when:  Rotate by time instead of size
+                             (e.g. 'midnight', 'H'), see
+                             TimedRotatingFileHandler.
         """
         # Validate and store timezone
         try:
@@ -44,17 +60,24 @@ class ProjectLogger:
             "lineno)d] [%(levelname)s] %(message)s"
         )
 
-        # Create a timestamped filename in logs/
-        timestamp = datetime.now(self.timezone).strftime('%Y-%m-%d %H.%M.%S')
-        self.file_name = f"logs/log__{timestamp}.txt"
+        # Rotated files get a numeric or date suffix
+        self.file_name = "logs/log.txt"
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_when = rotate_when
 
         self.debug = debug
         self.level = getattr(logging, level, logging.INFO)
+        self.async_mode = async_mode
 
         # Handlers and the root logger will be set up in configure()
         self.logger = None
         self.stream_handler = None
         self.file_handler = None
+        self.queue_handler = None
+        self.listener = None
+        # Loggers our handlers are attached to, see forward_to()
+        self.attached = []
         self.configure()
 
     class TimezoneFormatter(logging.Formatter):
@@ -142,17 +165,60 @@ class ProjectLogger:
                     return item
             return False
 
+    class RateLimitFilter(logging.Filter):
+        """
+        Token bucket for a logger: records below WARNING over `rate` per
+        second are dropped, the next record passed reports how many were.
+        """
+
+        def __init__(self, rate, burst=None):
+            super().__init__()
+            self.rate = rate
+            self.burst = burst or max(1, int(rate))
+            self.tokens = float(self.burst)
+            self.updated = time.monotonic()
+            self.suppressed = 0
+
+        def filter(self, record):
+            if record.levelno >= logging.WARNING:
+                return True
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                self.suppressed += 1
+                return False
+            self.tokens -= 1
+            if self.suppressed:
+                record.msg = (f"{record.getMessage()} "
+                              f"({self.suppressed} messages suppressed)")
+                record.args = None
+                self.suppressed = 0
+            return True
+
     def configure(self):
         """
         Create the logs directory (if needed), then prepare:
-          - A FileHandler (DEBUG+ all messages, plain formatting)
+          - A rotating file handler (DEBUG+ all messages, plain formatting)
           - A StreamHandler (DEBUG+ all messages, color formatting)
+          - In async mode, a QueueHandler for the loggers and a
+            QueueListener feeding both handlers above
         """
         try:
             os.makedirs('logs', exist_ok=True)
-            self.file_handler = logging.FileHandler(
-                filename=self.file_name, mode='w'
-            )
+            # The file is opened on the first record, processes that
+            # forward_to() their parent never open it
+            if self.rotate_when:
+                self.file_handler = logging.handlers.TimedRotatingFileHandler(
+                    filename=self.file_name, when=self.rotate_when,
+                    backupCount=self.backup_count, delay=True
+                )
+            else:
+                self.file_handler = logging.handlers.RotatingFileHandler(
+                    filename=self.file_name, maxBytes=self.max_bytes,
+                    backupCount=self.backup_count, delay=True
+                )
         except FileNotFoundError:
             logging.critical(
                 "An error occurred while trying to save the log file."
@@ -177,6 +243,60 @@ class ProjectLogger:
             datefmt="%Y-%m-%d %H:%M:%S %Z")
         self.stream_handler.setFormatter(stream_formatter)
 
+        if self.async_mode:
+            log_queue = queue.SimpleQueue()
+            self.queue_handler = logging.handlers.QueueHandler(log_queue)
+            self.listener = logging.handlers.QueueListener(
+                log_queue, self.file_handler, self.stream_handler,
+                respect_handler_level=True
+            )
+
+    def handlers(self):
+        """Handlers to attach to a logger in the current mode."""
+        if self.async_mode:
+            return [self.queue_handler]
+        return [self.file_handler, self.stream_handler]
+
+    def attach(self, logger: logging.Logger):
+        """Add the handlers of the current mode to `logger`."""
+        for handler in self.handlers():
+            logger.addHandler(handler)
+        self.attached.append(logger)
+
+    def stop(self):
+        """Flush queued records and stop the listener thread."""
+        if self.listener and self.listener._thread:
+            self.listener.stop()
+
+    def listen(self, log_queue):
+        """
+        Write records other processes put on `log_queue` (a
+        multiprocessing queue, see forward_to()) with our handlers.
+        Returns the started QueueListener, stop it after the processes.
+        """
+        listener = logging.handlers.QueueListener(
+            log_queue, self.file_handler, self.stream_handler,
+            respect_handler_level=True
+        )
+        listener.start()
+        return listener
+
+    def forward_to(self, log_queue):
+        """
+        Send all records to the process that listen()s on `log_queue`
+        instead of writing them here, so several processes never rotate
+        the same log file. Call it first thing in a child process.
+        """
+        self.stop()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        for logger in self.attached:
+            for handler in self.handlers():
+                logger.removeHandler(handler)
+            logger.addHandler(queue_handler)
+        self.async_mode = True
+        self.queue_handler = queue_handler
+        self.listener = None
+
     def start_logging(self):
         """
         Instantiate and configure the root logger only once.
@@ -185,9 +305,11 @@ class ProjectLogger:
         if self.logger is None:
             root = logging.getLogger()
             root.propagate = False
-            root.addHandler(self.file_handler)
             self.stream_handler.formatter.MODULE_COLORS["root"] = Fore.blue
-            root.addHandler(self.stream_handler)
+            self.attach(root)
+            if self.listener:
+                self.listener.start()
+                atexit.register(self.stop)
             root.level = (
                 logging.DEBUG if self.debug == 'True' else self.level
             )
@@ -206,13 +328,12 @@ class ProjectLogger:
         """
         child = logging.getLogger(name)
         child.propagate = False
-        child.addHandler(self.file_handler)
         if color:
             color = getattr(Fore, color.upper())
         else:
             color = Fore.white
         self.stream_handler.formatter.MODULE_COLORS[name] = f"{color}"
-        child.addHandler(self.stream_handler)
+        self.attach(child)
         return child
 
     def new_child(self, parent: logging.Logger, name: str, color: str | None = None):
@@ -224,7 +345,6 @@ class ProjectLogger:
         """
         child_logger = parent.getChild(name)
         child_logger.propagate = False
-        child_logger.addHandler(self.file_handler)
         if color is not None:
             color = getattr(Fore, color.upper())
         else:
@@ -232,9 +352,18 @@ class ProjectLogger:
         self.stream_handler.formatter.MODULE_COLORS[child_logger.name] = (
             self.stream_handler.formatter.MODULE_COLORS[color]
         )
-        child_logger.addHandler(self.stream_handler)
+        self.attach(child_logger)
         return child_logger
 
+    def rate_limit(self, logger: logging.Logger, rate: float,
+                   burst: int | None = None):
+        """
+        Drop DEBUG/INFO records of `logger` above `rate` per second.
+        Warnings and errors always pass.
+        """
+        logger.addFilter(self.RateLimitFilter(rate, burst))
+        return logger
+
     def set_color(self, logger_name: str, color: str):
         """
         Change the console color for an existing logger name.
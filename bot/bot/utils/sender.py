@@ -0,0 +1,131 @@
+import asyncio
+import os
+from collections import deque
+from typing import Callable
+
+from aiogram import Bot
+from aiogram.exceptions import (TelegramAPIError, TelegramForbiddenError,
+                                TelegramNetworkError, TelegramRetryAfter,
+                                TelegramServerError)
+
+from utils import get_logger
+from utils.backoff import TokenBucket
+
+logger = get_logger("Sender")
+
+
+class TelegramSender:
+    """
+    Outbound message queue. send() only enqueues; every chat with pending
+    messages is drained by its own task, paced by a per-chat and a global
+    token bucket that follow Telegram's flood limits (about 1 message per
+    second per chat and 30 per second overall). Short messages waiting in
+    the same chat are merged into one, a RetryAfter pauses only its chat.
+    on_delivered callbacks run once Telegram accepted the message.
+    """
+
+    MESSAGE_LIMIT = 4096
+    SHORT_MESSAGE = 512
+    MAX_ATTEMPTS = 5
+
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self._global = TokenBucket(
+            rate=float(os.environ.get("TG_GLOBAL_RATE", 30)),
+            capacity=int(os.environ.get("TG_GLOBAL_BURST", 30)),
+        )
+        self._chat_rate = float(os.environ.get("TG_CHAT_RATE", 1))
+        self._chat_burst = int(os.environ.get("TG_CHAT_BURST", 3))
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._queues: dict[int, deque[tuple[str, Callable | None]]] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def send(self, chat_id: int, text: str,
+             on_delivered: Callable[[], None] | None = None) -> None:
+        """Queue a message for the chat, never waits."""
+        self._queues.setdefault(chat_id, deque()).append((text, on_delivered))
+        if chat_id not in self._tasks:
+            self._tasks[chat_id] = asyncio.create_task(
+                self._drain(chat_id), name=f"tg-sender-{chat_id}"
+            )
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _next_text(self, queue: deque) -> tuple[str, list[Callable]]:
+        text, callback = queue.popleft()
+        callbacks = [callback] if callback else []
+        while (queue and len(text) <= self.SHORT_MESSAGE
+               and len(queue[0][0]) <= self.SHORT_MESSAGE
+               and len(text) + 1 + len(queue[0][0]) <= self.MESSAGE_LIMIT):
+            next_text, callback = queue.popleft()
+            text += "\n" + next_text
+            if callback:
+                callbacks.append(callback)
+        return text, callbacks
+
+    async def _drain(self, chat_id: int) -> None:
+        queue = self._queues[chat_id]
+        bucket = self._chat_buckets.setdefault(
+            chat_id, TokenBucket(self._chat_rate, self._chat_burst)
+        )
+        try:
+            while queue:
+                await bucket.acquire()
+                await self._global.acquire()
+                # Merge whatever piled up while we were waiting for tokens
+                text, callbacks = self._next_text(queue)
+                if await self._deliver(chat_id, text):
+                    for callback in callbacks:
+                        callback()
+        except TelegramForbiddenError:
+            logger.warning(f"Chat {chat_id} blocked the bot, "
+                           f"dropping {len(queue)} queued messages")
+        except Exception as e:
+            logger.error(f"Sender for chat {chat_id} failed, dropping "
+                         f"{len(queue)} queued messages: {e!r}")
+        finally:
+            # No await between the last queue check and here, so a
+            # concurrent send() always sees either this task or none
+            self._tasks.pop(chat_id, None)
+            self._queues.pop(chat_id, None)
+            self._prune_buckets()
+
+    def _prune_buckets(self) -> None:
+        # Buckets still refilling are kept, or a chat would get a fresh
+        # burst right after going idle
+        for chat_id, bucket in list(self._chat_buckets.items()):
+            if chat_id not in self._tasks and bucket.idle:
+                del self._chat_buckets[chat_id]
+
+    async def _deliver(self, chat_id: int, text: str) -> bool:
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                return True
+            except TelegramRetryAfter as e:
+                logger.warning(f"Flood limit for chat {chat_id}, "
+                               f"retry after {e.retry_after}s")
+                await asyncio.sleep(e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning(f"Send to chat {chat_id} failed "
+                               f"(attempt {attempt}): {e!r}")
+                await asyncio.sleep(attempt)
+            except TelegramForbiddenError:
+                raise
+            except TelegramAPIError as e:
+                # Bad request etc., retrying will not help
+                logger.error(f"Send to chat {chat_id} rejected: {e!r}")
+                return False
+        logger.error(f"Dropped message to chat {chat_id} after "
+                     f"{self.MAX_ATTEMPTS} attempts")
+        return False
+
+    async def close(self, timeout: float = 10) -> None:
+        """Wait for queued messages to go out, then cancel the rest."""
+        tasks = list(self._tasks.values())
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        for task in self._tasks.values():
+            task.cancel()
@@ -0,0 +1,157 @@
+"""
+Webhook mode: Telegram pushes updates to an aiohttp app instead of the bot
+long-polling for them.
+
+With WEBHOOK_WORKERS > 1 the web process only accepts updates and routes
+them to worker processes by Telegram user id. Chats, WebSocket
+subscriptions and FSM transitions of a user always stay in one worker.
+Workers send their log records to the web process, which writes them.
+"""
+import asyncio
+import multiprocessing
+import os
+
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import (SimpleRequestHandler,
+                                            setup_application)
+
+import handlers
+from bot_create import PL, bot, dp
+from utils import get_logger
+
+logger = get_logger("Webhook")
+
+WEBHOOK_HOST = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.environ.get("WEBHOOK_PORT", 8080))
+WEBHOOK_PATH = os.environ.get("WEBHOOK_PATH", "/webhook")
+# Public base url Telegram will call, e.g. https://example.com
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET")
+WEBHOOK_WORKERS = int(os.environ.get("WEBHOOK_WORKERS", 1))
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+async def on_startup():
+    await bot.set_webhook(
+        url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=True,
+    )
+    logger.info(f"Webhook set to {WEBHOOK_URL}{WEBHOOK_PATH}")
+
+
+def update_owner(update: dict) -> int:
+    """Telegram user (or chat) an update belongs to."""
+    for value in update.values():
+        if isinstance(value, dict):
+            owner = value.get("from") or value.get("user") or value.get("chat")
+            if isinstance(owner, dict) and "id" in owner:
+                return owner["id"]
+    return update.get("update_id", 0)
+
+
+class UpdateIngress:
+    """Accepts webhook calls and hands updates to the owner's worker."""
+
+    def __init__(self, queues: list):
+        self.queues = queues
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get(SECRET_HEADER) != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        update = await request.json()
+        # Queue.put() only buffers, pickling happens in a feeder thread
+        self.queues[update_owner(update) % len(self.queues)].put(update)
+        return web.Response()
+
+
+def run_worker(index: int, updates: multiprocessing.Queue,
+               log_queue: multiprocessing.Queue):
+    PL.forward_to(log_queue)
+    asyncio.run(consume_updates(index, updates))
+
+
+async def consume_updates(index: int, updates: multiprocessing.Queue):
+    """Feed updates of one worker queue to the dispatcher until None."""
+    dp.include_routers(*handlers.handlers)
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    logger.info(f"Webhook worker {index} started")
+    handlers.start_recovery(index, WEBHOOK_WORKERS)
+
+    async def process(update: dict):
+        try:
+            await dp.feed_raw_update(bot, update)
+        except Exception as e:
+            logger.error(f"Update {update.get('update_id')} failed: {e!r}")
+
+    while True:
+        update = await loop.run_in_executor(None, updates.get)
+        if update is None:
+            break
+        task = asyncio.create_task(process(update))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    await asyncio.gather(*tasks)
+    await handlers.flush_delivered()
+    await bot.session.close()
+
+
+def run_workers():
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(WEBHOOK_WORKERS)]
+    log_queue = context.Queue()
+    log_listener = PL.listen(log_queue)
+    workers = [
+        context.Process(target=run_worker,
+                        args=(index, updates, log_queue),
+                        name=f"webhook-worker-{index}")
+        for index, updates in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+
+    async def startup(app: web.Application):
+        await on_startup()
+
+    async def shutdown(app: web.Application):
+        for updates in queues:
+            updates.put(None)
+        await bot.session.close()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, UpdateIngress(queues).handle)
+    app.on_startup.append(startup)
+    app.on_shutdown.append(shutdown)
+    try:
+        web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+    finally:
+        for worker in workers:
+            worker.join()
+        log_listener.stop()
+
+
+async def start_recovery():
+    handlers.start_recovery()
+
+
+def run_single():
+    dp.include_routers(*handlers.handlers)
+    dp.startup.register(on_startup)
+    dp.startup.register(start_recovery)
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
+
+
+def run():
+    if WEBHOOK_WORKERS > 1:
+        run_workers()
+    else:
+        run_single()
@@ -0,0 +1,19 @@
+"""
+Unit tests of the bot, run from bot/:
+
+    python -m unittest discover -s tests -t .
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BOT_DIR = Path(__file__).resolve().parent.parent / "bot"
+
+# utils imports bot_create, which needs a token and writes logs/
+os.chdir(tempfile.mkdtemp(prefix="bot-tests-"))
+os.makedirs("logs")
+sys.path.insert(0, str(BOT_DIR))
+os.environ.setdefault("BOT_TOKEN", "123456:" + "A" * 35)
+os.environ.setdefault("LOGGING_LEVEL", "CRITICAL")
+os.environ.setdefault("LOG_ASYNC", "False")
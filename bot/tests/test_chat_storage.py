@@ -0,0 +1,114 @@
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from utils.chat_storage import ChatStorage
+
+
+class ChatStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="chat-storage-")
+        self.db_path = os.path.join(self.dir, "chats.db")
+        self.legacy_file = os.path.join(self.dir, "chats.json")
+
+    def open(self) -> ChatStorage:
+        storage = ChatStorage(self.db_path, self.legacy_file)
+        self.addCleanup(storage._conn.close)
+        return storage
+
+    def write_legacy(self, chats: list):
+        with open(self.legacy_file, "w") as f:
+            json.dump({"chats": chats}, f)
+
+
+class MigrationTest(ChatStorageTestCase):
+    chats = [
+        {"id": "a", "user_id": 1, "is_solved": True},
+        {"id": "b", "user_id": 1, "is_solved": False},
+        {"id": "c", "user_id": 1, "is_solved": False},
+        {"id": "d", "user_id": 2},
+        "not a chat",
+    ]
+
+    def test_json_file_is_imported_once(self):
+        self.write_legacy(self.chats)
+        storage = self.open()
+        self.assertFalse(os.path.exists(self.legacy_file))
+        self.assertTrue(os.path.exists(self.legacy_file + ".migrated"))
+        self.assertEqual(
+            storage.get_all_chats(),
+            [{"id": "a", "user_id": 1, "is_solved": True},
+             {"id": "b", "user_id": 1, "is_solved": False},
+             {"id": "c", "user_id": 1, "is_solved": False},
+             {"id": "d", "user_id": 2, "is_solved": False}])
+        # What was delivered before the import is unknown
+        self.assertEqual({chat["last_message_id"]
+                          for chat in storage.get_unsolved_chats()}, {""})
+        self.assertEqual(storage.find_chat(1)["id"], "c")
+        self.assertEqual(storage.find_chat(2)["id"], "d")
+
+    def test_import_repeated_after_a_crash_adds_no_duplicates(self):
+        self.write_legacy(self.chats)
+        self.open()
+        # The rename did not happen: the same file is imported again
+        os.replace(self.legacy_file + ".migrated", self.legacy_file)
+        storage = self.open()
+        self.assertEqual([chat["id"] for chat in storage.get_all_chats()],
+                         ["a", "b", "c", "d"])
+
+    def test_store_without_last_message_column(self):
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute("CREATE TABLE chats (id TEXT PRIMARY KEY, "
+                         "user_id INTEGER NOT NULL, "
+                         "is_solved INTEGER NOT NULL DEFAULT 0)")
+            conn.execute("INSERT INTO chats VALUES ('a', 1, 0)")
+        conn.close()
+        storage = self.open()
+        self.assertEqual(storage.get_unsolved_chats(),
+                         [{"id": "a", "user_id": 1, "is_solved": False,
+                           "last_message_id": ""}])
+        # New chats have nothing delivered yet
+        storage.add_chat("b", 2)
+        self.assertIsNone(storage.get_unsolved_chats()[1]["last_message_id"])
+
+
+class EvictionTest(ChatStorageTestCase):
+    def setUp(self):
+        super().setUp()
+        self.storage = self.open()
+        self.storage.add_chat("old", 1)
+        self.storage.add_chat("new", 1)
+        self.storage.add_chat("other", 2)
+
+    def test_newest_open_chat_is_active(self):
+        self.assertEqual(self.storage.find_chat(1)["id"], "new")
+        self.assertEqual(self.open().find_chat(1)["id"], "new")
+
+    def test_solving_falls_back_to_an_older_open_chat(self):
+        self.storage.mark_solved("new")
+        self.assertEqual(self.storage.find_chat(1)["id"], "old")
+        self.storage.mark_solved("old")
+        self.assertIsNone(self.storage.find_chat(1))
+        self.assertIsNone(self.open().find_chat(1))
+        self.assertEqual(self.storage.find_chat(2)["id"], "other")
+
+    def test_removing_an_inactive_chat_keeps_the_active_one(self):
+        self.storage.remove_chat("old")
+        self.assertEqual(self.storage.find_chat(1)["id"], "new")
+        self.storage.remove_chat("new")
+        self.assertIsNone(self.storage.find_chat(1))
+        self.assertFalse(self.storage.chat_exists("new"))
+
+    def test_unknown_and_repeated_chats(self):
+        self.storage.mark_solved("missing")
+        self.storage.remove_chat("missing")
+        # A known id does not take over as the active chat
+        self.storage.add_chat("old", 1)
+        self.assertEqual(self.storage.find_chat(1)["id"], "new")
+
+    def test_found_chat_is_a_copy(self):
+        self.storage.find_chat(1)["is_solved"] = True
+        self.assertFalse(self.storage.find_chat(1)["is_solved"])
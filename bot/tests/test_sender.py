@@ -0,0 +1,117 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from aiogram.exceptions import (TelegramBadRequest, TelegramForbiddenError,
+                                TelegramRetryAfter)
+from aiogram.methods import SendMessage
+
+from utils.sender import TelegramSender
+
+
+class FakeBot:
+    """Records sent texts; errors[chat_id] are raised first, in order."""
+
+    def __init__(self, errors: dict | None = None):
+        self.sent: list[tuple[int, str, float]] = []
+        self.errors = errors or {}
+
+    async def send_message(self, chat_id: int, text: str):
+        errors = self.errors.get(chat_id)
+        if errors:
+            raise errors.pop(0)(SendMessage(chat_id=chat_id, text=text))
+        self.sent.append((chat_id, text, time.monotonic()))
+
+    def texts(self, chat_id: int) -> list[str]:
+        return [text for sent_to, text, _ in self.sent if sent_to == chat_id]
+
+
+def retry_after(seconds: int):
+    return lambda method: TelegramRetryAfter(method, "Too Many Requests",
+                                             seconds)
+
+
+def rejected(error):
+    return lambda method: error(method, "rejected")
+
+
+# No pacing, the tests check merging and error handling
+@mock.patch.dict("os.environ", {"TG_GLOBAL_RATE": "1000",
+                                "TG_GLOBAL_BURST": "1000",
+                                "TG_CHAT_RATE": "1000",
+                                "TG_CHAT_BURST": "1000"})
+class TelegramSenderTest(unittest.IsolatedAsyncioTestCase):
+    def make_sender(self, **errors) -> TelegramSender:
+        self.bot = FakeBot({int(chat_id[1:]): list(chat_errors)
+                            for chat_id, chat_errors in errors.items()})
+        return TelegramSender(self.bot)
+
+    async def test_short_messages_are_merged(self):
+        sender = self.make_sender()
+        delivered = []
+        for number in range(3):
+            sender.send(1, f"m{number}", lambda n=number: delivered.append(n))
+        await sender.close()
+        self.assertEqual(self.bot.texts(1), ["m0\nm1\nm2"])
+        self.assertEqual(delivered, [0, 1, 2])
+        self.assertEqual(sender.pending, 0)
+
+    async def test_long_messages_are_not_merged(self):
+        sender = self.make_sender()
+        long_text = "x" * (TelegramSender.SHORT_MESSAGE + 1)
+        for text in ("a", long_text, "b", "c"):
+            sender.send(1, text)
+        await sender.close()
+        self.assertEqual(self.bot.texts(1), ["a", long_text, "b\nc"])
+
+    async def test_merging_stops_once_the_text_is_long(self):
+        sender = self.make_sender()
+        text = "x" * TelegramSender.SHORT_MESSAGE
+        for _ in range(9):
+            sender.send(1, text)
+        await sender.close()
+        self.assertEqual([len(text) for text in self.bot.texts(1)],
+                         [2 * 512 + 1] * 4 + [512])
+
+    async def test_chats_are_not_merged(self):
+        sender = self.make_sender()
+        sender.send(1, "a")
+        sender.send(2, "b")
+        await sender.close()
+        self.assertEqual(self.bot.texts(1), ["a"])
+        self.assertEqual(self.bot.texts(2), ["b"])
+
+    async def test_retry_after_pauses_only_its_chat(self):
+        sender = self.make_sender(c1=[retry_after(1)])
+        delivered = []
+        sender.send(1, "a", lambda: delivered.append(1))
+        await asyncio.sleep(0.1)
+        sender.send(2, "b", lambda: delivered.append(2))
+        await sender.close()
+        self.assertEqual(delivered, [2, 1])
+        [(_, text, sent)] = [row for row in self.bot.sent if row[0] == 1]
+        self.assertEqual(text, "a")
+        # Sent once, after the pause
+        self.assertGreaterEqual(sent - self.bot.sent[0][2], 0.8)
+
+    async def test_rejected_message_is_dropped(self):
+        sender = self.make_sender(c1=[rejected(TelegramBadRequest)])
+        delivered = []
+        sender.send(1, "x" * 1000, lambda: delivered.append("bad"))
+        sender.send(1, "y" * 1000, lambda: delivered.append("good"))
+        await sender.close()
+        self.assertEqual(self.bot.texts(1), ["y" * 1000])
+        self.assertEqual(delivered, ["good"])
+
+    async def test_blocked_chat_drops_its_queue(self):
+        sender = self.make_sender(c1=[rejected(TelegramForbiddenError)])
+        sender.send(1, "x" * 1000)
+        sender.send(1, "y" * 1000)
+        await sender.close()
+        self.assertEqual(self.bot.sent, [])
+        self.assertEqual(sender.pending, 0)
+        # The next message starts a new queue
+        sender.send(1, "z")
+        await sender.close()
+        self.assertEqual(self.bot.texts(1), ["z"])